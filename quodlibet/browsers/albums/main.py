@@ -320,6 +320,7 @@ class VisibleUpdate:
             self.__update_visible_rows, timeout=50, priority=GLib.PRIORITY_LOW)
         self.__column = column
         self.__first_expose = True
+        self.__visible_range = None
 
     def disable_row_update(self):
         if self.__update_deferred:
@@ -342,6 +343,55 @@ class VisibleUpdate:
 
         raise NotImplementedError
 
+    def _visible_range_changed(self):
+        """Called after scrolling, before the newly visible rows get
+        updated.
+
+        Reprioritizes the pending cover loads, tagged with (item, view_ref)
+        and cancelled through `self._cover_cancel`. Items which are too far
+        away by now get marked as not scanned, to get loaded again once
+        they come close.
+        """
+
+        def get_priority(tag):
+            item, view_ref = tag
+            path = view_ref.get_path()
+            priority = None
+            if path is not None:
+                priority = self._get_row_priority(path)
+            if priority is None:
+                # scrolled away or filtered out, retry once visible again
+                item.scanned = False
+            return priority
+
+        app.cover_manager.loader.reprioritize(
+            self._cover_cancel, get_priority)
+
+    def _get_row_priority(self, path):
+        """Returns how many rows the path is away from the visible area,
+        or None if it's too far away to still be worth updating.
+        """
+
+        if self.__visible_range is None:
+            return 0
+        start, end = self.__visible_range
+        index = path.get_indices()[0]
+        distance = max(start - index, index - end, 0)
+        if distance > 2 * self.PRELOAD_COUNT:
+            return None
+        return distance
+
+    def _get_cover_load(self, model, iter_):
+        """Returns (priority, view_ref) for loading the cover of a row of
+        the view model, or None if it's too far away to still be worth it.
+        """
+
+        path = model.get_path(iter_)
+        priority = self._get_row_priority(path)
+        if priority is None:
+            return None
+        return priority, Gtk.TreeRowReference.new(model, path)
+
     def __stop_update(self, adj, view):
         if self.__pending_paths:
             copool.remove(self.__scan_paths)
@@ -386,8 +436,14 @@ class VisibleUpdate:
         if not start or not end:
             return
 
-        start = start.get_indices()[0] - preload - 1
-        end = end.get_indices()[0] + preload
+        start = start.get_indices()[0]
+        end = end.get_indices()[0]
+        if self.__visible_range != (start, end):
+            self.__visible_range = (start, end)
+            self._visible_range_changed()
+
+        start = start - preload - 1
+        end = end + preload
 
         vlist = list(range(end, start, -1))
         top = vlist[:len(vlist) // 2]
@@ -633,6 +689,12 @@ class AlbumList(Browser, util.InstanceTracker, VisibleUpdate,
         return item.album is not None and not item.scanned
 
     def _update_row(self, filter_model, iter_):
+        cover_load = self._get_cover_load(filter_model, iter_)
+        if cover_load is None:
+            # too far away by now, gets scanned once it's close again
+            return
+        priority, view_ref = cover_load
+
         sort_model = filter_model.get_model()
         model = sort_model.get_model()
         iter_ = filter_model.convert_iter_to_child_iter(iter_)
@@ -648,7 +710,9 @@ class AlbumList(Browser, util.InstanceTracker, VisibleUpdate,
         scale_factor = self.get_scale_factor()
         item.scan_cover(scale_factor=scale_factor,
                         callback=callback,
-                        cancel=self._cover_cancel)
+                        cancel=self._cover_cancel,
+                        priority=priority,
+                        tag=(item, view_ref))
 
     def __destroy(self, browser):
         self._cover_cancel.cancel()
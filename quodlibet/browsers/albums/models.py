@@ -28,7 +28,7 @@ class AlbumItem:
         return size
 
     def scan_cover(self, force=False, scale_factor=1,
-            callback=None, cancel=None):
+            callback=None, cancel=None, priority=0, tag=None):
         if (self.scanned and not force) or not self.album or \
                 not self.album.songs:
             return
@@ -40,7 +40,7 @@ class AlbumItem:
 
         s = self.COVER_SIZE * scale_factor
         app.cover_manager.get_pixbuf_many_async(
-            self.album.songs, s, s, cancel, set_cover_cb)
+            self.album.songs, s, s, cancel, set_cover_cb, priority, tag)
 
     def __repr__(self):
         return repr(self.album)
@@ -376,6 +376,12 @@ class CoverGrid(Browser, util.InstanceTracker, VisibleUpdate,
         return item.album is not None and not item.scanned
 
     def _update_row(self, filter_model, iter_):
+        cover_load = self._get_cover_load(filter_model, iter_)
+        if cover_load is None:
+            # too far away by now, gets scanned once it's close again
+            return
+        priority, view_ref = cover_load
+
         sort_model = filter_model.get_model()
         model = sort_model.get_model()
         iter_ = filter_model.convert_iter_to_child_iter(iter_)
@@ -394,7 +400,9 @@ class CoverGrid(Browser, util.InstanceTracker, VisibleUpdate,
         scale_factor = self.get_scale_factor() * mag
         item.scan_cover(scale_factor=scale_factor,
                         callback=callback,
-                        cancel=self._cover_cancel)
+                        cancel=self._cover_cancel,
+                        priority=priority,
+                        tag=(item, view_ref))
 
     def __destroy(self, browser):
         self._cover_cancel.cancel()
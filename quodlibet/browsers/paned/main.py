@@ -25,6 +25,8 @@ from quodlibet.qltk.searchbar import SearchBarBox
 from quodlibet.qltk.x import ScrolledWindow, Align
 from quodlibet.util.library import background_filter
 from quodlibet.util import connect_destroy
+from quodlibet.util.thread import call_async, Cancellable, \
+    cancellable_iter
 from quodlibet.qltk.paned import ConfigMultiRHPaned
 
 from .prefs import PreferencesButton, ColumnMode
@@ -43,6 +45,10 @@ class PanedBrowser(Browser, util.InstanceTracker):
     keys = ["Paned", "PanedBrowser"]
     priority = 3
 
+    ASYNC_FILL_SIZE = 5000
+    """Libraries with at least this many songs get filtered and grouped in
+    a thread, so the UI doesn't block while the panes get filled."""
+
     def pack(self, songpane):
         container = Gtk.HBox()
         self.show()
@@ -71,6 +77,9 @@ class PanedBrowser(Browser, util.InstanceTracker):
 
         self._filter = lambda s: False
         self._library = library
+        self.__cancellable = None
+        # (handler, {song: None}) library changes to apply after a fill
+        self.__pending = []
 
         self.set_spacing(6)
         self.set_orientation(Gtk.Orientation.VERTICAL)
@@ -114,6 +123,7 @@ class PanedBrowser(Browser, util.InstanceTracker):
             child.show_all()
 
     def __destroy(self, *args):
+        self.__cancel_fill()
         del self._sb_box
 
     def set_column_mode(self, mode):
@@ -164,18 +174,51 @@ class PanedBrowser(Browser, util.InstanceTracker):
         self._panes[-1].uninhibit()
         self._panes[-1].get_selection().emit('changed')
 
+    def __is_filling(self):
+        return self.__cancellable is not None or \
+            any(pane.is_filling for pane in self._panes)
+
+    def __queue_change(self, handler, songs):
+        """Remembers library changes arriving while a fill is pending, as
+        its results won't include them. Consecutive changes of the same
+        kind get merged.
+        """
+
+        pending = self.__pending
+        if pending and pending[-1][0] == handler:
+            pending[-1][1].update(dict.fromkeys(songs))
+        else:
+            pending.append((handler, dict.fromkeys(songs)))
+
+    def __apply_pending(self):
+        pending, self.__pending = self.__pending, []
+        for handler, songs in pending:
+            handler(self._library, list(songs))
+
     def __added(self, library, songs):
+        if self.__is_filling():
+            self.__queue_change(self.__added, songs)
+            return
+        self.__apply_pending()
         songs = list(filter(self._filter, songs))
         for pane in self._panes:
             pane.add(songs)
             songs = list(filter(pane.matches, songs))
 
     def __removed(self, library, songs, remove_if_empty=True):
+        if self.__is_filling():
+            self.__queue_change(self.__removed, songs)
+            return
+        self.__apply_pending()
         songs = list(filter(self._filter, songs))
         for pane in self._panes:
             pane.remove(songs, remove_if_empty)
 
     def __changed(self, library, songs):
+        if self.__is_filling():
+            self.__queue_change(self.__changed, songs)
+            return
+        self.__apply_pending()
         self.__removed(library, songs, False)
         self.__added(library, songs)
         self.__removed(library, [])
@@ -193,16 +236,46 @@ class PanedBrowser(Browser, util.InstanceTracker):
         return True
 
     def activate(self):
+        self.__activate(len(self._library) >= self.ASYNC_FILL_SIZE)
+
+    def __activate(self, in_thread):
         star = dict.fromkeys(SongList.star)
         star.update(self.__star)
         query = self._sb_box.get_query(star.keys())
-        if query.is_parsable:
-            self._filter = query.search
-            songs = list(filter(self._filter, self._library))
-            bg = background_filter()
+        if not query.is_parsable:
+            return
+
+        self.__cancel_fill()
+        # the new fill starts from the current library
+        self.__pending = []
+        self._filter = query.search
+        bg = background_filter()
+
+        def filter_songs(songs):
+            songs = filter(query.search, songs)
             if bg:
-                songs = list(filter(bg, songs))
-            self._panes[0].fill(songs)
+                songs = filter(bg, songs)
+            return list(songs)
+
+        if not in_thread:
+            self._panes[0].fill(filter_songs(self._library))
+            return
+
+        cancellable = self.__cancellable = Cancellable()
+
+        def done(songs):
+            self.__cancellable = None
+            self._panes[0].fill_async(songs)
+
+        songs = cancellable_iter(list(self._library), cancellable)
+        call_async(filter_songs, cancellable, done, args=(songs,))
+
+    def __cancel_fill(self):
+        if self.__cancellable is not None:
+            self.__cancellable.cancel()
+            self.__cancellable = None
+        for pane in self._panes:
+            pane.cancel_fill()
 
     def scroll(self, song):
         for pane in self._panes:
@@ -243,7 +316,7 @@ class PanedBrowser(Browser, util.InstanceTracker):
 
     def fill_panes(self):
         self._panes[-1].inhibit()
-        self.activate()
+        self.__activate(False)
         self._panes[-1].uninhibit()
 
     def make_pane_widths_equal(self):
@@ -326,3 +399,6 @@ class PanedBrowser(Browser, util.InstanceTracker):
 
     def fill(self, songs):
         GLib.idle_add(self.songs_selected, list(songs))
+        # the last pane is done, catch up with the changes since
+        if self.__pending and not self.__is_filling():
+            self.__apply_pending()
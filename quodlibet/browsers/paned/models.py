@@ -6,6 +6,7 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
+import bisect
 import re
 from typing import Tuple, Text
 from quodlibet.browsers.paned.util import PaneConfig
@@ -14,6 +15,7 @@ from quodlibet import _
 from quodlibet import util
 from quodlibet.qltk.models import ObjectStore
 from quodlibet.util.collection import Collection
+from quodlibet.util.thread import cancellable_iter
 
 
 class BaseEntry(Collection):
@@ -122,27 +124,45 @@ class PaneModel(ObjectStore):
         self.__sort_cache = {} # text to sort text cache
         self.__key_cache = {} # song to key cache
         self.config = pattern_config
+        self.__reset()
+
+    def __reset(self):
+        # key to entry and row, the unknown entry has the key ""
+        self.__entries = {}
+        self.__iters = {}
+        # (sort, key) of all SongsEntry rows except unknown, in model order
+        self.__sorted = []
+        # keys of entries which got empty but weren't removed yet
+        self.__empty = set()
+
+    def clear(self):
+        super().clear()
+        self.__reset()
 
     def get_format_keys(self, song):
         try:
             return self.__key_cache[song]
         except KeyError:
-            # We filter out empty values, so Unknown can be ""
-            self.__key_cache[song] = list(filter(
-                lambda v: v[0], self.config.format(song)))
+            self.__key_cache[song] = self.__format_keys(song)
             return self.__key_cache[song]
 
-    def __human_sort_key(self, text, reg=re.compile('<.*?>')):
+    def __format_keys(self, song):
+        # We filter out empty values, so Unknown can be ""
+        return list(filter(lambda v: v[0], self.config.format(song)))
+
+    def __human_sort_key(self, text, cache=None, reg=re.compile('<.*?>')):
+        if cache is None:
+            cache = self.__sort_cache
         try:
-            return self.__sort_cache[text], text
+            return cache[text], text
         except KeyError:
             # remove the markup so it doesn't affect the sort order
             if self.config.has_markup:
                 text_stripped = reg.sub("", text)
             else:
                 text_stripped = text
-            self.__sort_cache[text] = util.human_sort_key(text_stripped)
-            return self.__sort_cache[text], text
+            cache[text] = util.human_sort_key(text_stripped)
+            return cache[text], text
 
     def get_songs(self, paths):
         """Get all songs for the given paths (from a selection e.g.)"""
@@ -153,7 +173,7 @@ class PaneModel(ObjectStore):
 
         first_path = paths[0]
         if isinstance(self[first_path][0], AllEntry):
-            for entry in self.itervalues():
+            for entry in self.__entries.values():
                 s.update(entry.songs)
         else:
             for path in paths:
@@ -164,55 +184,72 @@ class PaneModel(ObjectStore):
     def get_keys(self, paths):
         return {self[p][0].key for p in paths}
 
+    def __has_all(self):
+        return bool(len(self)) and isinstance(self[0][0], AllEntry)
+
+    def __changed_entries(self, keys):
+        for key in keys:
+            self.__entries[key].finalize()
+            iter_ = self.__iters[key]
+            self.row_changed(self.get_path(iter_), iter_)
+
+    def __remove_entry(self, key):
+        entry = self.__entries.pop(key)
+        self.remove(self.__iters.pop(key))
+        if not isinstance(entry, UnknownEntry):
+            item = (entry.sort, key)
+            del self.__sorted[bisect.bisect_left(self.__sorted, item)]
+        try:
+            del self.__sort_cache[key]
+        except KeyError:
+            pass
+
     def remove_songs(self, songs, remove_if_empty):
         """Remove all songs from the entries.
 
         If remove_if_empty == True, entries with no songs will be removed.
         """
 
-        songs = set(songs)
-
-        for song in songs:
-            if song in self.__key_cache:
-                del self.__key_cache[song]
-
-        to_remove = []
-        for iter_, entry in self.iterrows():
-            if isinstance(entry, AllEntry):
+        touched = set()
+        entries = self.__entries
+        for song in set(songs):
+            try:
+                keys = self.__key_cache.pop(song)
+            except KeyError:
+                # not in the model
                 continue
-            entry.songs -= songs
-            entry.finalize()
-            self.row_changed(self.get_path(iter_), iter_)
-            if not entry.songs:
-                to_remove.append(iter_)
+            for key in ([k for k, s in keys] or [""]):
+                entry = entries.get(key)
+                if entry is not None and song in entry.songs:
+                    entry.songs.discard(song)
+                    touched.add(key)
+
+        self.__changed_entries(touched)
+        self.__empty.update(k for k in touched if not entries[k].songs)
 
         if not remove_if_empty:
             return
 
         # remove from cache and the model
-        for iter_ in to_remove:
-            try:
-                key = self.get_value(iter_).key
-                del(self.__sort_cache[key])
-            except KeyError:
-                pass
-            self.remove(iter_)
+        to_remove = [k for k in self.__empty
+                     if k in entries and not entries[k].songs]
+        self.__empty.clear()
+        for key in to_remove:
+            self.__remove_entry(key)
 
         if len(self) == 1 and isinstance(self[0][0], AllEntry):
             # only All is left.. clear everything
             self.clear()
-        elif to_remove and len(self) == 2:
+        elif to_remove and len(self) == 2 and self.__has_all():
             # Only one entry + All -> remove All
             self.remove(self.get_iter_first())
 
-    def add_songs(self, songs):
-        """Add new songs to the list, creating new rows"""
-
+    @staticmethod
+    def __group(songs, get_keys, human_sort):
         collection = {}
         unknown = UnknownEntry()
-        human_sort = self.__human_sort_key
         for song in songs:
-            items = self.get_format_keys(song)
+            items = get_keys(song)
             if not items:
                 unknown.songs.add(song)
             for key, sort in items:
@@ -227,74 +264,102 @@ class PaneModel(ObjectStore):
                     entry = SongsEntry(key, hsort)
                     collection[key] = (entry, hsort, bool(sort))
                     entry.songs.add(song)
+        return collection, unknown
 
-        items = sorted(collection.items(),
-                       key=lambda s: s[1][1],
-                       reverse=True)
+    @staticmethod
+    def __sort_entries(collection):
+        return sorted((sort_key, key, entry) for key, (
+            entry, sort_key, srtp) in collection.items())
 
-        # fast path
-        if not len(self):
-            if unknown.songs:
-                self.insert(0, [unknown])
-            entries = []
-            for key, (val, sort_key, srtp) in items:
-                entries.append(val)
-            self.insert_many(0, reversed(entries))
-            if len(self) > 1:
-                self.insert(0, [AllEntry()])
-            return
+    def __append_sorted(self, items, unknown):
+        rows = [entry for sort_key, key, entry in items]
+        if unknown.songs:
+            rows.append(unknown)
+        if len(rows) > 1:
+            rows.insert(0, AllEntry())
+        for entry, iter_ in zip(rows, self.iter_append_many(rows)):
+            if isinstance(entry, SongsEntry):
+                self.__entries[entry.key] = entry
+                self.__iters[entry.key] = iter_
+        self.__sorted = [(sort_key, key) for sort_key, key, e in items]
 
-        # insert all new songs
-        key = None
-        val = None
-        sort_key = None
+    def group_songs(self, songs, cancellable=None):
+        """Groups the songs into new entries, sorted like the rows would be.
 
-        for iter_, entry in self.iterrows():
-            if not isinstance(entry, SongsEntry):
-                continue
+        Doesn't touch the model or its caches, so it can be called from a
+        thread. Pass the result to set_groups() in the main thread.
+        Returns None early if `cancellable` gets cancelled.
+        """
+
+        if cancellable is not None:
+            songs = cancellable_iter(songs, cancellable)
+        sort_cache = {}
+        key_cache = {}
+
+        def get_keys(song):
+            keys = key_cache[song] = self.__format_keys(song)
+            return keys
+
+        def human_sort(text):
+            return self.__human_sort_key(text, sort_cache)
+
+        collection, unknown = self.__group(songs, get_keys, human_sort)
+        if cancellable is not None and cancellable.is_cancelled():
+            return None
+        return key_cache, self.__sort_entries(collection), unknown
+
+    def set_groups(self, groups):
+        """Replaces all rows with the result of group_songs()"""
 
-            if key is None:
-                if not items:
-                    break
-                key, (val, sort_key, srtp) = items.pop(-1)
+        key_cache, items, unknown = groups
+        self.clear()
+        self.__key_cache.update(key_cache)
+        self.__append_sorted(items, unknown)
 
-            if key == entry.key: # Display strings the same
+    def add_songs(self, songs):
+        """Add new songs to the list, creating new rows"""
+
+        collection, unknown = self.__group(
+            songs, self.get_format_keys, self.__human_sort_key)
+
+        # fast path
+        if not len(self):
+            self.__append_sorted(self.__sort_entries(collection), unknown)
+            return
+
+        # merge into existing entries, insert the new ones at their
+        # sort position
+        changed = []
+        offset = int(self.__has_all())
+        for key, (val, sort_key, srtp) in collection.items():
+            entry = self.__entries.get(key)
+            if entry is not None:
                 entry.songs |= val.songs
-                entry.finalize()
-                self.row_changed(self.get_path(iter_), iter_)
-                key = None
-            elif sort_key < entry.sort:
-                self.insert_before(iter_, row=[val])
-                key = None
-
-        # the last one failed, add it again
-        if key:
-            items.append((key, (val, sort_key, srtp)))
-
-        # insert the left over songs
-        if items:
-            entries = []
-            for key, (val, srt, srtp) in items:
-                entries.append(val)
-            if isinstance(self[-1][0], UnknownEntry):
-                self.insert_many(len(self) - 1, entries)
-            else:
-                self.append_many(entries)
+                changed.append(key)
+                continue
+            item = (sort_key, key)
+            index = bisect.bisect_right(self.__sorted, item)
+            self.__sorted.insert(index, item)
+            self.__entries[key] = val
+            self.__iters[key] = self.insert(index + offset, row=[val])
 
         # check if All needs to be inserted
-        if len(self) > 1 and not isinstance(self[0][0], AllEntry):
+        if len(self) > 1 and not offset:
             self.insert(0, [AllEntry()])
 
         # check if Unknown needs to be inserted or updated
         if unknown.songs:
-            last_row = self[-1]
-            entry = last_row[0]
-            if isinstance(entry, UnknownEntry):
+            entry = self.__entries.get("")
+            if entry is not None:
                 entry.songs |= unknown.songs
-                entry.finalize()
-                self.row_changed(last_row.path, last_row.iter)
+                changed.append("")
             else:
-                self.append(row=[unknown])
+                self.__entries[""] = unknown
+                self.__iters[""] = self.append(row=[unknown])
+                if len(self) == 2:
+                    self.insert(0, [AllEntry()])
+
+        self.__changed_entries(changed)
 
     def matches(self, paths, song):
         """If the song is included in the selection defined by the paths.
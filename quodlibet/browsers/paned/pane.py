@@ -16,6 +16,7 @@ from quodlibet.qltk.properties import SongProperties
 from quodlibet.qltk.information import Information
 from quodlibet.qltk import is_accel
 from quodlibet.util import connect_obj
+from quodlibet.util.thread import call_async, Cancellable
 
 from .models import PaneModel
 from .util import PaneConfig
@@ -36,6 +37,7 @@ class Pane(AllTreeView):
         self.__restore_values = None
 
         self.__no_fill = 0
+        self.__cancellable = None
 
         column = TreeViewColumnButton(title=self.config.title)
 
@@ -175,6 +177,7 @@ class Pane(AllTreeView):
         return self.config.tags
 
     def __destroy(self, *args):
+        self.cancel_fill()
         # needed for gc
         self.__next = None
 
@@ -229,7 +232,40 @@ class Pane(AllTreeView):
         self.handler_unblock(self.__sig)
         self.__no_fill -= 1
 
+    @property
+    def is_filling(self):
+        """If a fill_async() is pending"""
+
+        return self.__cancellable is not None
+
+    def cancel_fill(self):
+        """Cancels a pending fill_async()"""
+
+        if self.__cancellable is not None:
+            self.__cancellable.cancel()
+            self.__cancellable = None
+
     def fill(self, songs):
+        self.cancel_fill()
+        self.__fill(lambda model: model.add_songs(songs))
+
+    def fill_async(self, songs):
+        """Like fill(), but groups the songs in a thread and only replaces
+        the rows in the main thread. Following panes get filled the same
+        way, cancel_fill() or any other fill stops it.
+        """
+
+        self.cancel_fill()
+        cancellable = self.__cancellable = Cancellable()
+
+        def done(groups):
+            self.__cancellable = None
+            self.__fill(lambda model: model.set_groups(groups), cascade=True)
+
+        call_async(self.get_model().group_songs, cancellable, done,
+                   args=(list(songs), cancellable))
+
+    def __fill(self, fill_model, cascade=False):
         # Restore the selection
         if self.__restore_values is not None:
             selected = self.__restore_values
@@ -245,13 +281,17 @@ class Pane(AllTreeView):
         self.inhibit()
         with self.without_model():
             model.clear()
-            model.add_songs(songs)
+            fill_model(model)
 
         self.set_selected(selected, jump=True)
         self.uninhibit()
 
         if self.__next and self.__no_fill == 0:
-            self.__next.fill(self.__get_selected_songs())
+            songs = self.__get_selected_songs()
+            if cascade and isinstance(self.__next, Pane):
+                self.__next.fill_async(songs)
+            else:
+                self.__next.fill(songs)
 
     def scroll(self, song):
         """Select and scroll to entry which contains song"""
@@ -14,7 +14,7 @@ from quodlibet import print_d
 from quodlibet.formats import AudioFile
 from quodlibet.query import Query, QueryType
 from quodlibet.query._match import Tag, Inter, Union, Numcmp, NumexprTag, \
-    Numexpr, True_, False_
+    Numexpr, True_, False_, FoldedText
 
 
 INVERSE_OPS = {operator.le: operator.gt,
@@ -128,6 +128,9 @@ class SoundcloudQuery(Query):
             raise self.Error("Unsupported numeric: %s" % node)
         elif hasattr(node, 'pattern'):
             return terms_from_re(node.pattern, tag)
+        elif isinstance(node, FoldedText):
+            api_tag, text = to_api(tag, node.text)
+            return {(api_tag, text)} if api_tag else set()
         elif isinstance(node, True_):
             return set()
         elif isinstance(node, False_):
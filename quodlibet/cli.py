@@ -142,6 +142,13 @@ def process_arguments(argv):
             _("filename"), _("filename"))),
         ("print-query", _("Print filenames of results of query to stdout"),
             _("query")),
+        ("print-query-limit",
+            _("Print at most this many results of --print-query"), "N"),
+        ("print-query-offset",
+            _("Skip this many results of --print-query"), "N"),
+        ("print-query-format",
+            _("Print results of --print-query using a pattern instead of "
+              "the filename"), _("pattern")),
         ("unqueue", _("Unqueue a file or query"), "%s|%s" % (
             C_("command", "filename"), _("query"))),
         ("add-location", _("Add a file or directory to the library"),
@@ -263,9 +270,28 @@ def process_arguments(argv):
             except IndexError:
                 queue("print-playing")
         elif command == "print-query":
+            for key in ["limit", "offset", "format"]:
+                value = opts.get("print-query-" + key)
+                if value is None:
+                    continue
+                if key != "format" and not value.isdigit():
+                    print_e(_("Invalid argument for '%s'.") %
+                            ("print-query-" + key))
+                    print_e(_("Try %s --help.") % fsn2text(argv[0]))
+                    exit_(True, notify_startup=True)
+                # options follow the query, one per line
+                arg += "\n%s=%s" % (key, value)
             queue(command, arg)
         elif command == "print-query-text":
             queue(command)
+        elif command in ("print-query-limit", "print-query-offset",
+                         "print-query-format"):
+            # handled together with print-query
+            if "print-query" not in opts:
+                print_e(_("'%(option)s' requires '%(required)s'.") % {
+                    "option": command, "required": "print-query"})
+                print_e(_("Try %s --help.") % fsn2text(argv[0]))
+                exit_(True, notify_startup=True)
         elif command == "start-playing":
             actions.append(command)
         elif command == "start-hidden":
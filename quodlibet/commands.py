@@ -8,6 +8,7 @@
 # (at your option) any later version.
 
 import os
+from collections.abc import Iterator
 
 from senf import uri2fsn, fsnative, fsn2text, text2fsn
 
@@ -42,7 +43,9 @@ class CommandRegistry:
         """Register a new command function
 
         The functions gets zero or more arguments as `fsnative`
-        and should return `None` or `fsnative`. In case an error
+        and should return `None` or `fsnative`. Commands with large
+        responses can return an iterator of `fsnative` chunks instead,
+        which gets consumed while the response is sent. In case an error
         occurred the command should raise `CommandError`.
 
         Args:
@@ -68,7 +71,7 @@ class CommandRegistry:
             app (Application)
             line (fsnative)
         Returns:
-            fsnative or None
+            fsnative, Iterator[fsnative] or None
         """
 
         assert isinstance(line, fsnative)
@@ -110,7 +113,8 @@ class CommandRegistry:
         except CommandError as e:
             raise CommandError("%s: %s" % (name, str(e)))
         else:
-            if result is not None and not isinstance(result, fsnative):
+            if result is not None and \
+                    not isinstance(result, (fsnative, Iterator)):
                 raise CommandError(
                     "%s: returned %r which is not fsnative" % (name, result))
             return result
@@ -524,15 +528,84 @@ def _refresh(app):
     scan_library(app.library, False)
 
 
+QUERY_CHUNK_SIZE = 1000
+"""Number of songs searched for each chunk of the print-query output"""
+
+
+def _parse_query_arg(arg):
+    """Splits the print-query argument into the query and the options.
+
+    The query can be followed by lines of "limit=N", "offset=N" and
+    "format=PATTERN".
+    """
+
+    lines = arg2text(arg).split(u"\n")
+    query, options = lines[0], {}
+    for line in lines[1:]:
+        key, sep, value = line.partition(u"=")
+        if not sep or key not in ("limit", "offset", "format"):
+            raise CommandError("Invalid option %r" % line)
+        if key in ("limit", "offset"):
+            try:
+                value = int(value)
+                if value < 0:
+                    raise ValueError
+            except ValueError:
+                raise CommandError("Invalid %s %r" % (key, value))
+        options[key] = value
+    return query, options
+
+
+def _iter_query_chunks(songs, query, offset=0, limit=None, pattern=None):
+    """Yields the matching songs of `songs` as lines of text, one chunk
+    every QUERY_CHUNK_SIZE searched songs.
+    """
+
+    if pattern is not None:
+        format_song = lambda s: text2fsn(pattern.format(s))
+    else:
+        format_song = lambda s: s("~filename")
+
+    newline = fsnative(u"\n")
+    remaining = limit
+    for start in range(0, len(songs), QUERY_CHUNK_SIZE):
+        if remaining == 0:
+            return
+        lines = []
+        for song in songs[start:start + QUERY_CHUNK_SIZE]:
+            if query is not None and not query.search(song):
+                continue
+            if offset:
+                offset -= 1
+                continue
+            lines.append(format_song(song) + newline)
+            if remaining is not None:
+                remaining -= 1
+                if not remaining:
+                    break
+        yield fsnative().join(lines)
+
+
 @registry.register("print-query", args=1)
 def _print_query(app, query):
     """Queries library, dumping filenames of matches to stdout
     See Issue 716
+
+    The results get sent in chunks while the library is searched.
+    Supports "limit", "offset" and "format" options, see _parse_query_arg().
     """
 
-    query = arg2text(query)
-    songs = app.library.query(query)
-    return "\n".join([song("~filename") for song in songs]) + "\n"
+    from quodlibet.pattern import Pattern
+    from quodlibet.query import Query
+
+    text, options = _parse_query_arg(query)
+    query = Query(text) if text else None
+    pattern = options.get("format")
+    if pattern is not None:
+        pattern = Pattern(pattern)
+    songs = list(app.library.values())
+    return _iter_query_chunks(songs, query, options.get("offset", 0),
+                              options.get("limit"), pattern)
 
 
 @registry.register("print-query-text")
@@ -53,6 +53,12 @@ INITIAL: Dict[str, Dict[str, str]] = {
     "library": {
         "exclude": "",
         "refresh_on_start": "true",
+
+        # processes used for loading new files, 0 means one per CPU
+        "scan_processes": "0",
+
+        # keep the library up to date by watching the scan directories
+        "watch": "false",
     },
 
     # State about the player, to restore on startup
@@ -127,6 +133,10 @@ INITIAL: Dict[str, Dict[str, str]] = {
         # characters ignored in queries
         "ignored_characters": "",
 
+        # match plain text in queries against cached, case and diacritic
+        # folded tag values instead of using diacritic insensitive regexes
+        "folded_search": "false",
+
         # album list
         "albums": "",
 
@@ -0,0 +1,391 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+"""Library indexes and playlist tracking for the MPD database commands.
+
+Everything gets built lazily on first use and is kept up to date through
+the library and model signals, so requests don't have to go through the
+whole library.
+"""
+
+import os
+from itertools import islice
+
+from senf import fsn2text
+
+from quodlibet.util.library import get_scan_dirs
+
+
+def get_tag_values(song, ql_key):
+    """All values of a tag as text"""
+
+    return [v if isinstance(v, str) else fsn2text(v)
+            for v in song.list(ql_key)]
+
+
+class MPDDatabase:
+    """Indexes the songs of a library by URI, directory and tag values"""
+
+    def __init__(self, library, tag_mapping):
+        """tag_mapping -- list of (MPD tag, QL tag) pairs"""
+
+        self._library = library
+        self._tag_keys = {mpd.lower(): ql for mpd, ql in tag_mapping}
+
+        roots = [os.path.join(p, "") for p in get_scan_dirs()]
+        self._roots = sorted(roots, key=len, reverse=True)
+
+        # lower case MPD tag -> ({value: {song}}, {song: [value]})
+        self._tags = {}
+        # song -> uri
+        self._song_uris = {}
+        # uri -> song
+        self._uris = None
+        # directory uri -> ({sub directory uri}, {song})
+        self._dirs = None
+        self._playtime = None
+
+        self._sigs = [
+            library.connect("added", self.__added),
+            library.connect("removed", self.__removed),
+            library.connect("changed", self.__changed),
+        ]
+
+    def destroy(self):
+        for sig in self._sigs:
+            self._library.disconnect(sig)
+        self._sigs = []
+        self._tags.clear()
+        self._uris = self._dirs = None
+
+    def has_tag(self, tag):
+        return tag.lower() in self._tag_keys
+
+    def get_uri(self, song):
+        """The path of the song relative to the library directory it's in,
+        or the absolute path without the leading separator.
+        """
+
+        uri = self._song_uris.get(song)
+        if uri is None:
+            path = fsn2text(song("~filename"))
+            for root in self._roots:
+                if path.startswith(root):
+                    uri = path[len(root):]
+                    break
+            else:
+                uri = path.lstrip(os.sep)
+            uri = uri.replace(os.sep, "/")
+            if song in self._library:
+                self._song_uris[song] = uri
+        return uri
+
+    def __len__(self):
+        return len(self._library)
+
+    def get_playtime(self):
+        """The length of all songs in seconds"""
+
+        if self._playtime is None:
+            self._playtime = sum(s("~#length", 0) for s in self._library)
+        return self._playtime
+
+    #  ------------ tag values  ------------
+
+    def _get_tag_index(self, tag):
+        tag = tag.lower()
+        index = self._tags.get(tag)
+        if index is None:
+            index = self._tags[tag] = ({}, {})
+            self._index_tag(tag, index, self._library)
+        return index[0]
+
+    def _index_tag(self, tag, index, songs):
+        ql_key = self._tag_keys[tag]
+        songs_by_value, song_values = index
+        for song in songs:
+            values = get_tag_values(song, ql_key)
+            song_values[song] = values
+            for value in values:
+                songs_by_value.setdefault(value, set()).add(song)
+
+    def _unindex_tag(self, tag, index, songs):
+        songs_by_value, song_values = index
+        for song in songs:
+            for value in song_values.pop(song, []):
+                value_songs = songs_by_value[value]
+                value_songs.discard(song)
+                if not value_songs:
+                    del songs_by_value[value]
+
+    def get_values(self, tag):
+        """All values of the tag in the library"""
+
+        return self._get_tag_index(tag).keys()
+
+    def get_songs(self, tag, value):
+        """All songs having the tag value"""
+
+        return self._get_tag_index(tag).get(value, set())
+
+    def _match(self, tag, value, exact):
+        if tag in ("any", "file", "base"):
+            if tag == "file":
+                if exact:
+                    song = self.get_song(value)
+                    return {song} if song is not None else set()
+                uris = self._get_uris()
+                value = value.lower()
+                return {s for u, s in uris.items() if value in u.lower()}
+            elif tag == "base":
+                try:
+                    return set(self.iter_songs(value))
+                except KeyError:
+                    return set()
+            songs = set()
+            for other in self._tag_keys:
+                songs |= self._match(other, value, exact)
+            return songs
+        elif not self.has_tag(tag):
+            return set()
+
+        if exact:
+            return set(self.get_songs(tag, value))
+        value = value.lower()
+        songs = set()
+        for tag_value, tag_songs in self._get_tag_index(tag).items():
+            if value in tag_value.lower():
+                songs |= tag_songs
+        return songs
+
+    def find(self, filters, exact=True):
+        """Returns all songs matching all (tag, value) filters, either
+        exactly (the "find" command) or by case insensitive substring
+        (the "search" command).
+        """
+
+        result = None
+        for tag, value in filters:
+            songs = self._match(tag.lower(), value, exact)
+            result = songs if result is None else result & songs
+            if not result:
+                return set()
+        if result is None:
+            return set(self._library)
+        return result
+
+    #  ------------ directories  ------------
+
+    def _get_uris(self):
+        if self._uris is None:
+            self._uris = {}
+            self._dirs = {"": (set(), set())}
+            self._add_dirs(self._library)
+        return self._uris
+
+    def _add_dirs(self, songs):
+        dirs = self._dirs
+        for song in songs:
+            uri = self.get_uri(song)
+            self._uris[uri] = song
+            parent, sep, name = uri.rpartition("/")
+            entry = dirs.get(parent)
+            if entry is not None:
+                entry[1].add(song)
+                continue
+            dirs[parent] = (set(), {song})
+            # add the missing parents
+            while parent:
+                child = parent
+                parent = parent.rpartition("/")[0]
+                entry = dirs.get(parent)
+                if entry is None:
+                    dirs[parent] = ({child}, set())
+                else:
+                    entry[0].add(child)
+                    break
+
+    def _remove_dirs(self, songs):
+        dirs = self._dirs
+        for song in songs:
+            uri = self._song_uris.pop(song, None)
+            if uri is None:
+                continue
+            if self._uris.get(uri) is song:
+                del self._uris[uri]
+            parent = uri.rpartition("/")[0]
+            dirs[parent][1].discard(song)
+            # remove empty directories
+            while parent and not any(dirs[parent]):
+                del dirs[parent]
+                child = parent
+                parent = parent.rpartition("/")[0]
+                dirs[parent][0].discard(child)
+
+    def get_song(self, uri):
+        """The song for the URI or None"""
+
+        return self._get_uris().get(uri)
+
+    def is_dir(self, uri):
+        self._get_uris()
+        return uri.strip("/") in self._dirs
+
+    def list_dir(self, uri):
+        """Returns (sorted sub directory URIs, sorted songs) or raises
+        KeyError.
+        """
+
+        self._get_uris()
+        dirs, songs = self._dirs[uri.strip("/")]
+        return sorted(dirs), sorted(songs, key=self.get_uri)
+
+    def iter_songs(self, uri):
+        """Yields all songs below the directory URI, sorted by URI"""
+
+        for uri, song in self.walk(uri):
+            if song is not None:
+                yield song
+
+    def walk(self, uri):
+        """Yields (directory URI, None) and (file URI, song) for everything
+        below the directory URI, depth first and sorted. Raises KeyError.
+
+        Sub directories get listed while walking, so the library can change
+        in between. Ones which are gone by then get skipped.
+        """
+
+        dirs, songs = self.list_dir(uri)
+        for song in songs:
+            yield self.get_uri(song), song
+        for sub in dirs:
+            yield sub, None
+            try:
+                yield from self.walk(sub)
+            except KeyError:
+                pass
+
+    #  ------------ library signals  ------------
+
+    def __added(self, library, songs):
+        self._playtime = None
+        for tag, index in self._tags.items():
+            self._index_tag(tag, index, songs)
+        if self._dirs is not None:
+            self._add_dirs(songs)
+
+    def __removed(self, library, songs):
+        self._playtime = None
+        for tag, index in self._tags.items():
+            self._unindex_tag(tag, index, songs)
+        if self._dirs is not None:
+            self._remove_dirs(songs)
+        for song in songs:
+            self._song_uris.pop(song, None)
+
+    def __changed(self, library, songs):
+        songs = [s for s in songs if s in library]
+        self.__removed(library, songs)
+        self.__added(library, songs)
+
+
+class MPDPlaylist:
+    """Tracks the changes of a song list model as MPD playlist versions.
+
+    Every change increases the version, and plchanges needs to know which
+    positions changed since a given version.
+    """
+
+    MAX_CHANGES = 1000
+    """Number of changes to remember, for older versions all positions are
+    reported as changed"""
+
+    def __init__(self, model, changed_cb):
+        """changed_cb -- called after each change"""
+
+        self._model = model
+        self._changed_cb = changed_cb
+        self.version = 1
+        # (version, start, end), end is None for changes shifting all
+        # following rows
+        self._changes = []
+        self._base_version = self.version
+
+        self._sigs = [
+            model.connect("row-inserted", self.__inserted),
+            model.connect("row-deleted", self.__deleted),
+            model.connect("rows-reordered", self.__reordered),
+            model.connect("row-changed", self.__row_changed),
+        ]
+
+    def destroy(self):
+        for sig in self._sigs:
+            self._model.disconnect(sig)
+        self._sigs = []
+        self._model = None
+
+    def __len__(self):
+        return len(self._model)
+
+    def get_songs(self, start=0, end=None):
+        """The songs between the positions start and end"""
+
+        return list(islice(self._model.itervalues(), start, end))
+
+    def get_position(self, song):
+        """The position of the song or None"""
+
+        iter_ = self._model.find(song)
+        if iter_ is None:
+            return None
+        return self._model.get_path(iter_).get_indices()[0]
+
+    def get_changes(self, version):
+        """Returns a sorted list of positions changed after `version`"""
+
+        length = len(self._model)
+        if version < self._base_version:
+            return list(range(length))
+
+        shifted = length
+        ranges = []
+        for change_version, start, end in reversed(self._changes):
+            if change_version <= version:
+                break
+            if end is None:
+                shifted = min(shifted, start)
+            else:
+                ranges.append((start, end))
+
+        positions = set(range(shifted, length))
+        for start, end in ranges:
+            positions.update(range(start, min(end, shifted)))
+        return sorted(positions)
+
+    def _changed(self, start, end=None):
+        self.version += 1
+        changes = self._changes
+        if end is None and changes and changes[-1][2] is None:
+            # merge with the previous change, it doesn't matter if some
+            # rows get reported as changed too often
+            start = min(start, changes[-1][1])
+            changes.pop()
+        changes.append((self.version, start, end))
+        if len(changes) > self.MAX_CHANGES:
+            self._base_version = changes.pop(0)[0]
+        self._changed_cb()
+
+    def __inserted(self, model, path, iter_):
+        self._changed(path.get_indices()[0])
+
+    def __deleted(self, model, path):
+        self._changed(path.get_indices()[0])
+
+    def __reordered(self, model, path, iter_, new_order):
+        self._changed(0)
+
+    def __row_changed(self, model, path, iter_):
+        index = path.get_indices()[0]
+        self._changed(index, index + 1)
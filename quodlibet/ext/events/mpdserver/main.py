@@ -7,12 +7,14 @@
 
 import re
 import shlex
+from collections import deque
 from typing import Dict, Tuple, Callable
 
 from senf import bytes2fsn, fsn2bytes
 
 from quodlibet import const
 from quodlibet.util import print_d, print_w
+from .database import MPDDatabase, MPDPlaylist, get_tag_values
 from .tcpserver import BaseTCPServer, BaseTCPConnection
 
 
@@ -127,12 +129,23 @@ class MPDService:
 
     version = (0, 17, 0)
 
-    def __init__(self, app, config):
+    def __init__(self, app, config, database=None):
+        """database -- a shared MPDDatabase, or None to create one"""
+
         self._app = app
         self._connections = set()
         self._idle_subscriptions = {}
         self._idle_queue = {}
-        self._pl_ver = 0
+
+        self._owns_database = database is None
+        if database is None:
+            database = MPDDatabase(app.library, TAG_MAPPING)
+        self._db = database
+
+        def playlist_changed():
+            self.emit_changed("playlist")
+
+        self._playlist = MPDPlaylist(app.window.playlist.pl, playlist_changed)
 
         self._config = config
         self._options = app.player_options
@@ -166,12 +179,7 @@ class MPDService:
         self._player_sigs.append(id_)
         id_ = app.player.connect("seek", player_changed)
         self._player_sigs.append(id_)
-
-        def playlist_changed(*args):
-            self._pl_ver += 1
-            self.emit_changed("playlist")
-
-        id_ = app.player.connect("song-started", playlist_changed)
+        id_ = app.player.connect("song-started", player_changed)
         self._player_sigs.append(id_)
 
     def _get_id(self, info):
@@ -183,6 +191,10 @@ class MPDService:
     def destroy(self):
         for id_ in self._player_sigs:
             self._app.player.disconnect(id_)
+        self._playlist.destroy()
+        if self._owns_database:
+            self._db.destroy()
+        del self._db
         del self._options
         del self._app
 
@@ -283,19 +295,24 @@ class MPDService:
         self._options.single = value
 
     def stats(self):
-        has_song = int(bool(self._app.player.info))
+        db = self._db
         stats = [
-            ("artists", has_song),
-            ("albums", has_song),
-            ("songs", has_song),
+            ("artists", len(db.get_values("artist"))),
+            ("albums", len(db.get_values("album"))),
+            ("songs", len(db)),
             ("uptime", 1),
             ("playtime", 1),
-            ("db_playtime", 1),
+            ("db_playtime", int(db.get_playtime())),
             ("db_update", 1252868674),
         ]
 
         return stats
 
+    def _get_position(self, song):
+        # songs not in the song list, e.g. from the queue, are shown first
+        pos = self._playlist.get_position(song)
+        return 0 if pos is None else pos
+
     def status(self):
         app = self._app
         info = app.player.info
@@ -314,8 +331,8 @@ class MPDService:
             ("random", int(self._options.shuffle)),
             ("single", int(self._options.single)),
             ("consume", 0),
-            ("playlist", self._pl_ver),
-            ("playlistlength", int(bool(app.player.info))),
+            ("playlist", self._playlist.version),
+            ("playlistlength", len(self._playlist)),
             ("mixrampdb", 0.0),
             ("state", state),
         ]
@@ -329,7 +346,7 @@ class MPDService:
             elapsed_time = int(app.player.get_position() / 1000)
             elapsed_exact = "%1.3f" % (app.player.get_position() / 1000.0)
             status.extend([
-                ("song", 0),
+                ("song", self._get_position(info)),
                 ("songid", self._get_id(info)),
             ])
 
@@ -342,41 +359,182 @@ class MPDService:
 
         return status
 
+    def _format_song(self, song, pos=None):
+        parts = []
+        parts.append(u"file: %s" % self._db.get_uri(song))
+        tags = format_tags(song)
+        if tags:
+            parts.append(tags)
+        parts.append(u"Time: %d" % int(song("~#length")))
+        if pos is not None:
+            parts.append(u"Pos: %d" % pos)
+            parts.append(u"Id: %d" % self._get_id(song))
+        return u"\n".join(parts)
+
+    def _format_songs(self, songs):
+        for song in sorted(songs, key=self._db.get_uri):
+            yield self._format_song(song)
+
     def currentsong(self):
         info = self._app.player.info
         if info is None:
             return None
 
-        parts = []
-        parts.append(u"file: %s" % info("~filename"))
-        parts.append(format_tags(info))
-        parts.append(u"Time: %d" % int(info("~#length")))
-        parts.append(u"Pos: %d" % 0)
-        parts.append(u"Id: %d" % self._get_id(info))
+        return self._format_song(info, self._get_position(info))
 
-        return u"\n".join(parts)
+    def _get_playlist_songs(self, positions):
+        # positions need to be sorted
+        if not positions:
+            return []
+        start = positions[0]
+        songs = self._playlist.get_songs(start, positions[-1] + 1)
+        return [(pos, songs[pos - start]) for pos in positions
+                if pos - start < len(songs)]
+
+    def _format_playlist(self, positions):
+        for pos, song in self._get_playlist_songs(positions):
+            yield self._format_song(song, pos)
 
     def playlistinfo(self, start=None, end=None):
-        if start is not None and start > 1:
-            return None
+        """Yields the songs in the playlist"""
 
-        return self.currentsong()
+        length = len(self._playlist)
+        if start is None:
+            start, end = 0, length
+        elif start >= length:
+            raise MPDRequestError("Bad song index", AckError.ARG)
+        positions = list(range(start, min(end, length)))
+        return self._format_playlist(positions)
 
     def playlistid(self, songid=None):
-        return self.currentsong()
+        if songid is None:
+            return self.playlistinfo()
+        for pos, song in enumerate(self._playlist.get_songs()):
+            if self._get_id(song) == songid:
+                return iter([self._format_song(song, pos)])
+        raise MPDRequestError("No such song", AckError.NO_EXIST)
 
     def plchanges(self, version):
-        if version != self._pl_ver:
-            return self.currentsong()
+        """Yields the songs which changed since the playlist version"""
+
+        return self._format_playlist(self._playlist.get_changes(version))
 
     def plchangesposid(self, version):
-        info = self._app.player.info
-        if version != self._pl_ver and info:
-            parts = []
-            parts.append(u"file: %s" % info("~filename"))
-            parts.append(u"Pos: %d" % 0)
-            parts.append(u"Id: %d" % self._get_id(info))
-            return u"\n".join(parts)
+        songs = self._get_playlist_songs(self._playlist.get_changes(version))
+        for pos, song in songs:
+            yield u"cpos: %d" % pos
+            yield u"Id: %d" % self._get_id(song)
+
+    def _check_uri(self, uri):
+        uri = uri.strip("/")
+        if self._db.get_song(uri) is None and not self._db.is_dir(uri):
+            raise MPDRequestError("No such directory", AckError.NO_EXIST)
+        return uri
+
+    def lsinfo(self, uri):
+        """Yields the directories and songs in the directory"""
+
+        uri = self._check_uri(uri)
+        song = self._db.get_song(uri)
+        if song is not None:
+            return iter([self._format_song(song)])
+
+        dirs, songs = self._db.list_dir(uri)
+
+        def format_dir():
+            for sub in dirs:
+                yield u"directory: %s" % sub
+            for song in songs:
+                yield self._format_song(song)
+
+        return format_dir()
+
+    def listall(self, uri, info=False):
+        """Yields all directories and songs below the directory"""
+
+        uri = self._check_uri(uri)
+        song = self._db.get_song(uri)
+        if song is not None:
+            return iter([self._format_song(song) if info else
+                         u"file: %s" % uri])
+
+        def format_all():
+            for sub, song in self._db.walk(uri):
+                if song is None:
+                    yield u"directory: %s" % sub
+                elif info:
+                    yield self._format_song(song)
+                else:
+                    yield u"file: %s" % sub
+
+        return format_all()
+
+    def _check_filters(self, filters):
+        for tag, value in filters:
+            if not self._db.has_tag(tag) and \
+                    tag.lower() not in ("any", "file", "base"):
+                raise MPDRequestError(
+                    "Unknown tag type: %s" % tag, AckError.ARG)
+
+    def find(self, filters, exact=True):
+        """Yields the songs matching all (tag, value) filters"""
+
+        self._check_filters(filters)
+        return self._format_songs(self._db.find(filters, exact))
+
+    def count(self, filters):
+        self._check_filters(filters)
+        songs = self._db.find(filters)
+        playtime = sum(s("~#length", 0) for s in songs)
+        return [("songs", len(songs)), ("playtime", int(playtime))]
+
+    def list(self, tag, filters, group=()):
+        """Yields the values of a tag of the songs matching the filters,
+        optionally grouped by other tags.
+        """
+
+        self._check_filters(filters)
+        names = dict((mpd.lower(), mpd) for mpd, ql in TAG_MAPPING)
+        names["file"] = u"file"
+        for name in (tag,) + tuple(group):
+            if name.lower() not in names:
+                raise MPDRequestError(
+                    "Unknown tag type: %s" % name, AckError.ARG)
+        tags = [t.lower() for t in tuple(group) + (tag,)]
+
+        db = self._db
+        if not filters and len(tags) == 1 and tags[0] != "file":
+            # fast path, no need to look at the songs
+            entries = [(v,) for v in db.get_values(tags[0])]
+        else:
+            def get_values(song, tag):
+                if tag == "file":
+                    return [db.get_uri(song)]
+                return get_tag_values(song, ql_keys[tag]) or [u""]
+
+            ql_keys = dict((mpd.lower(), ql) for mpd, ql in TAG_MAPPING)
+            entries = set()
+            for song in db.find(filters):
+                combinations = [()]
+                for t in tags:
+                    values = get_values(song, t)
+                    combinations = [c + (v,) for c in combinations
+                                    for v in values]
+                entries.update(combinations)
+
+        def format_entries():
+            last = ()
+            for entry in sorted(entries):
+                for i, value in enumerate(entry):
+                    if i < len(entry) - 1 and i < len(last) and \
+                            last[i] == value and last[:i] == entry[:i]:
+                        continue
+                    if i == len(entry) - 1 and not value:
+                        continue
+                    yield u"%s: %s" % (names[tags[i]], value)
+                last = entry
+
+        return format_entries()
 
 
 class MPDServer(BaseTCPServer):
@@ -384,17 +542,28 @@ class MPDServer(BaseTCPServer):
     def __init__(self, app, config, port):
         self._app = app
         self._config = config
+        self._database = None
         super().__init__(port, MPDConnection, const.DEBUG)
 
     def handle_init(self):
         print_d("Creating the MPD service")
-        self.service = MPDService(self._app, self._config)
+        # the indexes are kept while the server is running so clients
+        # reconnecting don't have to wait for them to get rebuilt
+        if self._database is None:
+            self._database = MPDDatabase(self._app.library, TAG_MAPPING)
+        self.service = MPDService(self._app, self._config, self._database)
 
     def handle_idle(self):
         print_d("Destroying the MPD service")
         self.service.destroy()
         del self.service
 
+    def stop(self):
+        super().stop()
+        if self._database is not None:
+            self._database.destroy()
+            self._database = None
+
     def log(self, msg):
         print_d(msg)
 
@@ -409,6 +578,9 @@ class MPDRequestError(Exception):
 
 class MPDConnection(BaseTCPConnection):
 
+    WRITE_CHUNK_SIZE = 64 * 1024
+    """Amount of data handle_write() tries to return at once"""
+
     #  ------------ connection interface  ------------
 
     def handle_init(self, server):
@@ -417,7 +589,9 @@ class MPDConnection(BaseTCPConnection):
         service.add_connection(self)
 
         str_version = u".".join(map(str, service.version))
-        self._buf = bytearray((u"OK MPD %s\n" % str_version).encode("utf-8"))
+        # bytearrays and iterators of lines which get encoded on demand
+        self._out = deque()
+        self.write_line(u"OK MPD %s" % str_version)
         self._read_buf = bytearray()
 
         # begin - command processing state
@@ -457,15 +631,29 @@ class MPDConnection(BaseTCPConnection):
                 del self._command_list[:]
 
     def handle_write(self):
-        data = self._buf[:]
-        del self._buf[:]
+        data = bytearray()
+        out = self._out
+        while out and len(data) < self.WRITE_CHUNK_SIZE:
+            item = out[0]
+            if isinstance(item, bytearray):
+                data.extend(item)
+                out.popleft()
+                continue
+
+            for line in item:
+                data.extend(self._encode_line(line))
+                if len(data) >= self.WRITE_CHUNK_SIZE:
+                    break
+            else:
+                out.popleft()
         return data
 
     def can_write(self):
-        return bool(self._buf)
+        return bool(self._out)
 
     def handle_close(self):
         self.log("connection closed")
+        self._out.clear()
         self.service.remove_connection(self)
         del self.service
 
@@ -499,13 +687,28 @@ class MPDConnection(BaseTCPConnection):
         del self._read_buf[:index + 1]
         return line
 
+    def _encode_line(self, line):
+        assert isinstance(line, str)
+        self.log(u"<- " + repr(line))
+
+        return line.encode("utf-8", errors="replace") + b"\n"
+
     def write_line(self, line):
         """Writes a line to the client"""
 
-        assert isinstance(line, str)
-        self.log(u"<- " + repr(line))
+        out = self._out
+        if not out or not isinstance(out[-1], bytearray):
+            out.append(bytearray())
+        out[-1].extend(self._encode_line(line))
+
+    def write_lines(self, lines):
+        """Writes all lines of an iterable to the client.
 
-        self._buf.extend(line.encode("utf-8", errors="replace") + b"\n")
+        The lines only get fetched once the client is ready to receive them,
+        so large responses don't have to be kept in memory.
+        """
+
+        self._out.append(iter(lines))
 
     def ok(self):
         self.write_line(u"OK")
@@ -624,6 +827,13 @@ def _parse_bool(arg):
         return bool(value)
 
 
+def _parse_filters(args):
+    if len(args) % 2:
+        raise MPDRequestError("Incorrect number of filter arguments",
+                              AckError.ARG)
+    return list(zip(args[::2], args[1::2]))
+
+
 def _parse_range(arg):
     try:
         values = [int(v) for v in arg.split(":")]
@@ -677,7 +887,24 @@ def _cmd_listplaylists(conn, service, args):
 
 @MPDConnection.Command("list")
 def _cmd_list(conn, service, args):
-    pass
+    _verify_length(args, 1)
+    tag, args = args[0], args[1:]
+
+    group = []
+    while len(args) >= 2 and args[-2].lower() == "group":
+        group.insert(0, args[-1])
+        args = args[:-2]
+
+    if len(args) == 1:
+        # "list album <artist>"
+        if tag.lower() != "album":
+            raise MPDRequestError(
+                "should be \"Album\" for 3 arguments", AckError.ARG)
+        filters = [(u"artist", args[0])]
+    else:
+        filters = _parse_filters(args)
+
+    conn.write_lines(service.list(tag, filters, tuple(group)))
 
 
 @MPDConnection.Command("playid")
@@ -762,31 +989,47 @@ def _cmd_currentsong(conn, service, args):
 
 @MPDConnection.Command("count")
 def _cmd_count(conn, service, args):
-    conn.write_line(u"songs: 0")
-    conn.write_line(u"playtime: 0")
+    _verify_length(args, 2)
+    for k, v in service.count(_parse_filters(args)):
+        conn.write_line(u"%s: %s" % (k, v))
+
+
+@MPDConnection.Command("find")
+def _cmd_find(conn, service, args):
+    _verify_length(args, 2)
+    conn.write_lines(service.find(_parse_filters(args)))
+
+
+@MPDConnection.Command("search")
+def _cmd_search(conn, service, args):
+    _verify_length(args, 2)
+    conn.write_lines(service.find(_parse_filters(args), exact=False))
 
 
 @MPDConnection.Command("plchanges")
 def _cmd_plchanges(conn, service, args):
     _verify_length(args, 1)
     version = _parse_int(args[0])
-    changes = service.plchanges(version)
-    if changes is not None:
-        conn.write_line(changes)
+    conn.write_lines(service.plchanges(version))
 
 
 @MPDConnection.Command("plchangesposid")
 def _cmd_plchangesposid(conn, service, args):
     _verify_length(args, 1)
     version = _parse_int(args[0])
-    changes = service.plchangesposid(version)
-    if changes is not None:
-        conn.write_line(changes)
+    conn.write_lines(service.plchangesposid(version))
+
+
+@MPDConnection.Command("listall")
+def _cmd_listall(conn, service, args):
+    uri = args[0] if args else u""
+    conn.write_lines(service.listall(uri))
 
 
 @MPDConnection.Command("listallinfo")
-def _cmd_listallinfo(*args):
-    _cmd_currentsong(*args)
+def _cmd_listallinfo(conn, service, args):
+    uri = args[0] if args else u""
+    conn.write_lines(service.listall(uri, info=True))
 
 
 @MPDConnection.Command("seek")
@@ -843,7 +1086,8 @@ def _cmd_tagtypes(conn, service, args):
 
 @MPDConnection.Command("lsinfo")
 def _cmd_lsinfo(conn, service, args):
-    _verify_length(args, 1)
+    uri = args[0] if args else u""
+    conn.write_lines(service.lsinfo(uri))
 
 
 @MPDConnection.Command("playlistinfo")
@@ -854,8 +1098,7 @@ def _cmd_playlistinfo(conn, service, args):
         result = service.playlistinfo(start, end)
     else:
         result = service.playlistinfo()
-    if result is not None:
-        conn.write_line(result)
+    conn.write_lines(result)
 
 
 @MPDConnection.Command("playlistid")
@@ -864,6 +1107,4 @@ def _cmd_playlistid(conn, service, args):
         songid = _parse_int(args[0])
     else:
         songid = None
-    result = service.playlistid(songid)
-    if result is not None:
-        conn.write_line(result)
+    conn.write_lines(service.playlistid(songid))
@@ -15,6 +15,11 @@ from gi.repository import Gio, GLib
 from quodlibet.qltk import io_add_watch
 
 
+WRITE_BUFFER_SIZE = 64 * 1024
+"""Connections only get asked for more data once the pending output is
+smaller than this"""
+
+
 class ServerError(Exception):
     pass
 
@@ -197,7 +202,8 @@ class BaseTCPConnection:
                 return False
 
             if flags & GLib.IOCondition.OUT:
-                if self.can_write():
+                if len(write_buffer) < WRITE_BUFFER_SIZE and \
+                        self.can_write():
                     write_buffer.extend(self.handle_write())
                 if not write_buffer:
                     self._out_id = None
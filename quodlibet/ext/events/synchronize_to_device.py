@@ -7,9 +7,13 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
+import json
 import os
 import shutil
 import unicodedata
+from collections import deque
+from concurrent import futures
+from functools import partial
 from pathlib import Path
 
 from gi.repository import Gtk, Pango
@@ -31,7 +35,8 @@ from quodlibet.qltk.cbes import ComboBoxEntrySave
 from quodlibet.qltk.ccb import ConfigCheckButton
 from quodlibet.qltk.views import HintedTreeView
 from quodlibet.query import Query
-from quodlibet.util import print_d, print_e, print_exc
+from quodlibet.util import print_d, print_e, print_exc, print_w
+from quodlibet.util.atomic import atomic_save
 from quodlibet.util.enum import enum
 from quodlibet.util.path import strip_win32_incompat_from_path
 from quodlibet.util.string.titlecase import human_title
@@ -59,7 +64,7 @@ class Entry:
         IN_PROGRESS_DELETE = _('Deleting')
         RESULT_SUCCESS = _('Success')
         RESULT_FAILURE = _('FAILURE')
-        RESULT_SKIP_EXISTING = _('Skipped existing file')
+        RESULT_SKIP_EXISTING = _('Skipped up-to-date file')
 
     def __init__(self, song, export_path=None):
         self._song = song
@@ -82,6 +87,121 @@ class Entry:
             raise ValueError(_('Cannot set the filename of a song.'))
 
 
+MTIME_TOLERANCE = 2
+"""Seconds an mtime may differ, FAT file systems only store even seconds"""
+
+
+def sync_file(source, destination, known=None):
+    """
+    Copy a file unless the destination is up to date, meaning it has the
+    size of the source and wasn't modified before it. The copy gets the
+    mtime of the source.
+    Runs in a worker thread, so it must not touch any UI.
+
+    :param source:      The path of the song file.
+    :param destination: The export path.
+    :param known:       The (size, mtime) of the source at the time it was
+                        last copied, from the SyncManifest, or None.
+    :return: A tuple of whether the file was copied and the (size, mtime)
+             of the source, or None if it couldn't be read.
+    :raises: Exception if copying failed.
+    """
+    try:
+        stat = os.stat(source)
+    except OSError:
+        state = None
+    else:
+        state = (stat.st_size, stat.st_mtime)
+
+    if os.path.exists(destination):
+        if state is None or state == known:
+            return False, state
+        dest_stat = os.stat(destination)
+        if dest_stat.st_size == state[0] and \
+                dest_stat.st_mtime >= state[1] - MTIME_TOLERANCE:
+            return False, state
+
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    shutil.copyfile(source, destination)
+    if state is not None:
+        os.utime(destination, (stat.st_atime, stat.st_mtime))
+    return True, state
+
+
+class SyncManifest:
+    """
+    The size and mtime of the source of every file copied to the destination
+    folder, stored in a file inside of it. This saves comparing against the
+    destination files, and makes an interrupted synchronization continue
+    where it stopped.
+    """
+
+    FILENAME = '.quodlibet-sync.json'
+    SAVE_INTERVAL = 200
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.path = os.path.join(folder, self.FILENAME)
+        self._files = {}
+        self._changes = 0
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as h:
+                files = json.load(h)['files']
+            self._files = {k: tuple(v) for k, v in files.items()}
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError,
+                AttributeError) as e:
+            print_w('Ignoring broken sync manifest: {}'.format(e))
+
+    def _key(self, path):
+        return os.path.relpath(path, self.folder)
+
+    def get(self, path):
+        return self._files.get(self._key(path))
+
+    def set(self, path, state):
+        """
+        Remember the state of the source of a synchronized file, saving
+        from time to time.
+
+        :param path:  The export path.
+        :param state: The (size, mtime) of the source, or None to forget it.
+        """
+        key = self._key(path)
+        if state is None:
+            if self._files.pop(key, None) is None:
+                return
+        elif self._files.get(key) == state:
+            return
+        else:
+            self._files[key] = state
+        self._changes += 1
+        if self._changes >= self.SAVE_INTERVAL:
+            self.save()
+
+    def retain(self, paths):
+        """
+        Forget all files not in the given export paths.
+        """
+        keys = {self._key(p) for p in paths}
+        for key in set(self._files) - keys:
+            del self._files[key]
+            self._changes += 1
+
+    def save(self):
+        if not self._changes:
+            return
+        try:
+            with atomic_save(self.path, 'w') as h:
+                json.dump({'version': 1, 'files': self._files}, h)
+        except OSError as e:
+            print_w('Unable to save the sync manifest: {}'.format(e))
+        else:
+            self._changes = 0
+
+
 class SyncToDevice(EventPlugin, PluginConfigMixin):
     PLUGIN_ICON = Icons.NETWORK_TRANSMIT
     PLUGIN_ID = PLUGIN_CONFIG_SECTION
@@ -106,6 +226,11 @@ class SyncToDevice(EventPlugin, PluginConfigMixin):
     default_export_pattern = os.path.join(
         _('<artist>'), _('<album>'), _('<title>'))
 
+    sync_workers = 4
+    """Number of files copied or deleted at the same time"""
+
+    destination_files = None
+
     model_cols = {'entry': (0, object),
                   'tag': (1, str),
                   'filename': (2, str),
@@ -711,7 +836,7 @@ class SyncToDevice(EventPlugin, PluginConfigMixin):
         if not songs:
             return False
         self.model.clear()
-        export_paths = []
+        export_paths = set()
 
         for song in songs:
             if not self.running:
@@ -735,14 +860,20 @@ class SyncToDevice(EventPlugin, PluginConfigMixin):
             else:
                 entry.tag = Entry.Tags.PENDING_COPY
                 self.c_songs_copy += 1
-                export_paths.append(expanded_path)
+                export_paths.add(expanded_path)
 
             self.model.append(row=self._make_model_row(entry))
 
         # List files to delete
+        manifest_path = os.path.join(self.expanded_destination,
+                                     SyncManifest.FILENAME)
+        self.destination_files = set()
         for root, __, files in os.walk(self.expanded_destination):
             for name in files:
                 file_path = os.path.join(root, name)
+                self.destination_files.add(file_path)
+                if file_path == manifest_path:
+                    continue
                 if file_path not in export_paths:
                     entry = Entry(None)
                     entry.filename = file_path
@@ -987,89 +1118,132 @@ class SyncToDevice(EventPlugin, PluginConfigMixin):
         Synchronize the songs from the selected saved searches
         with the specified folder.
 
+        Files get copied and deleted by a pool of worker threads, while the
+        main loop only updates the progress.
+
         :return: Whether the synchronization was successful.
         """
         self.c_files_copy = self.c_files_skip = self.c_files_skip_previous \
             = self.c_files_dupes = self.c_files_delete = self.c_files_failed = 0
-        self.model.foreach(self._sync_entry)
+
+        manifest = SyncManifest(self.expanded_destination)
+        if self.destination_files is not None:
+            # forget files which were deleted from the device
+            manifest.retain(self.destination_files)
+            self.destination_files = None
+        self.sync_manifest = manifest
+
+        rows = deque((row.iter, row[self._model_col_id('entry')])
+                     for row in self.model)
+        running = {}
+        stopped = False
+        with futures.ThreadPoolExecutor(self.sync_workers) as executor:
+            while True:
+                # keep the workers busy, but don't queue up everything
+                while not stopped and rows \
+                        and len(running) < self.sync_workers * 2:
+                    iter_, entry = rows.popleft()
+                    job = self._sync_entry(iter_, entry)
+                    if job is not None:
+                        running[executor.submit(job)] = (iter_, entry)
+
+                if not running:
+                    break
+
+                done, __ = futures.wait(
+                    running, timeout=0.05,
+                    return_when=futures.FIRST_COMPLETED)
+                for future in done:
+                    self._sync_entry_done(*running.pop(future), future)
+
+                self._run_pending_events()
+                if stopped:
+                    continue
+                if not self.running:
+                    print_d(_('Stopped song synchronization'))
+                    stopped = True
+                elif not self.destination_entry.get_text():
+                    print_d(_('A different plugin was selected - '
+                              'stop synchronization'))
+                    stopped = True
+
+        manifest.save()
         if not self.running:
             return False
         self._remove_empty_dirs()
         return True
 
-    def _sync_entry(self, model, path, iter_, *data):
+    def _sync_entry(self, iter_, entry):
         """
-        Synchronize a single song.
-        This is a callback function passed to Gtk.TreeModel.foreach() to iterate
-        over the rows in a tree model.
+        Start synchronizing a single song.
 
-        :return: True to stop iterating, False to continue.
+        :param iter_: A Gtk.TreeIter for the row of the entry.
+        :param entry: The Entry to synchronize.
+        :return: A function copying or deleting the file, to be run in a
+                 worker thread, or None if there is nothing to do.
         """
-        entry = model[path][self._model_col_id('entry')]
-        if not self.running:
-            print_d(_('Stopped song synchronization'))
-            return True
-        self._run_pending_events()
-        if not self.destination_entry.get_text():
-            print_d(_('A different plugin was selected - stop synchronization'))
-            return True
-
         print_d(_('{tag} - "{filename}"').format(tag=entry.tag,
                                                  filename=entry.filename))
 
         if not entry.export_path and not entry.tag:
-            return False
+            return None
 
         if entry.tag == Entry.Tags.PENDING_COPY:
-            # Export, skipping existing files
+            # Export, skipping files that are up to date
             expanded_path = os.path.expanduser(entry.export_path)
-            if os.path.exists(expanded_path):
-                entry.tag = Entry.Tags.RESULT_SKIP_EXISTING
-                self._update_model_value(iter_, 'tag', entry.tag)
-                self.c_files_skip += 1
-            else:
-                entry.tag = Entry.Tags.IN_PROGRESS_SYNC
-                self._update_model_value(iter_, 'tag', entry.tag)
-
-                song_folders = os.path.dirname(expanded_path)
-                os.makedirs(song_folders, exist_ok=True)
-                try:
-                    shutil.copyfile(entry.filename, expanded_path)
-                except Exception as ex:
-                    entry.tag = Entry.Tags.RESULT_FAILURE + ': ' + str(ex)
-                    self._update_model_value(iter_, 'tag', entry.tag)
-                    print_exc()
-                    self.c_files_failed += 1
-                else:
-                    entry.tag = Entry.Tags.RESULT_SUCCESS
-                    self._update_model_value(iter_, 'tag', entry.tag)
-                    self.c_files_copy += 1
+            entry.tag = Entry.Tags.IN_PROGRESS_SYNC
+            self._update_model_value(iter_, 'tag', entry.tag)
+            return partial(sync_file, entry.filename, expanded_path,
+                           self.sync_manifest.get(expanded_path))
 
         elif entry.tag == Entry.Tags.SKIP_DUPLICATE:
             self.c_files_dupes += 1
 
         elif entry.tag == Entry.Tags.PENDING_DELETE:
             # Delete file
-            try:
-                entry.tag = Entry.Tags.IN_PROGRESS_DELETE
-                self._update_model_value(iter_, 'tag', entry.tag)
-
-                os.remove(entry.filename)
-            except Exception as ex:
-                entry.tag = Entry.Tags.RESULT_FAILURE + ': ' + str(ex)
-                self._update_model_value(iter_, 'tag', entry.tag)
-                print_exc()
-                self.c_files_failed += 1
-            else:
-                entry.tag = Entry.Tags.RESULT_SUCCESS
-                self._update_model_value(iter_, 'tag', entry.tag)
-                self.c_files_delete += 1
+            entry.tag = Entry.Tags.IN_PROGRESS_DELETE
+            self._update_model_value(iter_, 'tag', entry.tag)
+            return partial(os.remove, entry.filename)
 
         else:
             self.c_files_skip_previous += 1
 
         self._update_sync_summary()
-        return False
+        return None
+
+    def _sync_entry_done(self, iter_, entry, future):
+        """
+        Show the result of synchronizing a single song.
+
+        :param iter_:  A Gtk.TreeIter for the row of the entry.
+        :param entry:  The synchronized Entry.
+        :param future: The finished Future of the job from _sync_entry().
+        """
+        deleted = entry.tag == Entry.Tags.IN_PROGRESS_DELETE
+        try:
+            result = future.result()
+        except Exception as ex:
+            entry.tag = Entry.Tags.RESULT_FAILURE + ': ' + str(ex)
+            print_exc()
+            self.c_files_failed += 1
+        else:
+            if deleted:
+                entry.tag = Entry.Tags.RESULT_SUCCESS
+                self.sync_manifest.set(entry.filename, None)
+                self.c_files_delete += 1
+            else:
+                copied, state = result
+                if copied:
+                    entry.tag = Entry.Tags.RESULT_SUCCESS
+                    self.c_files_copy += 1
+                else:
+                    entry.tag = Entry.Tags.RESULT_SKIP_EXISTING
+                    self.c_files_skip += 1
+                self.sync_manifest.set(
+                    os.path.expanduser(entry.export_path), state)
+
+        self._update_model_value(iter_, 'tag', entry.tag)
+        self._update_sync_summary()
 
     def _remove_empty_dirs(self):
         """
@@ -1117,7 +1291,7 @@ class SyncToDevice(EventPlugin, PluginConfigMixin):
             if self.c_files_skip > 0:
                 counter = self.c_files_skip
                 text.append(
-                    _('(skipped {count} existing {file_str})').format(
+                    _('(skipped {count} up-to-date {file_str})').format(
                         count=counter, file_str=ngt('file', 'files', counter)))
 
             sync_summary.append(self.summary_sep.join(text))
@@ -12,13 +12,19 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
+import hashlib
+import os
+import struct
+from itertools import islice
 from math import ceil, floor
-from typing import List
+from typing import List, Optional
 
 from gi.repository import Gtk, Gdk, Gst
+from senf import fsn2bytes
 import cairo
 
 from quodlibet import _, app
+from quodlibet import get_cache_dir
 from quodlibet import print_w
 from quodlibet import util
 from quodlibet.plugins import PluginConfig, IntConfProp, \
@@ -30,18 +36,226 @@ from quodlibet.qltk.seekbutton import TimeLabel
 from quodlibet.qltk.tracker import TimeTracker
 from quodlibet.qltk import get_fg_highlight_color
 from quodlibet.util import connect_destroy, print_d
-from quodlibet.util.path import uri2gsturi
+from quodlibet.util.atomic import atomic_save
+from quodlibet.util.path import uri2gsturi, mkdir, mtime
+
+
+def resample(values, count):
+    """Returns `count` values, each the average of the part of `values`
+    it covers."""
+
+    total = len(values)
+    if total == count or not total:
+        return list(values)
+    result = []
+    for i in range(count):
+        start = i * total // count
+        end = max((i + 1) * total // count, start + 1)
+        result.append(sum(values[start:end]) / (end - start))
+    return result
+
+
+class WaveformCache:
+    """Stores the RMS values of songs on disk, one file per song.
+
+    Entries are invalid once the mtime of the song file changes. Values are
+    stored as one byte each relative to the maximum value, so a song with
+    3000 data points takes 3 KB.
+    """
+
+    _HEADER = struct.Struct("<ddI")
+
+    def __init__(self, path):
+        self.path = path
+
+    def _get_path(self, song):
+        key = hashlib.md5(fsn2bytes(song("~filename"), "utf-8")).hexdigest()
+        return os.path.join(self.path, key)
+
+    def load(self, song, points=None) -> Optional[List[float]]:
+        """Returns the cached values or None. If there are more than
+        `points` values they get resampled to `points`."""
+
+        try:
+            with open(self._get_path(song), "rb") as h:
+                data = h.read()
+            song_mtime, max_value, count = self._HEADER.unpack_from(data)
+        except (OSError, struct.error):
+            return None
+        if song_mtime != mtime(song("~filename")) or \
+                len(data) != self._HEADER.size + count:
+            return None
+
+        scale = max_value / 255
+        values = [v * scale for v in data[self._HEADER.size:]]
+        if points is not None and count > points:
+            values = resample(values, points)
+        return values
+
+    def __contains__(self, song):
+        return self.load(song) is not None
+
+    def store(self, song, values):
+        max_value = max(values, default=0.0)
+        scale = 255 / max_value if max_value > 0 else 0
+        data = bytes(min(int(round(v * scale)), 255) for v in values)
+        header = self._HEADER.pack(
+            mtime(song("~filename")), max_value, len(data))
+        try:
+            mkdir(self.path, 0o700)
+            with atomic_save(self._get_path(song), "wb") as h:
+                h.write(header + data)
+        except OSError as e:
+            print_w("Couldn't save waveform: %s" % e)
+
+
+def create_level_pipeline(song, points):
+    """Returns a pipeline decoding the song which posts `points` level
+    messages over the length of the song, or None."""
+
+    command_template = """
+    uridecodebin name=uridec
+    ! audioconvert
+    ! level name=audiolevel interval={} post-messages=true
+    ! fakesink sync=false"""
+    interval = int(song("~#length") * 1E9 / points)
+    if not interval:
+        return None
+    print_d("Computing data for each %.3f seconds" % (interval / 1E9))
+
+    command = command_template.format(interval)
+    pipeline = Gst.parse_launch(command)
+    pipeline.get_by_name("uridec").set_property("uri", uri2gsturi(song("~uri")))
+    return pipeline
+
+
+def get_rms(message):
+    """Returns the normalized RMS value of a level message or None"""
+
+    structure = message.get_structure()
+    if structure.get_name() != "level":
+        return None
+    rms_db = structure.get_value("rms")
+    if not rms_db:
+        return None
+    # Calculate average of all channels (usually 2)
+    rms_db_avg = sum(rms_db) / len(rms_db)
+    # Normalize dB value to value between 0 and 1
+    return pow(10, (rms_db_avg / 20))
+
+
+def get_upcoming_songs(count):
+    """Returns up to `count` songs from the queue and the songs following
+    the current one in the song list."""
+
+    playlist = getattr(app.window, "playlist", None)
+    if playlist is None:
+        return []
+    songs = list(islice(playlist.q.itervalues(), count))
+    pl = playlist.pl
+    iter_ = pl.current_iter
+    while iter_ is not None and len(songs) < count:
+        iter_ = pl.iter_next(iter_)
+        if iter_ is not None:
+            songs.append(pl.get_value(iter_))
+    return songs
+
+
+class WaveformPrecomputer:
+    """Computes and caches the waveforms of songs in the background,
+    one song at a time."""
+
+    def __init__(self, cache):
+        self._cache = cache
+        self._pending = []
+        self._pipeline = None
+        self._bus_id = None
+        self._song = None
+        self._rms_vals = []
+
+    @property
+    def is_running(self):
+        return self._pipeline is not None
+
+    def set_songs(self, songs, points):
+        """Replaces the songs to compute, keeps the current one running"""
+
+        self._pending = [(s, points) for s in reversed(songs)
+                         if s.is_file and s is not self._song]
+        if self._pipeline is None:
+            self._next()
+
+    def stop(self):
+        self._pending = []
+        self._clean_pipeline()
+
+    def _next(self):
+        while self._pending and self._pipeline is None:
+            song, points = self._pending.pop()
+            if song in self._cache:
+                continue
+            pipeline = create_level_pipeline(song, points)
+            if pipeline is None:
+                continue
+            print_d("Precomputing waveform for %s" % song("~filename"))
+            bus = pipeline.get_bus()
+            self._bus_id = bus.connect("message", self._on_bus_message, points)
+            bus.add_signal_watch()
+            pipeline.set_state(Gst.State.PLAYING)
+            self._pipeline = pipeline
+            self._song = song
+            self._rms_vals = []
+
+    def _on_bus_message(self, bus, message, points):
+        done = False
+        if message.type == Gst.MessageType.ERROR:
+            error, debug = message.parse_error()
+            print_d("Error precomputing waveform: %s" % error)
+            self._rms_vals = []
+            done = True
+        elif message.type == Gst.MessageType.ELEMENT:
+            rms = get_rms(message)
+            if rms is not None:
+                self._rms_vals.append(rms)
+                done = len(self._rms_vals) >= points
+        elif message.type == Gst.MessageType.EOS:
+            done = True
+
+        if done:
+            song, rms_vals = self._song, self._rms_vals
+            self._clean_pipeline()
+            if rms_vals:
+                self._cache.store(song, rms_vals)
+            self._next()
+
+    def _clean_pipeline(self):
+        if self._pipeline is not None:
+            self._pipeline.set_state(Gst.State.NULL)
+            bus = self._pipeline.get_bus()
+            bus.remove_signal_watch()
+            bus.disconnect(self._bus_id)
+            self._pipeline = None
+        self._song = None
+        self._rms_vals = []
 
 
 class WaveformSeekBar(Gtk.Box):
     """A widget containing labels and the seekbar."""
 
-    def __init__(self, player, library):
+    PRECOMPUTE_COUNT = 5
+    """How many upcoming songs get precomputed, if enabled"""
+
+    def __init__(self, player, library, cache=None):
         super().__init__()
 
         self._player = player
         self._rms_vals = []
         self._hovering = False
+        self._cache = cache
+        self._song = None
+        self._precomputer = None
+        if cache is not None:
+            self._precomputer = WaveformPrecomputer(cache)
 
         self._elapsed_label = TimeLabel()
         self._remaining_label = TimeLabel()
@@ -92,23 +306,23 @@ class WaveformSeekBar(Gtk.Box):
     def _create_waveform(self, song, points):
         # Close any existing pipeline to avoid leaks
         self._clean_pipeline()
+        if self._precomputer is not None:
+            # the current song comes first
+            self._precomputer.stop()
 
         if not song.is_file:
             return
 
-        command_template = """
-        uridecodebin name=uridec
-        ! audioconvert
-        ! level name=audiolevel interval={} post-messages=true
-        ! fakesink sync=false"""
-        interval = int(song("~#length") * 1E9 / points)
-        if not interval:
-            return
-        print_d("Computing data for each %.3f seconds" % (interval / 1E9))
+        if self._cache is not None:
+            rms_vals = self._cache.load(song, points)
+            if rms_vals is not None:
+                print_d("Using cached waveform")
+                self._set_rms_vals(rms_vals)
+                return
 
-        command = command_template.format(interval)
-        pipeline = Gst.parse_launch(command)
-        pipeline.get_by_name("uridec").set_property("uri", uri2gsturi(song("~uri")))
+        pipeline = create_level_pipeline(song, points)
+        if pipeline is None:
+            return
 
         bus = pipeline.get_bus()
         self._bus_id = bus.connect("message", self._on_bus_message, points)
@@ -117,6 +331,7 @@ class WaveformSeekBar(Gtk.Box):
         pipeline.set_state(Gst.State.PLAYING)
 
         self._pipeline = pipeline
+        self._song = song
         self._new_rms_vals = []
 
     def _on_bus_message(self, bus, message, points):
@@ -129,12 +344,8 @@ class WaveformSeekBar(Gtk.Box):
         elif message.type == Gst.MessageType.ELEMENT:
             structure = message.get_structure()
             if structure.get_name() == "level":
-                rms_db = structure.get_value("rms")
-                if rms_db:
-                    # Calculate average of all channels (usually 2)
-                    rms_db_avg = sum(rms_db) / len(rms_db)
-                    # Normalize dB value to value between 0 and 1
-                    rms = pow(10, (rms_db_avg / 20))
+                rms = get_rms(message)
+                if rms is not None:
                     self._new_rms_vals.append(rms)
                     if len(self._new_rms_vals) >= points:
                         # The audio might be much longer than we anticipated
@@ -148,15 +359,26 @@ class WaveformSeekBar(Gtk.Box):
         if message.type == Gst.MessageType.EOS or force_stop:
             self._clean_pipeline()
 
+            if self._cache is not None and self._new_rms_vals:
+                self._cache.store(self._song, self._new_rms_vals)
+
             # Update the waveform with the new data
-            self._rms_vals = self._new_rms_vals
-            self._waveform_scale.reset(self._rms_vals)
-            self._waveform_scale.set_placeholder(False)
-            self._update_redraw_interval()
+            self._set_rms_vals(self._new_rms_vals)
 
             # Clear temporary reference to the waveform data
             del self._new_rms_vals
 
+    def _set_rms_vals(self, rms_vals):
+        self._rms_vals = rms_vals
+        self._waveform_scale.reset(self._rms_vals)
+        self._waveform_scale.set_placeholder(False)
+        self._update_redraw_interval()
+
+        if self._precomputer is not None and CONFIG.precompute_upcoming:
+            self._precomputer.set_songs(
+                get_upcoming_songs(self.PRECOMPUTE_COUNT),
+                CONFIG.max_data_points)
+
     def _clean_pipeline(self):
         if hasattr(self, "_pipeline") and self._pipeline:
             self._pipeline.set_state(Gst.State.NULL)
@@ -176,6 +398,8 @@ class WaveformSeekBar(Gtk.Box):
 
     def _on_destroy(self, *args):
         self._clean_pipeline()
+        if self._precomputer is not None:
+            self._precomputer.stop()
         self._label_tracker.destroy()
         self._redraw_tracker.destroy()
 
@@ -203,12 +427,12 @@ class WaveformSeekBar(Gtk.Box):
             self._update_label(player)
 
     def _on_song_started(self, player, song):
+        self._waveform_scale.set_placeholder(True)
         if player.info:
             # Trigger a re-computation of the waveform
             self._create_waveform(player.info, CONFIG.max_data_points)
             self._resize_labels(player.info)
 
-        self._waveform_scale.set_placeholder(True)
         self._update(player, True)
 
     def _on_song_ended(self, player, song, ended):
@@ -594,6 +818,7 @@ class Config:
     seek_amount = IntConfProp(_config, "seek_amount", 5000)
     max_data_points = IntConfProp(_config, "max_data_points", 3000)
     show_time_labels = BoolConfProp(_config, "show_time_labels", True)
+    precompute_upcoming = BoolConfProp(_config, "precompute_upcoming", False)
 
 
 CONFIG = Config()
@@ -613,7 +838,8 @@ class WaveformSeekBarPlugin(EventPlugin):
         self._bar = None
 
     def enabled(self):
-        self._bar = WaveformSeekBar(app.player, app.librarian)
+        cache = WaveformCache(os.path.join(get_cache_dir(), "waveforms"))
+        self._bar = WaveformSeekBar(app.player, app.librarian, cache)
         self._bar.show()
         app.window.set_seekbar_widget(self._bar)
 
@@ -664,6 +890,9 @@ class WaveformSeekBarPlugin(EventPlugin):
             if self._bar is not None:
                 self._bar.set_time_label_visibility(CONFIG.show_time_labels)
 
+        def on_precompute_toggled(button, *args):
+            CONFIG.precompute_upcoming = button.get_active()
+
         def create_color(label_text, color, callback):
             hbox = Gtk.HBox(spacing=6)
             hbox.set_border_width(6)
@@ -698,6 +927,12 @@ class WaveformSeekBarPlugin(EventPlugin):
         show_time_labels.connect("toggled", on_show_time_labels_toggled)
         vbox.pack_start(show_time_labels, True, True, 0)
 
+        precompute = Gtk.CheckButton(
+            label=_("Compute waveforms of upcoming songs in advance"))
+        precompute.set_active(CONFIG.precompute_upcoming)
+        precompute.connect("toggled", on_precompute_toggled)
+        vbox.pack_start(precompute, True, True, 0)
+
         hbox = Gtk.HBox(spacing=6)
         hbox.set_border_width(6)
         label = Gtk.Label(label=_(
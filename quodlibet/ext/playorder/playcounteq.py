@@ -6,17 +6,13 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
-import math
-import random
-
 from quodlibet import _
-from quodlibet.order.reorder import Reorder
+from quodlibet.order.reorder import Reorder, OrderSampled
 from quodlibet.plugins.playorder import ShufflePlugin
-from quodlibet.order import OrderRemembered
 from quodlibet.qltk import Icons
 
 
-class PlaycountEqualizer(ShufflePlugin, OrderRemembered):
+class PlaycountEqualizer(ShufflePlugin, OrderSampled):
     PLUGIN_ID = "playcounteq"
     PLUGIN_NAME = _("Playcount Equalizer")
     PLUGIN_DESC = _("Adds a shuffle mode "
@@ -26,26 +22,27 @@ class PlaycountEqualizer(ShufflePlugin, OrderRemembered):
 
     priority = Reorder.priority
 
-    # Select the next track.
-    def next(self, playlist, current):
-        super().next(playlist, current)
-
-        remaining = self.remaining(playlist)
-
-        # Don't try to search through an empty / played playlist.
-        if len(remaining) <= 0:
-            return None
-
-        # Set-up the search information.
-        max_count = max([song('~#playcount') for song in remaining.values()])
-        weights = {i: max_count - song('~#playcount')
-                   for i, song in remaining.items()}
-        choice = int(max(1, math.ceil(sum(weights) * random.random())))
-
-        # Search for a track.
-        for i, weight in weights.items():
-            choice -= weight
-            if choice <= 0:
-                return playlist.get_iter([i])
-        else:  # This should only happen if all songs have equal play counts.
-            return playlist.get_iter([random.choice(list(remaining.keys()))])
+    _max_count = 0
+
+    # Songs are weighted by how much less they were played than the most
+    # played song. If all songs have equal play counts any of them is picked.
+    def prepare_weights(self, songs):
+        self._max_count = max((s("~#playcount") for s in songs), default=0)
+
+    def get_weight(self, song):
+        return max(0, self._max_count - song("~#playcount"))
+
+    def _check_max_count(self, playlist, index):
+        song = playlist.get_value(playlist.get_iter((index,)))
+        if song is not None and song("~#playcount") > self._max_count:
+            # all weights change, start over
+            self._sampler = None
+
+    def song_changed(self, playlist, index):
+        # played songs get their play count increased, but they don't
+        # matter until the next reset
+        sampler = self._sampler
+        if sampler is not None and index < len(sampler) and \
+                sampler.is_active(index):
+            self._check_max_count(playlist, index)
+        super().song_changed(playlist, index)
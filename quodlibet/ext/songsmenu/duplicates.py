@@ -12,6 +12,8 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
+import re
+
 from gi.repository import Gtk, Pango
 
 from quodlibet import app
@@ -30,6 +32,107 @@ from quodlibet.util.i18n import numeric_phrase
 from quodlibet.util.string.filter import remove_diacritics, remove_punctuation
 
 
+_BRACKETED = re.compile(r"\s*[(\[][^)\]]*[)\]]")
+
+
+def get_similarity_key(song):
+    """A strongly normalized artist and title, used for finding songs
+    which only differ in details like "(Remastered)" or punctuation.
+    """
+
+    title = _BRACKETED.sub("", song("title"))
+    key = "%s\n%s" % (song("artist"), title)
+    key = remove_punctuation(remove_diacritics(key).lower())
+    key = " ".join(key.split())
+    return key if title.strip() else ""
+
+
+class DuplicateIndex:
+    """Songs of a library grouped by their duplicate key and by their
+    similarity key, kept up to date through the library signals.
+    """
+
+    def __init__(self, library, get_key):
+        self.library = library
+        self._get_key = get_key
+        self._keys = {}
+        self._groups = {}
+        self._similarity_keys = {}
+        self._blocks = {}
+
+        print_d("Indexing duplicate keys of %d songs" % len(library))
+        self._add(library)
+        self._sigs = [
+            library.connect("added", self.__added),
+            library.connect("removed", self.__removed),
+            library.connect("changed", self.__changed),
+        ]
+
+    def destroy(self):
+        for sig in self._sigs:
+            self.library.disconnect(sig)
+        self._sigs = []
+        self.library = None
+
+    def get_key(self, song):
+        """The duplicate key of the song, from the index if possible"""
+
+        key = self._keys.get(song)
+        if key is None:
+            key = self._get_key(song)
+        return key
+
+    def get_group(self, key):
+        """All library songs with the duplicate key"""
+
+        return self._groups.get(key, set())
+
+    def get_similar(self, song, length_tolerance):
+        """All library songs with the same similarity key and a length
+        differing at most by length_tolerance seconds.
+        """
+
+        block = self._blocks.get(get_similarity_key(song))
+        if not block:
+            return set()
+        length = song("~#length", 0)
+        return {s for s in block
+                if abs(s("~#length", 0) - length) <= length_tolerance}
+
+    def _add(self, songs):
+        for song in songs:
+            key = self._get_key(song)
+            self._keys[song] = key
+            if key:
+                self._groups.setdefault(key, set()).add(song)
+            similarity_key = get_similarity_key(song)
+            self._similarity_keys[song] = similarity_key
+            if similarity_key:
+                self._blocks.setdefault(similarity_key, set()).add(song)
+
+    def _remove(self, songs):
+        for song in songs:
+            for index, groups in [(self._keys, self._groups),
+                                  (self._similarity_keys, self._blocks)]:
+                key = index.pop(song, None)
+                group = groups.get(key)
+                if group is not None:
+                    group.discard(song)
+                    if not group:
+                        del groups[key]
+
+    def __added(self, library, songs):
+        self._add(songs)
+
+    def __removed(self, library, songs):
+        self._remove(songs)
+
+    def __changed(self, library, songs):
+        songs = [s for s in songs if s in self._keys]
+        self._remove(songs)
+        self._add(songs)
+
+
 class DuplicateSongsView(RCMHintedTreeView):
     """Allows full tree-like functionality on top of underlying features"""
 
@@ -367,11 +470,17 @@ class Duplicates(SongsMenuPlugin, PluginConfigMixin):
     _CFG_REMOVE_DIACRITICS = 'remove_diacritics'
     _CFG_REMOVE_PUNCTUATION = 'remove_punctuation'
     _CFG_CASE_INSENSITIVE = 'case_insensitive'
+    _CFG_FIND_SIMILAR = 'find_similar'
+
+    LENGTH_TOLERANCE = 3
+    """Maximum length difference in seconds of similar songs"""
 
     plugin_handles = any_song(is_finite)
 
     # Cached values
     key_expression = None
+    _index = None
+    _index_settings = None
 
     @classmethod
     def get_key_expression(cls):
@@ -409,6 +518,8 @@ class Duplicates(SongsMenuPlugin, PluginConfigMixin):
             (cls._CFG_REMOVE_DIACRITICS, _("Remove _Diacritics")),
             (cls._CFG_REMOVE_PUNCTUATION, _("Remove _Punctuation")),
             (cls._CFG_CASE_INSENSITIVE, _("Case _Insensitive")),
+            (cls._CFG_FIND_SIMILAR,
+             _("Include songs with _similar title, artist and length")),
         ]
         vb2 = Gtk.VBox(spacing=6)
         for key, label in toggles:
@@ -422,38 +533,86 @@ class Duplicates(SongsMenuPlugin, PluginConfigMixin):
         vb.show_all()
         return vb
 
+    @classmethod
+    def get_key_func(cls):
+        """Returns a function computing the duplicate key of a song,
+        for the current settings.
+        """
+
+        expression = cls.get_key_expression()
+        diacritics = cls.config_get_bool(cls._CFG_REMOVE_DIACRITICS)
+        case = cls.config_get_bool(cls._CFG_CASE_INSENSITIVE)
+        punctuation = cls.config_get_bool(cls._CFG_REMOVE_PUNCTUATION)
+        whitespace = cls.config_get_bool(cls._CFG_REMOVE_WHITESPACE)
+
+        def get_key(song):
+            key = song(expression)
+            if diacritics:
+                key = remove_diacritics(key)
+            if case:
+                key = key.lower()
+            if punctuation:
+                key = remove_punctuation(key)
+            if whitespace:
+                key = "_".join(key.split())
+            return key
+
+        return get_key
+
     @classmethod
     def get_key(cls, song):
-        key = song(cls.get_key_expression())
-        if cls.config_get_bool(cls._CFG_REMOVE_DIACRITICS):
-            key = remove_diacritics(key)
-        if cls.config_get_bool(cls._CFG_CASE_INSENSITIVE):
-            key = key.lower()
-        if cls.config_get_bool(cls._CFG_REMOVE_PUNCTUATION):
-            key = remove_punctuation(key)
-        if cls.config_get_bool(cls._CFG_REMOVE_WHITESPACE):
-            key = "_".join(key.split())
-        return key
+        return cls.get_key_func()(song)
+
+    @classmethod
+    def get_index(cls, library):
+        """Returns the duplicate index for the library and the current
+        settings, creating it if needed.
+        """
+
+        settings = (cls.get_key_expression(),
+                    cls.config_get_bool(cls._CFG_REMOVE_DIACRITICS),
+                    cls.config_get_bool(cls._CFG_CASE_INSENSITIVE),
+                    cls.config_get_bool(cls._CFG_REMOVE_PUNCTUATION),
+                    cls.config_get_bool(cls._CFG_REMOVE_WHITESPACE))
+        index = cls._index
+        if index is None or index.library is not library or \
+                cls._index_settings != settings:
+            if index is not None:
+                index.destroy()
+            cls._index = index = DuplicateIndex(library, cls.get_key_func())
+            cls._index_settings = settings
+        return index
+
+    @classmethod
+    def destroy_index(cls):
+        """Disconnects the duplicate index from the library and frees it"""
+
+        if cls._index is not None:
+            cls._index.destroy()
+            cls._index = None
+            cls._index_settings = None
+
+    def disabled(self):
+        self.destroy_index()
 
     def plugin_songs(self, songs):
         model = DuplicatesTreeModel()
+        index = self.get_index(app.library)
+        find_similar = self.config_get_bool(self._CFG_FIND_SIMILAR)
 
-        # Index all songs by our custom key
-        # TODO: make this cache-friendly
         print_d("Calculating duplicates for %d song(s)..." % len(songs))
         groups = {}
         for song in songs:
-            key = self.get_key(song)
-            if key and key in groups:
-                print_d("Found duplicate based on '%s'" % key)
-                groups[key].add(song._song)
-            elif key:
-                groups[key] = {song._song}
-
-        for song in app.library:
-            key = self.get_key(song)
-            if key in groups:
-                groups[key].add(song)
+            song = song._song
+            key = index.get_key(song)
+            if not key:
+                continue
+            group = groups.setdefault(key, set())
+            group.add(song)
+            group.update(index.get_group(key))
+            if find_similar:
+                group.update(
+                    index.get_similar(song, self.LENGTH_TOLERANCE))
 
         # Now display the grouped duplicates
         for (key, children) in groups.items():
@@ -11,8 +11,13 @@ from ._audio import PEOPLE, AudioFile, DUMMY_SONG, decode_value, \
 from ._image import EmbeddedImage, APICType
 from ._misc import AudioFileError, init, MusicFile, types, loaders, filter, \
     mimes
-from ._serialize import load_audio_files, dump_audio_files, SerializationError
+from ._serialize import load_audio_files, dump_audio_files, \
+    SerializationError, load_audio_files_columnar, dump_audio_files_columnar, \
+    is_columnar
+from ._parallel import load_music_files
 
 AudioFile, AudioFileError, EmbeddedImage, DUMMY_SONG, PEOPLE, decode_value,
 APICType, FILESYSTEM_TAGS, TIME_TAGS, init, MusicFile, types, loaders, filter,
-mimes, load_audio_files, dump_audio_files, SerializationError
+mimes, load_audio_files, dump_audio_files, SerializationError,
+load_audio_files_columnar, dump_audio_files_columnar, is_columnar,
+load_music_files
@@ -130,7 +130,7 @@ class APEv2File(AudioFile):
                     key.lower() not in self.TRANS and
                     mutagen.apev2.is_valid_apev2_key(self.__titlecase(key)))
 
-    def write(self):
+    def write_file(self):
         with translate_errors():
             try:
                 tag = mutagen.apev2.APEv2(self['~filename'])
@@ -155,7 +155,6 @@ class APEv2File(AudioFile):
 
         with translate_errors():
             tag.save(self["~filename"])
-        self.sanitize()
 
     def get_primary_image(self):
         try:
@@ -13,8 +13,9 @@
 import os
 import re
 import shutil
+import sys
 import time
-from typing import Any, List, Tuple, Generic, TypeVar, Optional
+from typing import Any, List, Tuple, Generic, TypeVar, Optional, Dict
 from collections import OrderedDict
 from itertools import zip_longest
 
@@ -32,6 +33,7 @@ from quodlibet.util import iso639
 from quodlibet.util import human_sort_key as human, capitalize
 
 from quodlibet.util.tags import TAG_ROLES, TAG_TO_SORT
+from quodlibet.unisearch import fold
 
 from ._image import ImageContainer
 from ._misc import AudioFileError, translate_errors
@@ -74,6 +76,40 @@ PEOPLE_SORT = [TAG_TO_SORT.get(k, k) for k in PEOPLE]
 VARIOUS_ARTISTS_VALUES = 'V.A.', 'various artists', 'Various Artists'
 """Values for ~people representing lots of people, most important last"""
 
+SHARED_VALUE_TAGS = {
+    "album", "albumartist", "albumartistsort", "albumsort", "artist",
+    "artistsort", "arranger", "composer", "composersort", "conductor",
+    "date", "discnumber", "discsubtitle", "encodedby", "encoder", "genre",
+    "grouping", "label", "language", "lyricist", "media", "organization",
+    "originaldate", "performer", "releasecountry", "releasestatus",
+    "releasetype", "tracknumber", "~codec", "~encoding", "~format",
+    "~mountpoint", "~#bitdepth", "~#channels", "~#samplerate",
+}
+"""Tags with values repeating across many songs, which get shared"""
+
+_shared_ints: Dict[int, int] = {}
+"""Shared integer values, the numeric tags above only have a few distinct
+values so this stays small"""
+
+
+def intern_tag(key: str, value: Any) -> Tuple[str, Any]:
+    """Returns the key and value to store in an `AudioFile`, so that
+    songs share one instance of equal keys and, for `SHARED_VALUE_TAGS`,
+    equal string and integer values.
+
+    Strings get interned with sys.intern(), so values no longer used by
+    any song get freed.
+    """
+
+    if type(key) is str:
+        key = sys.intern(key)
+    if key in SHARED_VALUE_TAGS:
+        if type(value) is str:
+            value = sys.intern(value)
+        elif type(value) is int:
+            value = _shared_ints.setdefault(value, value)
+    return key, value
+
 
 def decode_value(tag, value):
     """Returns a unicode representation of the passed value, based on
@@ -185,6 +221,35 @@ class AudioFile(dict, ImageContainer, HasKey):
             return lambda song: song(tag, 0)
         return lambda song: human(song(tag))
 
+    def search_text(self, keys: Tuple[str, ...]) -> str:
+        """Returns the values of `keys` folded with `unisearch.fold` and
+        joined by newlines, for diacritic insensitive text searches.
+
+        Cached until the song changes, so only pass keys which don't depend
+        on anything but the song: real tags or FILESYSTEM_TAGS.
+        """
+
+        cache = self.__dict__.setdefault("_search_text", {})
+        try:
+            return cache[keys]
+        except KeyError:
+            pass
+
+        values = []
+        for key in keys:
+            if key in FILESYSTEM_TAGS:
+                values.append(fsn2text(self(key, fsnative())))
+                continue
+            value = self.get(key)
+            if value is None:
+                if key in ("filename", "mountpoint"):
+                    value = fsn2text(self.get("~" + key, fsnative()))
+                else:
+                    value = self.get("~" + key, u"")
+            values.append(value)
+        text = cache[keys] = fold("\n".join(values))
+        return text
+
     def __getstate__(self):
         """Don't pickle anything from __dict__"""
         pass
@@ -208,11 +273,13 @@ class AudioFile(dict, ImageContainer, HasKey):
         else:
             value = str(value)
 
+        key, value = intern_tag(key, value)
         dict.__setitem__(self, key, value)
 
         pop = self.__dict__.pop
         pop("album_key", None)
         pop("sort_key", None)
+        pop("_search_text", None)
 
     def __delitem__(self, key):
         dict.__delitem__(self, key)
@@ -220,6 +287,7 @@ class AudioFile(dict, ImageContainer, HasKey):
         pop = self.__dict__.pop
         pop("album_key", None)
         pop("sort_key", None)
+        pop("_search_text", None)
 
     @property
     def key(self) -> K:  # type: ignore
@@ -1079,7 +1147,21 @@ class AudioFile(dict, ImageContainer, HasKey):
             return min(15, scale)
 
     def write(self):
-        """Write metadata back to the file.
+        """Write metadata back to the file and update the file
+        information, see write_file() and sanitize().
+
+        Raises:
+            AudioFileError: in case writing fails
+        """
+
+        self.write_file()
+        self.sanitize()
+
+    def write_file(self):
+        """Write metadata back to the file, without changing the song.
+
+        Can be called from another thread as long as the song doesn't
+        change meanwhile. sanitize() has to be called afterwards.
 
         Raises:
             AudioFileError: in case writing fails
@@ -273,7 +273,7 @@ class ID3File(AudioFile):
             return False
         return ("POPM:" + email) in audio.tags
 
-    def write(self):
+    def write_file(self):
         with translate_errors():
             audio = self.Kind(self['~filename'])
 
@@ -439,7 +439,6 @@ class ID3File(AudioFile):
 
         with translate_errors():
             audio.save()
-        self.sanitize()
 
     can_change_images = True
 
@@ -0,0 +1,111 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+"""Loading of many music files in worker processes.
+
+Parsing tags is CPU bound, so for large imports the files get loaded in
+batches by a pool of processes. The loaded songs get sent back to the
+main process in the columnar library format.
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+from quodlibet.util.dprint import print_d, print_w
+from ._misc import MusicFile
+from ._serialize import dump_audio_files_columnar, \
+    load_audio_files_columnar, SerializationError
+
+
+def _init_worker(config_file):
+    from quodlibet import config
+    from quodlibet.formats import init
+
+    config.init_defaults()
+    if config_file is not None:
+        config.init(config_file)
+    init()
+
+
+def _load(filenames):
+    return [s for s in map(MusicFile, filenames) if s is not None]
+
+
+def _load_batch(filenames):
+    songs = _load(filenames)
+    try:
+        return dump_audio_files_columnar(songs)
+    except SerializationError:
+        # let multiprocessing pickle them instead
+        return songs
+
+
+def _get_songs(result):
+    if isinstance(result, list):
+        return result
+    return load_audio_files_columnar(result)
+
+
+def load_music_files(filenames, processes, config_file=None,
+                     batch_size=100, poll_interval=0.015):
+    """Loads the files using `MusicFile` in `processes` worker processes.
+
+    Yields (files done, loaded songs) tuples as batches finish, in any
+    order. While waiting for the workers it yields (files done, []) every
+    `poll_interval` seconds, so it can be used in a copool. Closing the
+    generator cancels all pending batches.
+
+    Files get loaded in this process if there is at most one batch,
+    `processes` is 1 or worker processes can't be used.
+
+    `config_file` gets loaded in the workers, the file loaders depend on
+    some settings.
+    """
+
+    filenames = list(filenames)
+    batches = [filenames[i:i + batch_size]
+               for i in range(0, len(filenames), batch_size)]
+
+    done = 0
+    if processes > 1 and len(batches) > 1:
+        workers = min(processes, len(batches))
+        try:
+            executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker, initargs=(config_file,))
+        except (OSError, ValueError) as e:
+            print_w(f"Can't start worker processes: {e}")
+        else:
+            print_d(f"Loading {len(filenames)} files in {workers} processes")
+            batches.reverse()
+            pending = {}
+            try:
+                while batches or pending:
+                    # keep the workers busy, but don't queue up everything
+                    while batches and len(pending) < 2 * workers:
+                        batch = batches.pop()
+                        pending[executor.submit(_load_batch, batch)] = batch
+                    finished, _ = wait(pending, timeout=poll_interval,
+                                       return_when=FIRST_COMPLETED)
+                    if not finished:
+                        yield done, []
+                    for future in finished:
+                        songs = _get_songs(future.result())
+                        done += len(pending.pop(future))
+                        yield done, songs
+            except BrokenProcessPool:
+                print_w("Worker process died, loading remaining files here")
+                batches.extend(pending.values())
+                pending.clear()
+            finally:
+                for future in pending:
+                    future.cancel()
+                executor.shutdown(wait=False)
+
+    for batch in batches:
+        done += len(batch)
+        yield done, _load(batch)
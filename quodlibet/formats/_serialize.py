@@ -7,12 +7,18 @@
 
 """Code for serializing AudioFile instances"""
 
+import array
+import bisect
+import importlib
 import pickle
+import struct
+import sys
+
 from senf import bytes2fsn, fsn2bytes
 
 from quodlibet.util.picklehelper import pickle_loads, pickle_dumps
 from quodlibet.util import is_windows
-from ._audio import AudioFile
+from ._audio import AudioFile, intern_tag, SHARED_VALUE_TAGS
 
 
 class SerializationError(Exception):
@@ -53,11 +59,21 @@ def _py2_to_py3(items):
                 except UnicodeEncodeError:
                     v = v.encode("utf-8", "replace").decode("utf-8")
 
+            k, v = intern_tag(k, v)
             i[k] = v
 
     return items
 
 
+def _intern_tags(items):
+    for i in items:
+        l = list(i.items())
+        i.clear()
+        for k, v in l:
+            k, v = intern_tag(k, v)
+            i[k] = v
+
+
 def _py3_to_py2(items):
     is_win = is_windows()
 
@@ -130,6 +146,8 @@ def load_audio_files(data, process=True):
 
     if process:
         items = _py2_to_py3(items)
+    else:
+        _intern_tags(items)
 
     try:
         for i in items:
@@ -159,3 +177,370 @@ def dump_audio_files(item_list, process=True):
         return pickle_dumps(item_list, 2)
     except pickle.PicklingError as e:
         raise SerializationError(e)
+
+
+COLUMNAR_MAGIC = b"QLCOLUMN"
+"""Magic bytes at the start of a columnar library file"""
+
+COLUMNAR_VERSION = 1
+"""Version of the columnar format, increase on incompatible changes"""
+
+_HEADER = struct.Struct("<8sIIIII")
+"""magic, version, items, strings, classes, columns"""
+
+_COLUMN = struct.Struct("<IIQQQ")
+"""key string id, value type, entry count, rows offset, values offset"""
+
+_TYPE_STR, _TYPE_INT, _TYPE_FLOAT = range(3)
+
+_DATA_ERRORS = (struct.error, ValueError, TypeError, IndexError, KeyError)
+"""Errors raised while reading a truncated or otherwise broken file"""
+
+_TYPE_CODES = {
+    _TYPE_STR: "I",
+    _TYPE_INT: "q",
+    _TYPE_FLOAT: "d",
+}
+
+
+def is_columnar(data):
+    """If the passed bytes-like object starts like a columnar library file"""
+
+    return bytes(data[:len(COLUMNAR_MAGIC)]) == COLUMNAR_MAGIC
+
+
+def _align(buf):
+    buf.extend(b"\x00" * (-len(buf) % 8))
+
+
+def _append_array(buf, type_code, values):
+    """Appends values as little endian array and returns the start offset"""
+
+    _align(buf)
+    offset = len(buf)
+    arr = array.array(type_code, values)
+    if sys.byteorder != "little":
+        arr.byteswap()
+    buf.extend(arr.tobytes())
+    return offset
+
+
+def dump_audio_files_columnar(item_list):
+    """Serializes a list of AudioFiles into the columnar format.
+
+    All tag keys, class names and string values get interned in a shared
+    string table and the values are stored per (tag, type) column, so the
+    result can be memory mapped and loaded without unpickling.
+
+    Returns:
+        bytes
+    Raises:
+        SerializationError: in case a value can't be represented, use
+            dump_audio_files() in that case
+    """
+
+    assert isinstance(item_list, list)
+
+    strings = {}
+    classes = {}
+    columns = {}
+    item_classes = array.array("I")
+
+    def intern(s):
+        try:
+            return strings[s]
+        except KeyError:
+            return strings.setdefault(s, len(strings))
+
+    try:
+        for row, item in enumerate(item_list):
+            cls = type(item)
+            if cls not in classes:
+                classes[cls] = len(classes)
+            item_classes.append(classes[cls])
+
+            for key, value in item.items():
+                if not isinstance(key, str):
+                    raise SerializationError("invalid key %r" % key)
+                value_type = type(value)
+                if value_type is int:
+                    if not -2 ** 63 <= value < 2 ** 63:
+                        raise SerializationError("int out of range %r" % value)
+                    type_ = _TYPE_INT
+                elif value_type is float:
+                    type_ = _TYPE_FLOAT
+                elif isinstance(value, str):
+                    type_ = _TYPE_STR
+                    value = intern(value)
+                else:
+                    raise SerializationError("invalid value %r" % value)
+
+                column = (intern(key), type_)
+                if column not in columns:
+                    columns[column] = ([], [])
+                rows, values = columns[column]
+                rows.append(row)
+                values.append(value)
+    except RuntimeError as e:
+        # dict changed size during iteration
+        raise SerializationError(e)
+
+    class_ids = [intern(cls.__module__ + ":" + cls.__qualname__)
+                 for cls in classes]
+
+    buf = bytearray(_HEADER.size)
+    encoded = [s.encode("utf-8", "surrogatepass") for s in strings]
+    string_offsets = [0]
+    for data in encoded:
+        string_offsets.append(string_offsets[-1] + len(data))
+    offsets_offset = _append_array(buf, "Q", string_offsets)
+    blob_offset = len(buf)
+    buf.extend(b"".join(encoded))
+    classes_offset = _append_array(buf, "I", class_ids)
+    items_offset = _append_array(buf, "I", item_classes)
+
+    descriptors = []
+    for (key_id, type_), (rows, values) in columns.items():
+        rows_offset = _append_array(buf, "I", rows)
+        values_offset = _append_array(buf, _TYPE_CODES[type_], values)
+        descriptors.append(_COLUMN.pack(
+            key_id, type_, len(rows), rows_offset, values_offset))
+
+    _align(buf)
+    toc_offset = len(buf)
+    buf.extend(struct.pack(
+        "<QQQQ", offsets_offset, blob_offset, classes_offset, items_offset))
+    buf.extend(b"".join(descriptors))
+
+    _HEADER.pack_into(
+        buf, 0, COLUMNAR_MAGIC, COLUMNAR_VERSION, len(item_list),
+        len(strings), len(classes), len(columns))
+    buf.extend(struct.pack("<Q", toc_offset))
+    return bytes(buf)
+
+
+class ColumnarAudioFiles:
+    """Read access to a columnar library file without unpickling.
+
+    Takes a bytes-like object, usually a `mmap.mmap` of the library file.
+    Strings are decoded on first access and single columns can be read
+    without creating any AudioFile instances. Call `materialize()` to
+    get all items or index the reader to get a single one.
+
+    The reader keeps views into the passed buffer, so `close()` has to be
+    called (or the instance used as a context manager) before the buffer
+    can be closed.
+
+    Raises:
+        SerializationError: if the data isn't a valid columnar file
+    """
+
+    def __init__(self, data):
+        self._views = []
+        self._types_cache = None
+        self._data = self._view(data, "B")
+        try:
+            self._parse()
+        except _DATA_ERRORS as e:
+            self.close()
+            raise SerializationError(e)
+
+    def _view(self, data, type_code, offset=0, count=None):
+        view = memoryview(data)
+        self._views.append(view)
+        if type_code == "B":
+            return view
+        size = array.array(type_code).itemsize
+        if count is None:
+            count = (len(view) - offset) // size
+        end = offset + count * size
+        if end > len(view):
+            raise ValueError("truncated data")
+        if sys.byteorder != "little":
+            arr = array.array(type_code, view[offset:end])
+            arr.byteswap()
+            return arr
+        sub = view[offset:end]
+        self._views.append(sub)
+        typed = sub.cast(type_code)
+        self._views.append(typed)
+        return typed
+
+    def _parse(self):
+        data = self._data
+        magic, version, n_items, n_strings, n_classes, n_columns = \
+            _HEADER.unpack_from(data, 0)
+        if magic != COLUMNAR_MAGIC:
+            raise SerializationError("not a columnar library file")
+        if version != COLUMNAR_VERSION:
+            raise SerializationError("unsupported version %d" % version)
+
+        toc_offset, = struct.unpack_from("<Q", data, len(data) - 8)
+        offsets_offset, self._blob_offset, classes_offset, items_offset = \
+            struct.unpack_from("<QQQQ", data, toc_offset)
+
+        self._string_offsets = self._view(
+            data, "Q", offsets_offset, n_strings + 1)
+        self._strings = [None] * n_strings
+        self._class_ids = self._view(data, "I", classes_offset, n_classes)
+        self._item_classes = self._view(data, "I", items_offset, n_items)
+
+        self._columns = []
+        for i in range(n_columns):
+            key_id, type_, count, rows_offset, values_offset = \
+                _COLUMN.unpack_from(data, toc_offset + 32 + i * _COLUMN.size)
+            rows = self._view(data, "I", rows_offset, count)
+            values = self._view(
+                data, _TYPE_CODES[type_], values_offset, count)
+            self._columns.append((key_id, type_, rows, values))
+
+    def close(self):
+        """Releases all views into the underlying buffer"""
+
+        for view in reversed(self._views):
+            if isinstance(view, memoryview):
+                view.release()
+        del self._views[:]
+        self._columns = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self._item_classes)
+
+    def _string(self, index):
+        """Returns the string with the given string table index"""
+
+        value = self._strings[index]
+        if value is None:
+            offsets = self._string_offsets
+            start = self._blob_offset + offsets[index]
+            end = self._blob_offset + offsets[index + 1]
+            value = self._strings[index] = str(
+                self._data[start:end], "utf-8", "surrogatepass")
+        return value
+
+    def _types(self):
+        """Returns a list of AudioFile types (or None if not found) for each
+        class table entry.
+        """
+
+        if self._types_cache is not None:
+            return self._types_cache
+
+        types = []
+        for string_id in self._class_ids:
+            module, name = self._string(string_id).split(":", 1)
+            try:
+                real_type = importlib.import_module(module)
+                for part in name.split("."):
+                    real_type = getattr(real_type, part)
+            except (ImportError, AttributeError):
+                real_type = None
+            else:
+                if not (isinstance(real_type, type) and
+                        issubclass(real_type, AudioFile)):
+                    real_type = None
+            types.append(real_type)
+        self._types_cache = types
+        return types
+
+    def _value(self, type_, value):
+        if type_ == _TYPE_STR:
+            return self._string(value)
+        return value
+
+    def column(self, key):
+        """Returns a dict mapping item indices to the values of `key`,
+        without loading the other tags.
+        """
+
+        result = {}
+        for key_id, type_, rows, values in self._columns:
+            if self._string(key_id) != key:
+                continue
+            if type_ == _TYPE_STR:
+                string = self._string
+                result.update(zip(rows, map(string, values)))
+            else:
+                result.update(zip(rows, values))
+        return result
+
+    def __getitem__(self, index):
+        """Creates the item at `index`.
+
+        Raises:
+            IndexError
+            SerializationError: if the type of the item isn't available
+        """
+
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+
+        real_type = self._types()[self._item_classes[index]]
+        if real_type is None:
+            raise SerializationError("type lookup failed")
+        item = dict.__new__(real_type)
+        for key_id, type_, rows, values in self._columns:
+            pos = bisect.bisect_left(rows, index)
+            if pos < len(rows) and rows[pos] == index:
+                dict.__setitem__(item, *intern_tag(
+                    self._string(key_id), self._value(type_, values[pos])))
+        return item
+
+    def materialize(self):
+        """Creates all items, filling them column by column.
+
+        In case some types can't be found the respective items get skipped.
+
+        Returns:
+            List[AudioFile]
+        Raises:
+            SerializationError: if all type lookups failed
+        """
+
+        types = self._types()
+        items = [dict.__new__(types[c]) if types[c] is not None else None
+                 for c in self._item_classes]
+
+        setitem = dict.__setitem__
+        for key_id, type_, rows, values in self._columns:
+            key = sys.intern(self._string(key_id))
+            if type_ == _TYPE_STR:
+                values = map(self._string, values)
+            if key in SHARED_VALUE_TAGS:
+                values = (intern_tag(key, v)[1] for v in values)
+            for row, value in zip(rows, values):
+                item = items[row]
+                if item is not None:
+                    setitem(item, key, value)
+
+        if None in types:
+            items = [i for i in items if i is not None]
+            if not items:
+                raise SerializationError(
+                    "all class lookups failed. something is wrong")
+
+        return items
+
+
+def load_audio_files_columnar(data):
+    """Loads all AudioFiles from a columnar library file.
+
+    Args:
+        data (bytes-like): e.g. bytes or a `mmap.mmap`
+    Returns:
+        List[AudioFile]
+    Raises:
+        SerializationError
+    """
+
+    with ColumnarAudioFiles(data) as reader:
+        try:
+            return reader.materialize()
+        except _DATA_ERRORS as e:
+            raise SerializationError(e)
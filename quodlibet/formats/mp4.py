@@ -112,7 +112,7 @@ class MP4File(AudioFile):
                 self.has_images = True
         self.sanitize(filename)
 
-    def write(self):
+    def write_file(self):
         with translate_errors():
             audio = MP4(self["~filename"])
 
@@ -142,7 +142,6 @@ class MP4File(AudioFile):
             audio["disk"] = [(disc, discs)]
         with translate_errors():
             audio.save()
-        self.sanitize()
 
     def can_multiple_values(self, key=None):
         if key is None:
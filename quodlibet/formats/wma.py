@@ -122,7 +122,7 @@ class WMAFile(AudioFile):
             self[name] = u"\n".join(map(str, values))
         self.sanitize(filename)
 
-    def write(self):
+    def write_file(self):
         with translate_errors():
             audio = mutagen.asf.ASF(self["~filename"])
         for key in self.__translate.keys():
@@ -139,7 +139,6 @@ class WMAFile(AudioFile):
             audio.tags[name] = self.list(key)
         with translate_errors():
             audio.save()
-        self.sanitize()
 
     def can_multiple_values(self, key=None):
         if key is None:
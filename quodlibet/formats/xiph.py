@@ -304,7 +304,7 @@ class MutagenVCFile(AudioFile):
             return False
         return 'rating:' + email in tags and 'playcount:' + email in tags
 
-    def write(self):
+    def write_file(self):
         with translate_errors():
             audio = self.MutagenType(self["~filename"])
         if audio.tags is None:
@@ -323,7 +323,6 @@ class MutagenVCFile(AudioFile):
 
         with translate_errors():
             audio.save()
-        self.sanitize()
 
 extensions = []
 ogg_formats = []
@@ -482,11 +481,11 @@ class FLACFile(MutagenVCFile):
 
         self.has_images = True
 
-    def write(self):
+    def write_file(self):
         if ID3 is not None:
             with translate_errors():
                 ID3().delete(filename=self["~filename"])
-        super().write()
+        super().write_file()
 
 types = []
 for var in list(globals().values()):
@@ -19,6 +19,7 @@ from quodlibet import print_d
 
 from quodlibet.library.song import SongLibrary, SongFileLibrary
 from quodlibet.library.librarians import SongLibrarian
+from quodlibet.library.journal import journal_path
 from quodlibet.util.path import mtime
 
 
@@ -51,5 +52,6 @@ def save(save_period=None):
         if not filename or not lib.dirty:
             continue
 
-        if not save_period or abs(time.time() - mtime(filename)) > save_period:
+        last_save = max(mtime(filename), mtime(journal_path(filename)))
+        if not save_period or abs(time.time() - last_save) > save_period:
             lib.save()
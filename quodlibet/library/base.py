@@ -8,22 +8,28 @@
 # (at your option) any later version.
 
 
+import mmap
 import os
 import shutil
-from typing import (Collection, TypeVar, Sequence, Iterable,
-                    Optional, Iterator, Generic, MutableMapping, Tuple, Set)
+import threading
+import time
+from typing import (Collection, TypeVar, Sequence, Iterable, Optional,
+                    Iterator, Generic, MutableMapping, Tuple, Set, Dict, List)
 
 from gi.repository import GObject
 
 import quodlibet
 from quodlibet import util
-from quodlibet.formats import (load_audio_files,
-                               dump_audio_files, SerializationError)
+from quodlibet.formats import (load_audio_files, dump_audio_files,
+                               SerializationError, load_audio_files_columnar,
+                               dump_audio_files_columnar, is_columnar)
 from quodlibet.formats._audio import HasKey
+from quodlibet.library import journal
 from quodlibet.util.atomic import atomic_save
 from quodlibet.util.collections import DictMixin
 from quodlibet.util.dprint import print_d, print_w
 from quodlibet.util.path import (mkdir, ishidden)
+from quodlibet.util.picklehelper import pickle_loads, pickle_dumps, PickleError
 from senf import fsnative
 
 K = TypeVar("K", covariant=True)
@@ -207,18 +213,27 @@ class Library(GObject.GObject, DictMixin, Generic[K, V]):
 def _load_items(filename) -> Iterable[V]:
     """Load items from disk.
 
-    In case of an error returns default or an empty list.
+    In case of an error returns None.
     """
 
     try:
         with open(filename, "rb") as fp:
+            if is_columnar(fp.read(8)):
+                with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    loader = lambda: load_audio_files_columnar(mm)
+                    return _load_serialized(filename, loader)
+            fp.seek(0)
             data = fp.read()
     except EnvironmentError:
         print_w("Couldn't load library file from: %r" % filename)
-        return []
+        return None
 
+    return _load_serialized(filename, lambda: load_audio_files(data))
+
+
+def _load_serialized(filename, loader) -> Iterable[V]:
     try:
-        items = load_audio_files(data)
+        items = loader()
     except SerializationError:
         # there are too many ways this could fail
         util.print_exc()
@@ -229,7 +244,7 @@ def _load_items(filename) -> Iterable[V]:
         except EnvironmentError:
             util.print_exc()
 
-        return []
+        return None
 
     return items
 
@@ -239,36 +254,74 @@ class PicklingMixin:
 
     filename = None
 
+    columnar = True
+    """Save in the columnar format, or as pickle (readable by older versions).
+    Loading supports both."""
+
+    journaling = True
+    """Once loaded or saved, write changes to an append-only journal next to
+    the library file instead of rewriting it on every save"""
+
+    journal_compact_ratio = 0.5
+    """Rewrite the library file in the background once the journal exceeds
+    this fraction of its size"""
+
+    _journal_items: Optional[Set] = None
+    """Added/changed items since the last save, None if not journaling"""
+
+    _journal_keys: Optional[Set] = None
+    """Keys of removed/renamed items since the last save"""
+
+    _compaction: Optional[threading.Thread] = None
+
     def load(self, filename):
-        """Load a library from a file, containing a picked list.
+        """Load a library from a file, containing a columnar or picked list.
 
         Loading does not cause added, changed, or removed signals.
+
+        Returns False if the file couldn't be loaded.
         """
 
         self.filename = filename
         print_d("Loading contents of %r." % filename, self)
 
         items = _load_items(filename)
+        loaded = items is not None
+        if not loaded:
+            items = []
+        if self.journaling:
+            items = journal.replay(filename, items)
 
         # this loads all items without checking their validity, but makes
         # sure that non-mounted items are masked
         self._load_init(items)
+        self._journal_start()
 
         print_d(f"Done loading contents of {filename!r}", self._name)
+        return loaded
 
     def save(self, filename=None):
-        """Save the library to the given filename, or the default if `None`"""
+        """Save the library to the given filename, or the default if `None`.
+
+        Saving to the default file only appends the changes since the last
+        save to the journal, if possible.
+        """
 
         if filename is None:
             filename = self.filename
 
+        self._journal_wait()
+        if filename == self.filename and self._journal_save(filename):
+            return
+
         print_d(f"Saving contents to {filename!r}", self._name)
 
         try:
             dirname = os.path.dirname(filename)
             mkdir(dirname)
+            data = self._dump(self.get_content())
             with atomic_save(filename, "wb") as fileobj:
-                fileobj.write(dump_audio_files(self.get_content()))
+                fileobj.write(data)
         except SerializationError:
             # Can happen when we try to pickle while the library is being
             # modified, like in the periodic 15min save.
@@ -278,9 +331,226 @@ class PicklingMixin:
             print_w(f"Couldn't save library to path {filename!r}")
         else:
             self.dirty = False
+            if filename == self.filename:
+                journal.remove(filename)
+                self._journal_start()
+
+    def _journal_start(self):
+        """Start recording changes for the journal, or forget the recorded
+        ones if already started.
+        """
+
+        if not self.journaling:
+            return
+        if self._journal_items is not None:
+            self._journal_items.clear()
+            self._journal_keys.clear()
+            return
+        self._journal_items = set()
+        self._journal_keys = set()
+        self.connect('added', self.__journal_changed)
+        self.connect('changed', self.__journal_changed)
+        self.connect('removed', self.__journal_removed)
+
+    def __journal_changed(self, library, items):
+        self._journal_items.update(items)
 
+    def __journal_removed(self, library, items):
+        self._journal_keys.update(item.key for item in items)
 
-def iter_paths(root, exclude=[], skip_hidden=True):
+    def _journal_update(self, keys=(), items=()):
+        """Record changes not announced through signals, like items no
+        longer stored under `keys` (e.g. after a rename) or changed `items`.
+        """
+
+        if self._journal_items is not None:
+            self._journal_keys.update(keys)
+            self._journal_items.update(items)
+
+    def _journal_get(self, key):
+        """Returns the item that gets saved for `key` or None"""
+
+        return self._contents.get(key)
+
+    def _journal_save(self, filename):
+        """Append all changes to the journal.
+
+        Returns True if successful, False if a full save is needed.
+        """
+
+        if (self._journal_items is None or not self.journaling
+                or not self.columnar):
+            return False
+
+        try:
+            with open(filename, "rb") as h:
+                # convert pickled libraries first
+                if not is_columnar(h.read(8)):
+                    return False
+                snapshot_size = os.fstat(h.fileno()).st_size
+        except EnvironmentError:
+            return False
+
+        get = self._journal_get
+        keys = [k for k in self._journal_keys if get(k) is None]
+        items = [i for i in self._journal_items if get(i.key) is i]
+        print_d(f"Journaling {len(keys)} removed and {len(items)} changed "
+                f"item(s) for {filename!r}", self._name)
+        try:
+            size = journal.append(filename, keys, items)
+        except SerializationError as e:
+            print_w(f"Couldn't journal changes: {e}", self._name)
+            return False
+        except EnvironmentError:
+            print_w(f"Couldn't write journal for {filename!r}", self._name)
+            return False
+
+        self._journal_items.clear()
+        self._journal_keys.clear()
+        self.dirty = False
+
+        if size > snapshot_size * self.journal_compact_ratio:
+            self._journal_compact(filename)
+        return True
+
+    def _journal_compact(self, filename):
+        """Rewrite the library file in a thread and drop the journal.
+
+        Changes happening in the meantime are recorded as usual and end up
+        in a new journal on the next save.
+        """
+
+        items = self.get_content()
+
+        def compact():
+            print_d(f"Compacting journal into {filename!r}", self._name)
+            try:
+                data = self._dump(items)
+                with atomic_save(filename, "wb") as fileobj:
+                    fileobj.write(data)
+            except SerializationError:
+                util.print_exc()
+            except EnvironmentError:
+                print_w(f"Couldn't save library to path {filename!r}")
+            else:
+                journal.remove(filename)
+
+        self._compaction = threading.Thread(target=compact, daemon=True)
+        self._compaction.start()
+
+    def _journal_wait(self):
+        """Wait for a running compaction to finish"""
+
+        if self._compaction is not None:
+            self._compaction.join()
+            self._compaction = None
+
+    def _dump(self, items):
+        if self.columnar:
+            try:
+                return dump_audio_files_columnar(items)
+            except SerializationError as e:
+                print_w(f"Falling back to pickle: {e}", self._name)
+        return dump_audio_files(items)
+
+
+class DirectoryCache:
+    """Remembers the modification time, the subdirectories and the files of
+    scanned directories.
+
+    A directory with an unchanged modification time still has the same
+    entries, so `iter_paths` doesn't have to list it again and yields the
+    cached files instead. Changes of the files themselves aren't covered;
+    they don't touch the directory.
+
+    New states only get used after commit(), which should be called once
+    all found files were handled.
+    """
+
+    VERSION = 2
+
+    RACY_SECONDS = 2
+    """Directories changed more recently than this could change again
+    without their mtime changing, so they don't get cached"""
+
+    def __init__(self):
+        self._options = None
+        self._dirs: Dict[
+            fsnative, Tuple[int, List[fsnative], List[fsnative]]] = {}
+        self._pending: Dict[
+            fsnative, Tuple[int, List[fsnative], List[fsnative]]] = {}
+        self._roots: Set[fsnative] = set()
+        self.dirty = False
+
+    def begin(self, root, options):
+        """Starts a scan of `root`. `options` are the scan options, the
+        cache gets cleared if they differ from the last ones.
+        """
+
+        if options != self._options:
+            self._options = options
+            self._dirs.clear()
+            self._pending.clear()
+            self._roots.clear()
+        self._roots.add(root)
+
+    def get(self, path, mtime_ns):
+        """Returns (subdirectory names, file paths) of `path` if it wasn't
+        changed, or None
+        """
+
+        entry = self._dirs.get(path)
+        if entry is not None and entry[0] == mtime_ns:
+            self._pending[path] = entry
+            return entry[1:]
+        return None
+
+    def set(self, path, mtime_ns, subdirs, files):
+        if time.time() - mtime_ns / 1e9 > self.RACY_SECONDS:
+            self._pending[path] = (mtime_ns, subdirs, files)
+
+    def commit(self):
+        """Replaces the cached states below the roots passed to begin() with
+        the ones found since then.
+        """
+
+        for root in self._roots:
+            prefix = os.path.join(root, "")
+            for path in [p for p in self._dirs
+                         if p == root or p.startswith(prefix)]:
+                del self._dirs[path]
+        self._dirs.update(self._pending)
+        self._pending.clear()
+        self._roots.clear()
+        self.dirty = True
+
+    def load(self, filename):
+        try:
+            with open(filename, "rb") as h:
+                version, options, dirs = pickle_loads(h.read())
+        except FileNotFoundError:
+            return
+        except (EnvironmentError, PickleError, ValueError, TypeError):
+            print_w(f"Couldn't load directory cache {filename!r}")
+            return
+        if version == self.VERSION:
+            self._options = options
+            self._dirs = dirs
+
+    def save(self, filename):
+        if not self.dirty:
+            return
+        try:
+            data = pickle_dumps((self.VERSION, self._options, self._dirs), 2)
+            with atomic_save(filename, "wb") as h:
+                h.write(data)
+        except (EnvironmentError, PickleError):
+            print_w(f"Couldn't save directory cache {filename!r}")
+        else:
+            self.dirty = False
+
+
+def iter_paths(root, exclude=[], skip_hidden=True, dir_cache=None):
     """yields paths contained in root (symlinks dereferenced)
 
     Any path starting with any of the path parts included in exclude
@@ -293,6 +563,9 @@ def iter_paths(root, exclude=[], skip_hidden=True):
         exclude (List[fsnative])
         skip_hidden (bool): Ignore files which are hidden or where any
             of the parent directories are hidden.
+        dir_cache (DirectoryCache): If given, directories which didn't
+            change since the last commit() don't get listed again, their
+            files get yielded from the cache.
     Yields:
         fsnative: absolute dereferenced paths
     """
@@ -310,15 +583,64 @@ def iter_paths(root, exclude=[], skip_hidden=True):
     if skip_hidden and ishidden(root):
         return
 
-    for path, dnames, fnames in os.walk(root):
-        if skip_hidden:
-            dnames[:] = list(filter(
-                lambda d: not ishidden(os.path.join(path, d)), dnames))
-        for filename in fnames:
-            fullfilename = os.path.join(path, filename)
-            if skip(fullfilename):
+    if dir_cache is not None:
+        dir_cache.begin(root, (tuple(exclude), skip_hidden))
+
+    # Only the root and the files themselves can be symlinks, so the
+    # real path of everything else is below the real root
+    root_prefix = os.path.join(root, "")
+    real_prefix = os.path.join(os.path.realpath(root), "")
+
+    dirs = [root]
+    while dirs:
+        path = dirs.pop()
+        cached = None
+        if dir_cache is not None:
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+            cached = dir_cache.get(path, mtime_ns)
+
+        if cached is not None:
+            subdirs, files = cached
+            yield from files
+        else:
+            subdirs = []
+            files = []
+            try:
+                with os.scandir(path) as it:
+                    entries = list(it)
+            except OSError:
                 continue
-            fullfilename = os.path.realpath(fullfilename)
-            if skip(fullfilename):
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if is_dir:
+                    if not entry.is_symlink():
+                        subdirs.append(entry.name)
+                    continue
+
+                fullfilename = entry.path
+                if skip(fullfilename):
+                    continue
+                if entry.is_symlink():
+                    fullfilename = os.path.realpath(fullfilename)
+                else:
+                    fullfilename = \
+                        real_prefix + fullfilename[len(root_prefix):]
+                if skip(fullfilename):
+                    continue
+                files.append(fullfilename)
+                yield fullfilename
+
+            if dir_cache is not None:
+                dir_cache.set(path, mtime_ns, subdirs, files)
+
+        for name in reversed(subdirs):
+            subdir = os.path.join(path, name)
+            if skip_hidden and ishidden(subdir):
                 continue
-            yield fullfilename
+            dirs.append(subdir)
@@ -3,18 +3,45 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
+import os
 import time
 from pathlib import Path
-from typing import Generator, Set, Iterable
+from typing import Generator, Set, Iterable, Dict, List, Tuple
+
+from gi.repository import Gio, GLib
 
 from quodlibet import print_d, print_w, _, formats
 from quodlibet.formats import AudioFileError, AudioFile
-from quodlibet.library.base import iter_paths, Library, PicklingMixin
+from quodlibet.library.base import iter_paths, Library, PicklingMixin, \
+    DirectoryCache
 from quodlibet.qltk.notif import Task
-from quodlibet.util.path import ismount, unexpand, normalize_path
+from quodlibet.util import copool
+from quodlibet.util.path import ismount, unexpand, normalize_path, ishidden
 from senf import fsn2text, fsnative
 
 
+def _file_mtimes(dirname, names):
+    """Returns the mtimes of the files `names` in `dirname`, using one
+    directory listing. Missing files are left out.
+
+    Returns None if the directory can't be listed.
+    """
+
+    mtimes = {}
+    try:
+        with os.scandir(dirname) as it:
+            for entry in it:
+                if entry.name in names:
+                    try:
+                        # free on Windows, a stat() elsewhere
+                        mtimes[entry.name] = entry.stat().st_mtime
+                    except OSError:
+                        pass
+    except OSError:
+        return None
+    return mtimes
+
+
 class FileLibrary(Library[fsnative, AudioFile], PicklingMixin):
     """A library containing items on a local(-ish) filesystem.
 
@@ -25,6 +52,49 @@ class FileLibrary(Library[fsnative, AudioFile], PicklingMixin):
     def __init__(self, name=None):
         super().__init__(name)
         self._masked = {}
+        self._dir_cache = DirectoryCache()
+        self._watcher = None
+
+    def destroy(self):
+        self.unwatch()
+        super().destroy()
+
+    def watch(self, paths: Iterable[fsnative], exclude: Iterable[fsnative] = ()):
+        """Keeps the library up to date with file changes below `paths`,
+        until unwatch() gets called. Replaces any previous watch.
+        """
+
+        self.unwatch()
+        self._watcher = FileLibraryWatcher(self, paths, exclude)
+
+    def unwatch(self):
+        """Stops watching for file changes"""
+
+        if self._watcher is not None:
+            self._watcher.destroy()
+            self._watcher = None
+
+    def load(self, filename):
+        loaded = super().load(filename)
+        dirs_filename = filename + ".dirs"
+        if loaded:
+            self._dir_cache.load(dirs_filename)
+        else:
+            # the cached directories belong to a library we no longer have
+            self._dir_cache = DirectoryCache()
+            try:
+                os.remove(dirs_filename)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                print_w(f"Couldn't remove directory cache {dirs_filename!r}")
+        return loaded
+
+    def save(self, filename=None):
+        super().save(filename)
+        if filename is None or filename == self.filename:
+            if self.filename is not None:
+                self._dir_cache.save(self.filename + ".dirs")
 
     def _load_init(self, items):
         """Add many items to the library, check if the
@@ -162,8 +232,24 @@ class FileLibrary(Library[fsnative, AudioFile], PicklingMixin):
         if cofuncid:
             task.copool(cofuncid)
         changed, removed = set(), set()
-        for i, (key, item) in task.list(enumerate(sorted(self.items()))):
-            if key in self._contents and force or not item.valid():
+        items = sorted(self.items())
+        dir_names = {}
+        for key, item in items:
+            dirname, name = os.path.split(item["~filename"])
+            dir_names.setdefault(dirname, set()).add(name)
+        last_dir, mtimes = None, None
+        for i, (key, item) in task.list(enumerate(items)):
+            # items are sorted, so all of a directory come in a row
+            dirname, name = os.path.split(item["~filename"])
+            if dirname != last_dir:
+                last_dir = dirname
+                mtimes = _file_mtimes(dirname, dir_names[dirname])
+            if mtimes is None:
+                valid = item.valid()
+            else:
+                mtime = item.get("~#mtime", 0)
+                valid = bool(mtime) and mtime == mtimes.get(name, 0)
+            if key in self._contents and force or not valid:
                 self.reload(item, changed, removed)
                 # These numbers are pretty empirical. We should yield more
             # often than we emit signals; that way the main loop stays
@@ -182,7 +268,7 @@ class FileLibrary(Library[fsnative, AudioFile], PicklingMixin):
         if changed:
             self.emit('changed', changed)
 
-        for value in self.scan(paths, exclude, cofuncid):
+        for value in self.scan(paths, exclude, cofuncid, cached=not force):
             yield value
 
     def add_filename(self, filename, add=True):
@@ -193,6 +279,17 @@ class FileLibrary(Library[fsnative, AudioFile], PicklingMixin):
 
         raise NotImplementedError
 
+    def _load_filenames(self, filenames):
+        """Loads the items for the passed filenames, without adding them.
+
+        Yields (number of filenames done, list of loaded items) tuples,
+        possibly with empty lists in between if loading takes a while.
+        """
+
+        for done, filename in enumerate(filenames, 1):
+            item = self.add_filename(filename, False)
+            yield done, ([] if item is None else [item])
+
     def contains_filename(self, filename):
         """Returns if a song for the passed filename is in the library.
 
@@ -202,7 +299,15 @@ class FileLibrary(Library[fsnative, AudioFile], PicklingMixin):
 
         raise NotImplementedError
 
-    def scan(self, paths, exclude=[], cofuncid=None):
+    def scan(self, paths, exclude=[], cofuncid=None, cached=False):
+        """Adds new files found in `paths`.
+
+        If `cached` is True, directories which didn't change since the last
+        cached scan don't get listed again, their files from back then get
+        checked instead.
+        """
+
+        dir_cache = self._dir_cache if cached else None
 
         def need_yield(last_yield=[0]):
             current = time.time()
@@ -227,7 +332,8 @@ class FileLibrary(Library[fsnative, AudioFile], PicklingMixin):
                 if cofuncid:
                     task.copool(cofuncid)
 
-                for real_path in iter_paths(scan_path, exclude=exclude):
+                for real_path in iter_paths(scan_path, exclude=exclude,
+                                            dir_cache=dir_cache):
                     if need_yield():
                         task.pulse()
                         yield
@@ -247,16 +353,17 @@ class FileLibrary(Library[fsnative, AudioFile], PicklingMixin):
                 task.copool(cofuncid)
 
             added = []
-            for real_path in task.gen(paths_to_load):
-                item = self.add_filename(real_path, False)
-                if item is not None:
-                    added.append(item)
-                    if len(added) > 100 or need_added():
-                        self.add(added)
-                        added = []
-                        yield
-                if added and need_yield():
+            for done, items in self._load_filenames(paths_to_load):
+                task.update(done / len(paths_to_load))
+                added.extend(items)
+                if added and (len(added) > 100 or need_added()):
+                    self.add(added)
+                    added = []
                     yield
+                elif need_yield():
+                    yield
+            if dir_cache is not None:
+                dir_cache.commit()
             if added:
                 self.add(added)
                 added = []
@@ -276,6 +383,15 @@ class FileLibrary(Library[fsnative, AudioFile], PicklingMixin):
 
         return items
 
+    def _journal_get(self, key):
+        item = self._contents.get(key)
+        if item is None:
+            for masked in self._masked.values():
+                item = masked.get(key)
+                if item is not None:
+                    break
+        return item
+
     def masked(self, item):
         """Return true if the item is in the library but masked."""
         try:
@@ -319,7 +435,8 @@ class FileLibrary(Library[fsnative, AudioFile], PicklingMixin):
     def remove_masked(self, mount_point):
         """Remove all songs for a masked point"""
 
-        self._masked.pop(mount_point, {})
+        items = self._masked.pop(mount_point, {})
+        self._journal_update(keys=items.keys())
 
     def move_root(self, old_root: str, new_root: fsnative) \
         -> Generator[None, None, None]:
@@ -390,6 +507,7 @@ class FileLibrary(Library[fsnative, AudioFile], PicklingMixin):
             # Continue - maybe it's already moved
         song.sanitize(new_path)
         self._contents[new_path] = song
+        self._journal_update(keys=[key], items=[song])
         return existed
 
     def remove_roots(self, old_roots: Iterable[str]) -> Generator[None, None, None]:
@@ -413,3 +531,256 @@ class FileLibrary(Library[fsnative, AudioFile], PicklingMixin):
             self.remove(removed)
         else:
             print_d(f"No tracks in {old_roots} to remove from {self._name}")
+
+
+def _max_monitors():
+    """How many directories to monitor, leaving inotify watches for others"""
+
+    try:
+        with open("/proc/sys/fs/inotify/max_user_watches", "rb") as h:
+            return int(h.read()) // 2
+    except (EnvironmentError, ValueError):
+        return 8192
+
+
+class FileLibraryWatcher:
+    """Watches directories and applies file changes to a `FileLibrary`.
+
+    Every directory gets its own `Gio.FileMonitor`. Events get collected
+    and handled in one batch `DELAY` ms after the last one, but at the
+    latest `MAX_DELAY` ms after the first one. Instead of replaying the
+    events, the current state of each touched path is applied, so e.g. a
+    file created and deleted again in between gets ignored.
+
+    Directories which can't be monitored, because the monitor limit is
+    reached or creating one failed, get polled for mtime changes every
+    `POLL_INTERVAL` seconds instead. Polling only notices added and removed
+    files, not changed ones.
+    """
+
+    DELAY = 500
+    MAX_DELAY = 5000
+    POLL_INTERVAL = 30
+
+    _IGNORED = {
+        Gio.FileMonitorEvent.CHANGED,
+        Gio.FileMonitorEvent.ATTRIBUTE_CHANGED,
+        Gio.FileMonitorEvent.PRE_UNMOUNT,
+        Gio.FileMonitorEvent.UNMOUNTED,
+    }
+
+    def __init__(self, library: FileLibrary, paths: Iterable[fsnative],
+                 exclude: Iterable[fsnative] = ()):
+        self._library = library
+        self._exclude = list(exclude)
+        self.max_monitors = _max_monitors()
+        self._monitors: Dict[fsnative, Tuple[Gio.FileMonitor, int]] = {}
+        self._polled: Dict[fsnative, Tuple[int, Set[fsnative]]] = {}
+        self._pending: Set[fsnative] = set()
+        self._new_files: List[fsnative] = []
+        self._adding = False
+        self._first_event = None
+        self._flush_id = None
+        self._poll_id = None
+        self._funcid = f"library watcher {id(self)}"
+        self._add_funcid = f"library watcher add {id(self)}"
+        copool.add(self._watch_trees, list(paths), funcid=self._funcid)
+
+    def destroy(self):
+        """Stops watching, pending changes get dropped"""
+
+        for monitor, handler_id in self._monitors.values():
+            monitor.disconnect(handler_id)
+            monitor.cancel()
+        self._monitors.clear()
+        self._polled.clear()
+        self._pending.clear()
+        for source_id in [self._flush_id, self._poll_id]:
+            if source_id is not None:
+                GLib.source_remove(source_id)
+        self._flush_id = self._poll_id = None
+        self._new_files.clear()
+        self._adding = False
+        for funcid in [self._funcid, self._add_funcid]:
+            try:
+                copool.remove(funcid)
+            except ValueError:
+                pass
+
+    @property
+    def watched(self) -> Set[fsnative]:
+        """All monitored and polled directories"""
+
+        return set(self._monitors) | set(self._polled)
+
+    def _skip(self, path):
+        return ishidden(path) or any(path.startswith(p) for p in self._exclude)
+
+    def _watch_trees(self, paths):
+        for root in paths:
+            root = os.path.realpath(root)
+            print_d(f"Watching {root!r} for changes")
+            for i, path in enumerate(self._watch_tree(root)):
+                if not i % 100:
+                    yield True
+
+    def _watch_tree(self, root):
+        """Watches `root` and all directories below it, yields each
+        directory so callers can take a break.
+        """
+
+        dirs = [root]
+        while dirs:
+            path = dirs.pop()
+            if path in self._monitors or path in self._polled:
+                continue
+            try:
+                with os.scandir(path) as it:
+                    entries = list(it)
+                mtime_ns = os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+            self._watch_dir(path, mtime_ns, entries)
+            for entry in entries:
+                try:
+                    if not entry.is_dir() or entry.is_symlink():
+                        continue
+                except OSError:
+                    continue
+                if not self._skip(entry.path):
+                    dirs.append(entry.path)
+            yield path
+
+    def _watch_dir(self, path, mtime_ns, entries):
+        if len(self._monitors) < self.max_monitors:
+            gfile = Gio.File.new_for_path(path)
+            try:
+                monitor = gfile.monitor_directory(
+                    Gio.FileMonitorFlags.WATCH_MOVES, None)
+            except GLib.Error as e:
+                print_w(f"Couldn't monitor {path!r}, polling instead: "
+                        f"{e.message}")
+            else:
+                handler_id = monitor.connect("changed", self.__changed)
+                self._monitors[path] = (monitor, handler_id)
+                return
+
+        self._polled[path] = (mtime_ns, {e.name for e in entries})
+        if self._poll_id is None:
+            self._poll_id = GLib.timeout_add_seconds(
+                self.POLL_INTERVAL, self._poll)
+
+    def _unwatch_tree(self, root):
+        prefix = os.path.join(root, "")
+        for path in [p for p in self.watched
+                     if p == root or p.startswith(prefix)]:
+            if path in self._monitors:
+                monitor, handler_id = self._monitors.pop(path)
+                monitor.disconnect(handler_id)
+                monitor.cancel()
+            else:
+                del self._polled[path]
+
+    def __changed(self, monitor, main_file, other_file, event_type):
+        if event_type in self._IGNORED:
+            return
+        for gfile in [main_file, other_file]:
+            path = gfile and gfile.get_path()
+            if path and not self._skip(path):
+                self._pending.add(path)
+        self._schedule()
+
+    def _poll(self):
+        for path, (mtime_ns, names) in list(self._polled.items()):
+            try:
+                new_mtime_ns = os.stat(path).st_mtime_ns
+                if new_mtime_ns == mtime_ns:
+                    continue
+                with os.scandir(path) as it:
+                    new_names = {e.name for e in it}
+            except OSError:
+                self._pending.add(path)
+                continue
+            self._polled[path] = (new_mtime_ns, new_names)
+            for name in names ^ new_names:
+                child = os.path.join(path, name)
+                if not self._skip(child):
+                    self._pending.add(child)
+        if self._pending:
+            self._schedule()
+        return True
+
+    def _schedule(self):
+        now = GLib.get_monotonic_time() // 1000
+        if self._first_event is None:
+            self._first_event = now
+        if self._flush_id is not None:
+            GLib.source_remove(self._flush_id)
+        delay = min(self.DELAY, self._first_event + self.MAX_DELAY - now)
+        self._flush_id = GLib.timeout_add(max(delay, 0), self._flush)
+
+    def _flush(self):
+        self._flush_id = None
+        self._first_event = None
+        paths, self._pending = self._pending, set()
+        self.apply(paths)
+        return False
+
+    def apply(self, paths: Iterable[fsnative]):
+        """Brings the library up to date for the changed paths"""
+
+        library = self._library
+        changed, removed = set(), set()
+        new_files = []
+        watched = self.watched
+
+        def reload(item):
+            if not item.valid():
+                library.reload(item, changed, removed)
+
+        for path in sorted(paths):
+            if os.path.isdir(path):
+                if path not in watched:
+                    watched.update(self._watch_tree(path))
+                    new_files.extend(iter_paths(path, self._exclude))
+                continue
+
+            if path in watched:
+                # a directory got removed or moved away
+                self._unwatch_tree(path)
+                prefix = os.path.join(path, "")
+                for key, item in list(library.items()):
+                    if key.startswith(prefix):
+                        reload(item)
+                continue
+
+            item = library.get(normalize_path(path, True))
+            if item is not None:
+                reload(item)
+            elif os.path.isfile(path) and formats.filter(path):
+                new_files.append(os.path.realpath(path))
+
+        print_d(f"Applying changes: {len(new_files)} new, {len(changed)} "
+                f"changed, {len(removed)} removed", library._name)
+        if removed:
+            library.emit('removed', removed)
+        if changed:
+            library.emit('changed', changed)
+        self._new_files.extend(
+            p for p in new_files if not library.contains_filename(p))
+        if self._new_files and not self._adding:
+            self._adding = True
+            copool.add(self._add_files, funcid=self._add_funcid)
+
+    def _add_files(self):
+        # files of later changes get queued while this is running
+        library = self._library
+        while self._new_files:
+            filenames = [p for p in dict.fromkeys(self._new_files)
+                         if not library.contains_filename(p)]
+            self._new_files.clear()
+            for done, items in library._load_filenames(filenames):
+                if items:
+                    library.add(items)
+                yield True
+        self._adding = False
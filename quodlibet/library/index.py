@@ -0,0 +1,245 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+"""An inverted index of tag values to songs and columns of numeric tag
+values, used by `Query.filter` to reduce the number of songs which have to
+be searched.
+"""
+
+from array import array
+from bisect import bisect_left
+from numbers import Real
+from typing import Dict, Set, List, Optional, Iterable, Tuple
+
+from quodlibet import config
+from quodlibet.formats import AudioFile
+from quodlibet.unisearch import fold
+from quodlibet.util import parse_date
+
+NAN = float("nan")
+
+INDEXABLE_SYNTHETIC = {
+    "~people", "~people:real", "~performer", "~performers", "~year",
+    "~originalyear", "~format", "~codec",
+}
+"""Synthetic tags which only depend on the song's own tags"""
+
+
+def _indexable(tag: str) -> bool:
+    if tag[:1] == "~":
+        return tag in INDEXABLE_SYNTHETIC
+    return tag[:1] != "#" and tag not in ("filename", "mountpoint")
+
+
+def _numeric_indexable(tag: str) -> bool:
+    return "~" not in tag and ":" not in tag
+
+
+def _numeric_value(song: AudioFile, tag: str) -> float:
+    """The value `NumexprTag` would look at, NaN if missing"""
+
+    if tag == "date":
+        date = song("date")
+        if not date:
+            return NAN
+        try:
+            return parse_date(date)
+        except ValueError:
+            return NAN
+    elif tag == "rating":
+        # the default depends on the config, see `TagIndex.numeric`
+        value = song.get("~#rating")
+    else:
+        value = song("~#" + tag, None)
+    if not isinstance(value, Real):
+        return NAN
+    return value
+
+
+def _tag_values(song: AudioFile, tag: str) -> Tuple[str, ...]:
+    """The folded lines of the value `Tag.search` would look at"""
+
+    if tag[:1] == "~":
+        value = song(tag)
+    else:
+        value = song.get(tag)
+        if value is None:
+            value = song.get("~" + tag, "")
+    if not isinstance(value, str):
+        value = str(value)
+    return tuple({fold(line) for line in value.split("\n")})
+
+
+class TagIndex:
+    """Maps folded tag values (each line of multi-value tags) to the songs
+    having them.
+
+    In addition it keeps a column of values per numeric tag, so numeric
+    comparisons can be evaluated for all songs at once.
+
+    Tags get indexed on first lookup and are kept up to date afterwards,
+    so the owner has to call add(), remove() and changed() accordingly.
+    """
+
+    def __init__(self, songs: Iterable[AudioFile]):
+        self._songs = songs
+        self._values: Dict[str, Dict[str, Set[AudioFile]]] = {}
+        self._song_values: Dict[str, Dict[AudioFile, Tuple[str, ...]]] = {}
+        self._sorted: Dict[str, Optional[List[str]]] = {}
+        self._order: Optional[List[AudioFile]] = None
+        self._positions: Dict[AudioFile, int] = {}
+        self._columns: Dict[str, array] = {}
+
+    @property
+    def tags(self) -> List[str]:
+        """The currently indexed tags"""
+
+        return list(self._values)
+
+    def _index(self, tag: str, songs: Iterable[AudioFile]):
+        values = self._values[tag]
+        song_values = self._song_values[tag]
+        new_key = False
+        for song in songs:
+            folded = _tag_values(song, tag)
+            song_values[song] = folded
+            for value in folded:
+                if value not in values:
+                    values[value] = set()
+                    new_key = True
+                values[value].add(song)
+        if new_key:
+            self._sorted[tag] = None
+
+    def _unindex(self, tag: str, songs: Iterable[AudioFile]):
+        values = self._values[tag]
+        song_values = self._song_values[tag]
+        removed_key = False
+        for song in songs:
+            for value in song_values.pop(song, ()):
+                entry = values[value]
+                entry.discard(song)
+                if not entry:
+                    del values[value]
+                    removed_key = True
+        if removed_key:
+            self._sorted[tag] = None
+
+    def add(self, songs: Iterable[AudioFile]):
+        for tag in self._values:
+            self._index(tag, songs)
+
+        if self._order is not None:
+            for song in songs:
+                if song in self._positions:
+                    continue
+                self._positions[song] = len(self._order)
+                self._order.append(song)
+                for tag, column in self._columns.items():
+                    column.append(_numeric_value(song, tag))
+
+    def remove(self, songs: Iterable[AudioFile]):
+        for tag in self._values:
+            self._unindex(tag, songs)
+
+        if self._order is not None:
+            # move the last song into the gap, so nothing has to be shifted
+            for song in songs:
+                pos = self._positions.pop(song, None)
+                if pos is None:
+                    continue
+                last = self._order.pop()
+                for column in self._columns.values():
+                    value = column.pop()
+                    if last is not song:
+                        column[pos] = value
+                if last is not song:
+                    self._order[pos] = last
+                    self._positions[last] = pos
+
+    def changed(self, songs: Iterable[AudioFile]):
+        for tag in self._values:
+            self._unindex(tag, songs)
+            self._index(tag, songs)
+
+        if self._order is not None:
+            for song in songs:
+                pos = self._positions.get(song)
+                if pos is None:
+                    continue
+                for tag, column in self._columns.items():
+                    column[pos] = _numeric_value(song, tag)
+
+    @property
+    def numeric_songs(self) -> List[AudioFile]:
+        """The songs in the order of the values returned by numeric()"""
+
+        if self._order is None:
+            self._order = list(self._songs)
+            self._positions = {s: i for i, s in enumerate(self._order)}
+        return self._order
+
+    def numeric(self, tag: str) -> Optional[array]:
+        """Returns the values of the numeric tag `tag` (without "~#") for
+        all songs in `numeric_songs`, NaN where a song has no value.
+        Returns None if the tag can't be indexed.
+        """
+
+        if not _numeric_indexable(tag):
+            return None
+
+        column = self._columns.get(tag)
+        if column is None:
+            column = array(
+                "d", (_numeric_value(s, tag) for s in self.numeric_songs))
+            self._columns[tag] = column
+
+        if tag == "rating":
+            default = config.RATINGS.default
+            return array("d", (default if v != v else v for v in column))
+        return column
+
+    def _get(self, tag: str) -> Optional[Dict[str, Set[AudioFile]]]:
+        if tag not in self._values:
+            if not _indexable(tag):
+                return None
+            self._values[tag] = {}
+            self._song_values[tag] = {}
+            self._index(tag, self._songs)
+        return self._values[tag]
+
+    def lookup(self, tag: str, kind: str, text: str) \
+            -> Optional[Set[AudioFile]]:
+        """Returns a superset of the songs where a line of `tag` matches
+        `text` ignoring case and diacritics (see `unisearch.fold`), or None
+        if the tag can't be indexed.
+
+        `kind` is either "exact", "prefix" or "contains".
+        """
+
+        values = self._get(tag)
+        if values is None:
+            return None
+
+        text = fold(text)
+        if kind == "exact":
+            return set(values.get(text, ()))
+
+        result: Set[AudioFile] = set()
+        if kind == "prefix":
+            keys = self._sorted.get(tag)
+            if keys is None:
+                keys = self._sorted[tag] = sorted(values)
+            for i in range(bisect_left(keys, text), len(keys)):
+                if not keys[i].startswith(text):
+                    break
+                result.update(values[keys[i]])
+        elif kind == "contains":
+            for key, songs in values.items():
+                if text in key:
+                    result.update(songs)
+        else:
+            raise ValueError(kind)
+        return result
@@ -0,0 +1,169 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+"""An append-only journal of library changes on top of a saved snapshot.
+
+The journal starts with a header identifying the snapshot file it belongs
+to, followed by records of removed keys and added/changed items. On load
+the records get replayed on top of the snapshot items. If the snapshot
+gets replaced (compacted) the journal no longer matches and is ignored.
+"""
+
+import os
+import struct
+
+from quodlibet.formats import (load_audio_files_columnar,
+                               dump_audio_files_columnar, SerializationError)
+from quodlibet.util.dprint import print_d, print_w
+
+MAGIC = b"QLJOURNL"
+
+_HEADER = struct.Struct("<8sQQQ")
+"""magic, snapshot size, snapshot mtime (ns), snapshot inode"""
+
+_RECORD = struct.Struct("<4sQ")
+"""record type, payload length"""
+
+_UPSERT = b"UPSR"
+_REMOVE = b"RMVD"
+
+
+def journal_path(filename):
+    """The journal file belonging to a library file"""
+
+    return filename + ".journal"
+
+
+def _snapshot_id(filename):
+    st = os.stat(filename)
+    return st.st_size, st.st_mtime_ns, st.st_ino
+
+
+def _encode_keys(keys):
+    return b"\x00".join(k.encode("utf-8", "surrogatepass") for k in keys)
+
+
+def _decode_keys(data):
+    if not data:
+        return []
+    return [k.decode("utf-8", "surrogatepass") for k in data.split(b"\x00")]
+
+
+def matches(filename):
+    """Returns True if a journal exists and belongs to the current
+    snapshot.
+    """
+
+    try:
+        with open(journal_path(filename), "rb") as h:
+            header = h.read(_HEADER.size)
+        snapshot_id = _snapshot_id(filename)
+    except EnvironmentError:
+        return False
+
+    if len(header) != _HEADER.size:
+        return False
+    magic, *file_id = _HEADER.unpack(header)
+    return magic == MAGIC and tuple(file_id) == snapshot_id
+
+
+def append(filename, removed_keys, items):
+    """Appends removed keys and added/changed items to the journal of the
+    passed snapshot file, creating a new journal if the existing one
+    belongs to an older snapshot.
+
+    Returns:
+        int: the size of the journal
+    Raises:
+        SerializationError
+        EnvironmentError
+    """
+
+    records = bytearray()
+    if removed_keys:
+        payload = _encode_keys(removed_keys)
+        records.extend(_RECORD.pack(_REMOVE, len(payload)))
+        records.extend(payload)
+    if items:
+        payload = dump_audio_files_columnar(list(items))
+        records.extend(_RECORD.pack(_UPSERT, len(payload)))
+        records.extend(payload)
+
+    path = journal_path(filename)
+    mode = "r+b" if matches(filename) else "wb"
+    with open(path, mode) as h:
+        if mode == "wb":
+            h.write(_HEADER.pack(MAGIC, *_snapshot_id(filename)))
+        start = h.seek(0, os.SEEK_END)
+        try:
+            h.write(records)
+            h.flush()
+            os.fsync(h.fileno())
+        except EnvironmentError:
+            # don't leave a partial record behind
+            h.truncate(start)
+            raise
+        return h.tell()
+
+
+def remove(filename):
+    """Removes the journal of a snapshot file, if there is one"""
+
+    try:
+        os.unlink(journal_path(filename))
+    except FileNotFoundError:
+        pass
+    except EnvironmentError:
+        print_w(f"Couldn't remove journal for {filename!r}")
+
+
+def replay(filename, items):
+    """Applies the journal of the snapshot file to the snapshot items.
+
+    A journal not matching the snapshot is ignored, a truncated record at
+    the end (e.g. due to a crash while appending) ends the replay.
+
+    Returns:
+        List[AudioFile]: the updated item list
+    """
+
+    if not matches(filename):
+        return items
+
+    try:
+        with open(journal_path(filename), "rb") as h:
+            data = h.read()
+    except EnvironmentError:
+        print_w(f"Couldn't read journal for {filename!r}")
+        return items
+
+    by_key = {item.key: item for item in items}
+    offset = _HEADER.size
+    count = 0
+    while offset + _RECORD.size <= len(data):
+        kind, length = _RECORD.unpack_from(data, offset)
+        offset += _RECORD.size
+        payload = data[offset:offset + length]
+        offset += length
+        if len(payload) != length:
+            print_w("Ignoring truncated journal record")
+            break
+        try:
+            if kind == _REMOVE:
+                for key in _decode_keys(payload):
+                    by_key.pop(key, None)
+            elif kind == _UPSERT:
+                for item in load_audio_files_columnar(payload):
+                    by_key[item.key] = item
+            else:
+                print_w(f"Unknown journal record {kind!r}")
+                break
+        except (SerializationError, UnicodeDecodeError) as e:
+            print_w(f"Ignoring broken journal record: {e}")
+            break
+        count += 1
+
+    print_d(f"Replayed {count} journal record(s) for {filename!r}")
+    return list(by_key.values())
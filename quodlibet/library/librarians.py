@@ -183,6 +183,7 @@ class SongLibrarian(Librarian):
             except KeyError:
                 pass
             else:
+                library._journal_update(keys=[song.key])
                 re_add.append(library)
         song.rename(newname)
         for library in re_add:
@@ -3,13 +3,15 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
+import os
 from typing import Optional, Set
 
-from quodlibet import util, print_d
-from quodlibet.formats import MusicFile, AudioFile
+from quodlibet import util, print_d, config, get_user_dir
+from quodlibet.formats import MusicFile, AudioFile, load_music_files
 from quodlibet.library.album import AlbumLibrary
 from quodlibet.library.base import Library, K, PicklingMixin
 from quodlibet.library.file import FileLibrary
+from quodlibet.library.index import TagIndex
 from quodlibet.library.playlist import PlaylistLibrary
 from quodlibet.query import Query
 from quodlibet.util.path import normalize_path
@@ -29,6 +31,17 @@ class SongLibrary(Library[K, AudioFile], PicklingMixin):
     def albums(self):
         return AlbumLibrary(self)
 
+    @util.cached_property
+    def tag_index(self) -> TagIndex:
+        """An index of tag values to songs and numeric tag columns, used by
+        `Query.filter`. Tags get indexed on first use."""
+
+        index = TagIndex(self)
+        self.connect('added', lambda lib, songs: index.add(songs))
+        self.connect('removed', lambda lib, songs: index.remove(songs))
+        self.connect('changed', lambda lib, songs: index.changed(songs))
+        return index
+
     @util.cached_property
     def playlists(self):
         pl_lib = PlaylistLibrary(self)
@@ -64,6 +77,7 @@ class SongLibrary(Library[K, AudioFile], PicklingMixin):
             return
         print_d(f"Renaming {song.key!r} to {new_name!r}", self)
         del self._contents[song.key]
+        self._journal_update(keys=[song.key])
         song.rename(new_name)
         self._contents[song.key] = song
         if changed is not None:
@@ -78,7 +92,7 @@ class SongLibrary(Library[K, AudioFile], PicklingMixin):
 
         songs = self.values()
         if text != "":
-            songs = list(filter(Query(text, star).search, songs))
+            songs = Query(text, star).filter(self)
         return songs
 
 
@@ -122,3 +136,12 @@ class SongFileLibrary(SongLibrary, FileLibrary):
             song = self._contents[key]
 
         return song
+
+    def _load_filenames(self, filenames):
+        """Loads new files in worker processes, see `load_music_files`"""
+
+        processes = config.getint("library", "scan_processes")
+        if processes <= 0:
+            processes = os.cpu_count() or 1
+        config_file = os.path.join(get_user_dir(), "config")
+        return load_music_files(filenames, processes, config_file)
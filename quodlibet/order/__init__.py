@@ -94,6 +94,20 @@ class Order:
         e.g. forgetting history / clearing pre-cached orders."""
         pass
 
+    def song_inserted(self, playlist, index):
+        """Called after a song was inserted at position `index`.
+        By default this resets the order, as positions have changed."""
+        self.reset(playlist)
+
+    def song_removed(self, playlist, index):
+        """Called after the song at position `index` was removed.
+        By default this resets the order, as positions have changed."""
+        self.reset(playlist)
+
+    def song_changed(self, playlist, index):
+        """Called after the song (or row) at position `index` changed."""
+        pass
+
     def __str__(self):
         """By default there is no interesting state"""
         return "<%s>" % self.display_name
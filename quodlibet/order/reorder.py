@@ -7,7 +7,7 @@
 
 import random
 
-from quodlibet import _
+from quodlibet import _, print_d
 from quodlibet.order import Order, OrderRemembered
 
 
@@ -17,46 +17,287 @@ class Reorder(Order):
     pass
 
 
-class OrderShuffle(Reorder, OrderRemembered):
-    name = "random"
-    display_name = _("Random")
-    accelerated_name = _("_Random")
+class WeightedSampler:
+    """Picks random positions, proportional to their weight, in O(log n).
 
-    def next(self, playlist, iter):
-        super().next(playlist, iter)
-        played = set(self._played)
-        songs = set(range(len(playlist)))
-        remaining = songs.difference(played)
+    Each position is either active, and can be picked, or not. In case all
+    active positions have a weight of zero they get picked uniformly.
 
-        if remaining:
-            return playlist.get_iter((random.choice(list(remaining)),))
+    The weights of the active positions are kept in Fenwick trees.
+    Inserting or removing positions shifts all following ones, so the trees
+    get rebuilt on the next access in that case.
+    """
 
-        self.reset(playlist)
-        return None
+    def __init__(self, weights=(), active=True):
+        self._weights = list(weights)
+        self._active = [active] * len(self._weights)
+        self._invalidate()
 
+    def __len__(self):
+        return len(self._weights)
+
+    @property
+    def active_count(self):
+        """The number of active positions"""
+
+        self._ensure_trees()
+        return self._total_count
+
+    def _invalidate(self):
+        self._sums = self._counts = None
+        self._total_weight = self._total_count = 0
+        self._updates = 0
+
+    def _ensure_trees(self):
+        if self._sums is not None:
+            return
+
+        n = len(self._weights)
+        sums = [0.0] * (n + 1)
+        counts = [0] * (n + 1)
+        for i, (weight, active) in enumerate(
+                zip(self._weights, self._active), 1):
+            if active:
+                sums[i] += weight
+                counts[i] += 1
+            j = i + (i & -i)
+            if j <= n:
+                sums[j] += sums[i]
+                counts[j] += counts[i]
+
+        self._sums = sums
+        self._counts = counts
+        self._total_weight = sum(
+            w for w, a in zip(self._weights, self._active) if a)
+        self._total_count = sum(self._active)
+
+    def _update(self, index, weight, count):
+        if self._sums is None:
+            return
+
+        # floating point errors add up, start over once in a while
+        self._updates += 1
+        if self._updates > len(self._weights):
+            self._invalidate()
+            return
+
+        sums = self._sums
+        counts = self._counts
+        n = len(sums) - 1
+        i = index + 1
+        while i <= n:
+            sums[i] += weight
+            counts[i] += count
+            i += i & -i
+        self._total_weight += weight
+        self._total_count += count
+
+    def get_weight(self, index):
+        return self._weights[index]
+
+    def set_weight(self, index, weight):
+        old = self._weights[index]
+        self._weights[index] = weight
+        if self._active[index]:
+            self._update(index, weight - old, 0)
+
+    def is_active(self, index):
+        return self._active[index]
+
+    def set_active(self, index, active):
+        if self._active[index] == active:
+            return
+        self._active[index] = active
+        sign = 1 if active else -1
+        self._update(index, sign * self._weights[index], sign)
+
+    def insert(self, index, weight, active=True):
+        self._weights.insert(index, weight)
+        self._active.insert(index, active)
+        self._invalidate()
+
+    def remove(self, index):
+        del self._weights[index]
+        del self._active[index]
+        self._invalidate()
+
+    def _find(self, tree, target):
+        # the first position where the prefix sum exceeds target
+        n = len(tree) - 1
+        pos = 0
+        step = 1 << (n.bit_length() - 1) if n else 0
+        while step:
+            next_ = pos + step
+            if next_ <= n and tree[next_] <= target:
+                pos = next_
+                target -= tree[next_]
+            step >>= 1
+        return pos
+
+    def sample(self, random=random.random):
+        """Returns a random active position or None"""
+
+        self._ensure_trees()
+        if self._total_count <= 0:
+            return None
+
+        weighted = self._total_weight > 0
+        for retry in range(2):
+            if weighted:
+                index = self._find(
+                    self._sums, random() * self._total_weight)
+            else:
+                index = self._find(
+                    self._counts, int(random() * self._total_count))
+            if index < len(self._weights) and self._active[index] and \
+                    (not weighted or self._weights[index] > 0):
+                return index
+            # rounding errors, try again with exact trees
+            self._invalidate()
+            self._ensure_trees()
+            weighted = self._total_weight > 0
+
+        for index in reversed(range(len(self._weights))):
+            if self._active[index] and \
+                    (not weighted or self._weights[index] > 0):
+                return index
 
-class OrderWeighted(Reorder, OrderRemembered):
-    name = "weighted"
-    display_name = _("Prefer higher rated")
-    accelerated_name = _("Prefer higher rated")
+
+class OrderSampled(Reorder, OrderRemembered):
+    """Base class for orders picking the next song at random from the ones
+    not played yet, proportional to get_weight().
+
+    The weights get kept in a WeightedSampler, built on first use and
+    updated as songs change, so picking a song doesn't have to look at the
+    whole playlist. Inserted or removed songs make it get rebuilt on the
+    next pick, and the positions of the played songs get shifted in one
+    go, so bulk changes to the playlist stay cheap.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._sampler = None
+        # (index, count) runs of inserted (count > 0) or removed rows
+        self._edits = []
+
+    def get_weight(self, song):
+        """The weight of a song, 1 by default"""
+
+        return 1
+
+    def prepare_weights(self, songs):
+        """Called with all songs before the weights get computed"""
+
+        pass
+
+    def _add_edit(self, index, count):
+        self._sampler = None
+        edits = self._edits
+        if edits:
+            start, last = edits[-1]
+            if count > 0 and last > 0 and start <= index <= start + last:
+                edits[-1] = (start, last + count)
+                return
+            elif count < 0 and last < 0 and index in (start, start - 1):
+                edits[-1] = (index, last + count)
+                return
+        edits.append((index, count))
+
+    def _apply_edits(self):
+        played = self._played
+        for start, count in self._edits:
+            if count > 0:
+                played = [i + count if i >= start else i for i in played]
+            else:
+                end = start - count
+                played = [i + count if i >= end else i
+                          for i in played if not start <= i < end]
+        self._played = played
+        self._edits = []
+
+    def _get_sampler(self, playlist):
+        self._apply_edits()
+        sampler = self._sampler
+        if sampler is None or len(sampler) != len(playlist):
+            songs = playlist.get()
+            self.prepare_weights(songs)
+            sampler = WeightedSampler(map(self.get_weight, songs))
+            for index in self._played:
+                if index < len(sampler):
+                    sampler.set_active(index, False)
+            self._sampler = sampler
+        return sampler
+
+    def _set_played(self, playlist, iter):
+        if iter is not None and self._sampler is not None:
+            index = playlist.get_path(iter).get_indices()[0]
+            if index < len(self._sampler):
+                self._sampler.set_active(index, False)
 
     def next(self, playlist, iter):
+        self._apply_edits()
         super().next(playlist, iter)
-        remaining = self.remaining(playlist)
+        self._set_played(playlist, iter)
+        print_d("Played %d of %d song(s)" % (len(self._played), len(playlist)))
 
-        # Don't try to search through an empty / played playlist.
-        if len(remaining) <= 0:
+        index = self._get_sampler(playlist).sample()
+        if index is None:
             self.reset(playlist)
             return None
+        return playlist.get_iter((index,))
+
+    def previous(self, playlist, iter):
+        self._apply_edits()
+        iter = super().previous(playlist, iter)
+        if iter is not None and self._sampler is not None:
+            index = playlist.get_path(iter).get_indices()[0]
+            if index < len(self._sampler) and index not in self._played:
+                self._sampler.set_active(index, True)
+        return iter
+
+    def set(self, playlist, iter):
+        self._apply_edits()
+        iter = super().set(playlist, iter)
+        self._set_played(playlist, iter)
+        return iter
+
+    def reset(self, playlist):
+        super().reset(playlist)
+        self._sampler = None
+        self._edits = []
+
+    def remaining(self, playlist):
+        self._apply_edits()
+        return super().remaining(playlist)
+
+    def song_inserted(self, playlist, index):
+        self._add_edit(index, 1)
+
+    def song_removed(self, playlist, index):
+        self._add_edit(index, -1)
+
+    def song_changed(self, playlist, index):
+        sampler = self._sampler
+        if sampler is None or index >= len(sampler) or \
+                not sampler.is_active(index):
+            return
+        song = playlist.get_value(playlist.get_iter((index,)))
+        if song is not None:
+            sampler.set_weight(index, self.get_weight(song))
+
+
+class OrderShuffle(OrderSampled):
+    name = "random"
+    display_name = _("Random")
+    accelerated_name = _("_Random")
+
+
+class OrderWeighted(OrderSampled):
+    name = "weighted"
+    display_name = _("Prefer higher rated")
+    accelerated_name = _("Prefer higher rated")
 
-        total_score = sum([song('~#rating') for song in remaining.values()])
-        if total_score == 0:
-            # When all songs are rated zero, fall back to unweighted shuffle
-            return playlist.get_iter((random.choice(list(remaining)),))
-        choice = random.random() * total_score
-        current = 0.0
-        for i, song in remaining.items():
-            current += song("~#rating")
-            if current >= choice:
-                return playlist.get_iter([i])
-        raise ValueError
+    def get_weight(self, song):
+        # When all remaining songs are rated zero, this falls back
+        # to an unweighted shuffle
+        return song("~#rating")
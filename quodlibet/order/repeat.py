@@ -30,6 +30,15 @@ class Repeat(Order):
     def reset(self, playlist):
         return self.wrapped.reset(playlist)
 
+    def song_inserted(self, playlist, index):
+        return self.wrapped.song_inserted(playlist, index)
+
+    def song_removed(self, playlist, index):
+        return self.wrapped.song_removed(playlist, index)
+
+    def song_changed(self, playlist, index):
+        return self.wrapped.song_changed(playlist, index)
+
     def __str__(self):
         return "<%s ∘ %s>" % (self.display_name, self.wrapped.display_name)
 
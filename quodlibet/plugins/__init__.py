@@ -14,16 +14,19 @@ from quodlibet.qltk.ccb import ConfigCheckButton
 from quodlibet.util.config import ConfigProxy
 from quodlibet.util.dprint import print_d
 from quodlibet.util.modulescanner import ModuleScanner
+from quodlibet.plugins.manifest import PluginManifest, PluginStub
 
 
-def init(folders=None, disable_plugins=False):
+def init(folders=None, disable_plugins=False, manifest_path=None):
     """folders: list of paths to look for plugins
     disable_plugins: disables all plugins, but does not forget which
     plugins are enabled.
+    manifest_path: file to cache the plugins of each module in, see
+    PluginManager
     """
     if disable_plugins:
         folders = []
-    manager = PluginManager.instance = PluginManager(folders)
+    manager = PluginManager.instance = PluginManager(folders, manifest_path)
     return manager
 
 
@@ -116,10 +119,14 @@ def list_plugins(module):
 
 class PluginModule:
 
-    def __init__(self, name, module):
+    def __init__(self, name, module, classes=None):
+        """classes: the plugin classes if the module isn't imported"""
+
         self.name = name
         self.module = module
-        self.plugins = [Plugin(cls) for cls in list_plugins(module)]
+        if classes is None:
+            classes = list_plugins(module)
+        self.plugins = [Plugin(cls) for cls in classes]
 
 
 class Plugin:
@@ -132,6 +139,13 @@ class Plugin:
     def __repr__(self):
         return "<%s id=%r name=%r>" % (type(self).__name__, self.id, self.name)
 
+    @property
+    def loaded(self):
+        """False if the plugin module isn't imported yet and `cls` is
+        a PluginStub, see PluginManager.load()"""
+
+        return not isinstance(self.cls, PluginStub)
+
     @property
     def can_enable(self):
         return getattr(self.cls, "PLUGIN_CAN_ENABLE", True)
@@ -162,7 +176,8 @@ class Plugin:
     def get_instance(self):
         """A singleton"""
 
-        if not getattr(self.cls, "PLUGIN_INSTANCE", False):
+        if not self.loaded or \
+                not getattr(self.cls, "PLUGIN_INSTANCE", False):
             return
 
         if self.instance is None:
@@ -209,6 +224,11 @@ class PluginManager:
     If plugin handlers want a plugin instance, they have to call
     Plugin.get_instance() to get a singleton.
 
+    If a manifest path is given, the plugins found in each module get
+    cached there and modules which don't contain enabled plugins are only
+    imported once a plugin gets enabled or load() gets called. Until then
+    their plugins have a PluginStub as class.
+
     handlers need to implement the following methods:
 
         handler.plugin_handle(plugin)
@@ -229,7 +249,7 @@ class PluginManager:
     instance: Optional["PluginManager"] = None
     """Default instance"""
 
-    def __init__(self, folders=None):
+    def __init__(self, folders=None, manifest_path=None):
         """folders is a list of paths that will be scanned for plugins.
         Plugins in later paths will be preferred if they share a name.
         """
@@ -243,6 +263,10 @@ class PluginManager:
         self.__modules = {}     # name: PluginModule
         self.__handlers = []    # handler list
         self.__enabled = set()  # (possibly) enabled plugin IDs
+        self.__manifest = None
+        self.__deferred = {}    # name: [PluginStub] of skipped modules
+        if manifest_path is not None:
+            self.__manifest = PluginManifest(manifest_path)
 
         self.__restore()
 
@@ -251,7 +275,8 @@ class PluginManager:
 
         print_d("Rescanning..")
 
-        removed, added = self.__scanner.rescan()
+        defer = self.__defer if self.__manifest is not None else None
+        removed, added = self.__scanner.rescan(defer)
 
         # remember IDs of enabled plugin that get reloaded, so we can enable
         # them again
@@ -273,9 +298,61 @@ class PluginManager:
 
         for name in added:
             new_module = self.__scanner.modules[name]
-            self.__add_module(name, new_module.module)
+            if new_module.module is None:
+                self.__add_stubs(name, self.__deferred.pop(name))
+            else:
+                self.__add_module(name, new_module.module)
+        self.__deferred.clear()
+
+        if self.__manifest is not None:
+            self.__manifest.prune(self.__modules.keys())
+            self.__manifest.save()
+
+        print_d("Rescanning done: %d module(s) not imported" % len(
+            [m for m in self.__scanner.modules.values() if m.module is None]))
+
+    def __defer(self, name, deps):
+        stubs = self.__manifest.get(name, deps)
+        if stubs is None:
+            return False
+        for stub in stubs:
+            if stub.PLUGIN_ID in self.__enabled or \
+                    not getattr(stub, "PLUGIN_CAN_ENABLE", True):
+                return False
+        self.__deferred[name] = stubs
+        return True
+
+    def load(self, plugin):
+        """Imports the module of the plugin if it isn't yet.
+
+        Returns True if the plugin has its real class afterwards.
+        """
+
+        if plugin.loaded:
+            return True
 
-        print_d("Rescanning done.")
+        name = plugin.cls.module_name
+        if name not in self.__modules:
+            return False
+        print_d("Loading plugin module %r" % name)
+        old_module = self.__modules.pop(name)
+        module = self.__scanner.load(name)
+        if module is None:
+            # gets listed in failures
+            self.__manifest.remove(name)
+            return False
+
+        # keep the plugin objects, the plugin window holds on to them
+        stubs = {p.id: p for p in old_module.plugins}
+        plugin_mod = PluginModule(name, module.module)
+        for i, new_plugin in enumerate(plugin_mod.plugins):
+            old_plugin = stubs.get(new_plugin.id)
+            if old_plugin is not None:
+                old_plugin.cls = new_plugin.cls
+                plugin_mod.plugins[i] = old_plugin
+        self.__add_plugin_module(plugin_mod)
+
+        return plugin.loaded
 
     @property
     def _modules(self):
@@ -322,6 +399,8 @@ class PluginManager:
         config.set(self.CONFIG_SECTION,
                    self.CONFIG_OPTION,
                    "\n".join(self.__enabled))
+        if self.__manifest is not None:
+            self.__manifest.save()
 
     def enabled(self, plugin):
         """Returns if the plugin is enabled."""
@@ -352,6 +431,8 @@ class PluginManager:
                     util.print_exc()
         else:
             print_d("Enable %r" % plugin.id)
+            if not self.load(plugin):
+                return
             obj = plugin.get_instance()
             if obj and hasattr(obj, "enabled"):
                 try:
@@ -391,18 +472,28 @@ class PluginManager:
                 self.enable(plugin, False)
 
     def __add_module(self, name, module):
-        plugin_mod = PluginModule(name, module)
+        self.__add_plugin_module(PluginModule(name, module))
+
+    def __add_stubs(self, name, stubs):
+        self.__add_plugin_module(PluginModule(name, None, stubs))
+
+    def __add_plugin_module(self, plugin_mod):
+        name = plugin_mod.name
         self.__modules[name] = plugin_mod
 
+        if plugin_mod.module is not None and self.__manifest is not None:
+            self.__manifest.update(
+                name, self.__scanner.modules[name].deps,
+                [p.cls for p in plugin_mod.plugins])
+
         for plugin in plugin_mod.plugins:
             handlers = []
             for handler in self.__handlers:
                 if handler.plugin_handle(plugin):
                     handlers.append(handler)
-            if handlers:
-                plugin.handlers = handlers
-                if self.enabled(plugin):
-                    self.enable(plugin, True, force=True)
+            plugin.handlers = handlers
+            if handlers and self.enabled(plugin):
+                self.enable(plugin, True, force=True)
 
     def __restore(self):
         migrate_old_config()
@@ -0,0 +1,198 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+"""A cache of the plugins found in each plugin module.
+
+Importing all plugin modules takes a large part of the startup time, most of
+them pulling in widgets, GStreamer elements or HTTP code. With the manifest
+the plugin manager only has to import the modules of enabled plugins; all
+others are represented by `PluginStub` objects until they are needed.
+"""
+
+import importlib
+import os
+
+from quodlibet import const
+from quodlibet import print_d, print_w
+from quodlibet.util.atomic import atomic_save
+from quodlibet.util.path import mkdir, mtime
+from quodlibet.util.picklehelper import pickle_dump, pickle_load, \
+    PickleError
+
+
+ATTRIBUTES = ["PLUGIN_ID", "PLUGIN_NAME", "PLUGIN_DESC", "PLUGIN_ICON",
+              "PLUGIN_TAGS", "PLUGIN_CAN_ENABLE", "PLUGIN_INSTANCE"]
+"""Plugin class attributes which are available without importing"""
+
+
+def _is_plain(value):
+    if isinstance(value, (list, tuple)):
+        return all(_is_plain(v) for v in value)
+    return value is None or isinstance(value, (str, bool, int, float))
+
+
+def get_base_names(cls):
+    """The "module:qualname" names of all quodlibet classes a plugin class
+    derives from, excluding other plugin modules.
+    """
+
+    names = []
+    for base in cls.__mro__[1:]:
+        module = base.__module__
+        if module.startswith(("quodlibet.fake.", "quodlibet.ext.")) or \
+                not module.startswith("quodlibet."):
+            continue
+        names.append("%s:%s" % (module, base.__qualname__))
+    return names
+
+
+def resolve_name(name):
+    """The object for a "module:qualname" name.
+
+    Raises ImportError, AttributeError
+    """
+
+    module_name, qualname = name.split(":", 1)
+    obj = importlib.import_module(module_name)
+    for attr in qualname.split("."):
+        obj = getattr(obj, attr)
+    return obj
+
+
+class PluginStub:
+    """Stands in for the class of a plugin whose module isn't imported yet.
+
+    It has the cached PLUGIN_* attributes of the class, and issubclass()
+    works for all the quodlibet classes it derives from, which is all plugin
+    handlers need to decide if they are interested in it.
+    """
+
+    def __init__(self, module_name, info):
+        """Raises ImportError, AttributeError"""
+
+        self.module_name = module_name
+        self.__name__ = info["name"]
+        self.__bases__ = tuple(
+            resolve_name(n) for n in info["bases"]) + (object,)
+        for key, value in info["attributes"].items():
+            setattr(self, key, value)
+
+    def __repr__(self):
+        return "<%s name=%r module=%r>" % (
+            type(self).__name__, self.__name__, self.module_name)
+
+
+class PluginManifest:
+    """Remembers the plugin classes of plugin modules, as long as none of
+    the module files changed.
+
+    The manifest is stored at `path` and gets discarded when the Quod Libet
+    version or the language changes, since plugin names and descriptions
+    are translated.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path):
+        self.path = path
+        self._modules = {}
+        self._dirty = False
+        self._load()
+
+    @classmethod
+    def _get_key(cls):
+        language = tuple(os.environ.get(k, "") for k in
+                         ["LANGUAGE", "LC_ALL", "LC_MESSAGES", "LANG"])
+        return (cls.VERSION, const.VERSION, language)
+
+    def _load(self):
+        try:
+            with open(self.path, "rb") as h:
+                data = pickle_load(h)
+        except FileNotFoundError:
+            return
+        except (OSError, PickleError, EOFError) as e:
+            print_w("Couldn't load plugin manifest %r: %s" % (self.path, e))
+            return
+
+        if not isinstance(data, dict) or data.get("key") != self._get_key():
+            print_d("Discarding outdated plugin manifest")
+            self._dirty = True
+            return
+        self._modules = data["modules"]
+
+    def __len__(self):
+        return len(self._modules)
+
+    def get(self, name, deps):
+        """Returns a list of `PluginStub` for the plugins in the module, or
+        None if the module isn't known or any of the `deps` file paths
+        changed.
+        """
+
+        entry = self._modules.get(name)
+        if entry is None:
+            return None
+
+        old_deps, infos = entry
+        if set(old_deps.keys()) != set(deps):
+            return None
+        for path, old_mtime in old_deps.items():
+            if mtime(path) != old_mtime:
+                return None
+
+        try:
+            return [PluginStub(name, info) for info in infos]
+        except (ImportError, AttributeError):
+            return None
+
+    def update(self, name, deps, classes):
+        """Stores the plugin classes of a module.
+
+        deps -- a dict of dependency file paths and their mtimes
+        """
+
+        infos = []
+        for cls in classes:
+            attributes = {k: getattr(cls, k) for k in ATTRIBUTES
+                          if hasattr(cls, k)}
+            if not all(_is_plain(v) for v in attributes.values()):
+                # can't be stored, import the module every time
+                self.remove(name)
+                return
+            infos.append({
+                "name": cls.__name__,
+                "bases": get_base_names(cls),
+                "attributes": attributes,
+            })
+
+        entry = (dict(deps), infos)
+        if self._modules.get(name) != entry:
+            self._modules[name] = entry
+            self._dirty = True
+
+    def remove(self, name):
+        if self._modules.pop(name, None) is not None:
+            self._dirty = True
+
+    def prune(self, names):
+        """Removes all modules not in `names`"""
+
+        for name in set(self._modules) - set(names):
+            self.remove(name)
+
+    def save(self):
+        if not self._dirty:
+            return
+        print_d("Saving plugin manifest: %d modules" % len(self._modules))
+        data = {"key": self._get_key(), "modules": self._modules}
+        try:
+            mkdir(os.path.dirname(self.path), 0o700)
+            with atomic_save(self.path, "wb") as h:
+                pickle_dump(data, h, 2)
+        except (OSError, PickleError) as e:
+            print_w("Couldn't save plugin manifest %r: %s" % (self.path, e))
+        else:
+            self._dirty = False
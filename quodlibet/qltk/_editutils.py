@@ -14,12 +14,14 @@ from senf import fsn2text
 
 from quodlibet import config
 from quodlibet import util
-from quodlibet import _
+from quodlibet import ngettext, _, print_e
 from quodlibet.plugins import PluginHandler
 from quodlibet.qltk.ccb import ConfigCheckButton
 from quodlibet.qltk.msg import WarningMessage, ErrorMessage
 from quodlibet.qltk import Icons
+from quodlibet.qltk.wlw import WritingWindow
 from quodlibet.util import connect_obj, connect_destroy
+from quodlibet.util.batchwrite import BatchWriter
 from quodlibet.errorreport import errorhook
 
 
@@ -46,18 +48,102 @@ class OverwriteWarning(WarningMessage):
 
 class WriteFailedError(ErrorMessage):
 
-    def __init__(self, parent, song):
+    def __init__(self, parent, song, count=1):
         title = _("Unable to save song")
 
         fn_format = "<b>%s</b>" % util.escape(fsn2text(song("~basename")))
-        description = _("Saving %(file-name)s failed. The file may be "
-            "read-only, corrupted, or you do not have "
-            "permission to edit it.") % {"file-name": fn_format}
+        if count > 1:
+            description = ngettext(
+                "Saving %(file-name)s and %(count)d other song failed. "
+                "The files may be read-only, corrupted, or you do not "
+                "have permission to edit them.",
+                "Saving %(file-name)s and %(count)d other songs failed. "
+                "The files may be read-only, corrupted, or you do not "
+                "have permission to edit them.",
+                count - 1) % {"file-name": fn_format, "count": count - 1}
+        else:
+            description = _("Saving %(file-name)s failed. The file may be "
+                "read-only, corrupted, or you do not have "
+                "permission to edit it.") % {"file-name": fn_format}
 
         super().__init__(
             parent, title, description)
 
 
+def write_songs(parent, library, changes, count):
+    """Changes and saves songs while showing a WritingWindow.
+
+    changes -- yields `count` (song, change) pairs. `change(song)` changes
+        the tags of the song and returns True if it needs to be saved, it
+        is None if nothing needs to be done for the song.
+
+    The tags get changed in the main loop while the files of the songs
+    changed before are written in worker threads. Songs which failed to
+    save or didn't get saved because stop was pressed are reloaded from
+    disk, and the library gets notified of all changes at once at the end.
+
+    Returns True if all songs were handled and saved.
+    """
+
+    win = WritingWindow(parent, count)
+    win.show()
+    writer = BatchWriter()
+    was_changed = set()
+    failed = []
+
+    def handle(results):
+        stop = False
+        for song, error in results:
+            if error is None:
+                was_changed.add(song)
+            else:
+                print_e("Saving %r failed: %s" % (song("~filename"), error))
+                failed.append(song)
+            stop = win.step() or stop
+        return stop
+
+    handled = 0
+    stopped = False
+    for song, change in changes:
+        if change is not None and not song.valid():
+            win.hide()
+            dialog = OverwriteWarning(parent, song)
+            resp = dialog.run()
+            win.show()
+            if resp != OverwriteWarning.RESPONSE_SAVE:
+                break
+
+        handled += 1
+        if change is not None and change(song):
+            writer.submit(song)
+        else:
+            stopped = win.step()
+
+        stopped = handle(writer.collect()) or stopped
+        while not stopped and writer.full:
+            stopped = handle(writer.collect(0.05)) or win.quit
+            while Gtk.events_pending():
+                Gtk.main_iteration()
+        if stopped:
+            break
+
+    cancelled = writer.cancel() if stopped else []
+    while writer.pending:
+        handle(writer.collect(0.05))
+        while Gtk.events_pending():
+            Gtk.main_iteration()
+    writer.shutdown()
+
+    for song in cancelled + failed:
+        library.reload(song, changed=was_changed)
+    win.destroy()
+    if failed:
+        WriteFailedError(parent, failed[0], len(failed)).run()
+    library.changed(was_changed)
+
+    return handled == count and not stopped and not failed
+
+
 class EditingPluginHandler(GObject.GObject, PluginHandler):
     __gsignals__ = {
         "changed": (GObject.SignalFlags.RUN_LAST, None, ())
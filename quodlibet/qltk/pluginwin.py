@@ -343,6 +343,8 @@ class PluginPreferencesContainer(Gtk.VBox):
         if plugin is None:
             frame.hide()
         else:
+            # the preferences need the real plugin class
+            PluginManager.instance.load(plugin)
             instance_or_cls = plugin.get_instance() or plugin.cls
 
             if plugin and hasattr(instance_or_cls, 'PluginPreferences'):
@@ -30,7 +30,8 @@ from quodlibet.qltk.x import Button, Align
 from quodlibet.qltk import Icons
 from quodlibet.util import copool, format_time_preferred
 from quodlibet.util.dprint import print_d
-from quodlibet.util.library import emit_signal, get_scan_dirs, scan_library
+from quodlibet.util.library import emit_signal, get_scan_dirs, scan_library, \
+    watch_library
 from quodlibet.util import connect_obj
 
 
@@ -701,6 +702,15 @@ class PreferencesWindow(UniqueWindow):
 
             cb = CCB(_("Scan library _on start"),
                      "library", "refresh_on_start", populate=True)
+            watch = CCB(_("_Watch directories for changes"),
+                        "library", "watch", populate=True,
+                        tooltip=_("Update the library as soon as files in "
+                                  "the scan directories change"))
+
+            def watch_cb(button):
+                watch_library(app.library)
+
+            watch.connect("toggled", watch_cb)
             scan_dirs = ScanBox()
 
             vb3 = Gtk.VBox(spacing=6)
@@ -725,6 +735,7 @@ class PreferencesWindow(UniqueWindow):
             grid = Gtk.Grid(column_spacing=6, row_spacing=6)
             cb.props.hexpand = True
             grid.attach(cb, 0, 0, 1, 1)
+            grid.attach(watch, 0, 1, 1, 1)
             grid.attach(refresh, 1, 0, 1, 1)
             grid.attach(reload_, 1, 1, 1, 1)
 
@@ -801,6 +812,8 @@ class PreferencesWindow(UniqueWindow):
         config.save()
         new_dirs = set(get_scan_dirs())
         gone_dirs = set(self.current_scan_dirs) - new_dirs
+        if new_dirs != set(self.current_scan_dirs):
+            watch_library(app.library)
         if new_dirs - set(self.current_scan_dirs):
             print_d("Library paths have been added, re-scanning...")
             scan_library(app.library, force=False)
@@ -56,7 +56,8 @@ from quodlibet.qltk.about import AboutDialog
 from quodlibet.util import copool, connect_destroy, connect_after_destroy
 from quodlibet.util.library import get_scan_dirs
 from quodlibet.util import connect_obj, print_d
-from quodlibet.util.library import background_filter, scan_library
+from quodlibet.util.library import background_filter, scan_library, \
+    watch_library
 from quodlibet.util.path import uri_is_valid
 from quodlibet.qltk.window import PersistentWindowMixin, Window, on_first_map
 from quodlibet.qltk.songlistcolumns import CurrentColumn
@@ -679,6 +680,7 @@ class QuodLibetWindow(Window, PersistentWindowMixin, AppWindow):
 
         if config.getboolean('library', 'refresh_on_start'):
             self.__rebuild(None, False)
+        watch_library(library)
 
         self.connect("key-press-event", self.__key_pressed, player)
 
@@ -9,6 +9,7 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
+import bisect
 from typing import List, Tuple
 
 from gi.repository import Gtk, GLib, Gdk, GObject
@@ -183,6 +184,46 @@ def get_sort_tag(tag):
     return tag
 
 
+def _use_bisect(count, total):
+    """If positioning `count` songs one by one in a list of `total` songs is
+    likely faster than going through all of them once.
+    """
+
+    # each position needs about log2(total) row lookups, which are a lot
+    # slower than the cached key lookups of a single pass
+    return count * 16 * total.bit_length() < total
+
+
+def _bisect_right(keys, key, lo, reverse):
+    """Like bisect.bisect_right, but supports keys sorted in reverse"""
+
+    if not reverse:
+        return bisect.bisect_right(keys, key, lo)
+    hi = len(keys)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if keys[mid] < key:
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+
+class _Reversed:
+    """Wraps a sort key so it sorts in reverse order inside of a tuple"""
+
+    __slots__ = ("key",)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+
 def header_tag_split(header):
     """Split a pattern or a tied tag into separate tags"""
 
@@ -419,6 +460,8 @@ class SongList(AllTreeView, SongListDnDMixin, DragScroll,
         # A priority list of how to apply the sort keys.
         # might contain column header names not present...
         self._sort_sequence = []
+        # column tag to {song: sort key}, cleared for changed songs
+        self.__sort_keys = {}
         self.set_column_headers(self.headers)
         librarian = library.librarian or library
 
@@ -760,21 +803,55 @@ class SongList(AllTreeView, SongListDnDMixin, DragScroll,
         order = self.get_sort_orders()
         if not order:
             return
-        for key, reverse in self.__get_song_sort_key_func(order):
-            songs.sort(key=key, reverse=reverse)
+        key, reverse = self.__get_song_sort_key(order)
+        songs.sort(key=key, reverse=reverse)
+
+    def __get_column_sort_key(self, column_tag):
+        """A sort key function for a column which caches the keys"""
+
+        tag = get_sort_tag(column_tag)
+        if tag == "":
+            return lambda s: s.sort_key
+
+        sort_func = AudioFile.sort_by_func(tag)
+        cache = self.__sort_keys.setdefault(column_tag, {})
+
+        def sort_key(song):
+            try:
+                return cache[song]
+            except KeyError:
+                key = cache[song] = sort_func(song)
+                return key
+
+        return sort_key
+
+    def __forget_sort_keys(self, songs):
+        for cache in self.__sort_keys.values():
+            for song in songs:
+                cache.pop(song, None)
+
+    def __get_song_sort_key(self, order):
+        """Returns a (key, reverse) pair, which sorts songs by all the sort
+        orders at once, the last one being the most significant.
+        """
+
+        # only keep the caches of sorted columns
+        tags = {tag for tag, reverse in order}
+        for tag in list(self.__sort_keys):
+            if tag not in tags:
+                del self.__sort_keys[tag]
 
-    def __get_song_sort_key_func(self, order):
         last_tag = None
         last_order = None
         first = True
-        key_func = []
-        for tag, reverse in order:
-            tag = get_sort_tag(tag)
+        keys = []
+        for column_tag, reverse in order:
+            tag = get_sort_tag(column_tag)
 
             # always sort using the default sort key first
             if first:
                 first = False
-                key_func.append((lambda s: s.sort_key, reverse))
+                keys.append((lambda s: s.sort_key, reverse))
                 last_order = reverse
                 last_tag = ""
 
@@ -784,12 +861,26 @@ class SongList(AllTreeView, SongListDnDMixin, DragScroll,
             last_order = reverse
             last_tag = tag
 
-            if tag == "":
-                key_func.append((lambda s: s.sort_key, reverse))
-            else:
-                sort_func = AudioFile.sort_by_func(tag)
-                key_func.append((sort_func, reverse))
-        return key_func
+            keys.append((self.__get_column_sort_key(column_tag), reverse))
+
+        # the last sort order is the most significant one
+        keys.reverse()
+        reverse = keys[0][1]
+        if len(keys) == 1:
+            return keys[0][0], reverse
+
+        funcs = [k for k, r in keys]
+        reversed_ = [r != reverse for k, r in keys]
+        if not any(reversed_):
+            return lambda s: tuple([f(s) for f in funcs]), reverse
+
+        funcs = list(zip(funcs, reversed_))
+
+        def sort_key(song):
+            return tuple([_Reversed(f(song)) if r else f(song)
+                          for f, r in funcs])
+
+        return sort_key, reverse
 
     def add_songs(self, songs):
         """Add songs to the list in the right order and position"""
@@ -806,9 +897,22 @@ class SongList(AllTreeView, SongListDnDMixin, DragScroll,
             model.append_many(songs)
             return
 
-        for song in songs:
-            insert_iter = self.__find_song_position(song)
-            model.insert_before(insert_iter, row=[song])
+        sort_key = key, reverse = self.__get_song_sort_key(
+            self.get_sort_orders())
+        songs = sorted(songs, key=key, reverse=reverse)
+
+        if _use_bisect(len(songs), len(model)):
+            for song in songs:
+                insert_iter = self.__find_song_position(song, sort_key)
+                model.insert_before(insert_iter, row=[song])
+            return
+
+        # merge the sorted songs into the rows in one pass
+        keys = [key(s) for s in model.itervalues()]
+        position = 0
+        for offset, song in enumerate(songs):
+            position = _bisect_right(keys, key(song), position, reverse)
+            model.insert(position + offset, row=[song])
 
     def set_songs(self, songs, sorted=False, scroll=True, scroll_select=False):
         """Fill the song list.
@@ -910,9 +1014,11 @@ class SongList(AllTreeView, SongListDnDMixin, DragScroll,
         selection.selected_foreach(func, None)
         return songs
 
-    def __find_song_position(self, song):
+    def __find_song_position(self, song, sort_key):
         """Finds the appropriate position of a song in a sorted song list.
 
+        `sort_key` is the (key, reverse) pair for the current sort order.
+
         Returns iter of the song after the given song according to the current
         sort order.
 
@@ -920,26 +1026,18 @@ class SongList(AllTreeView, SongListDnDMixin, DragScroll,
         """
 
         model = self.get_model()
-        order = self.get_sort_orders()
-        sort_key_func = list(enumerate(reversed(
-            self.__get_song_sort_key_func(order))))
-        song_sort_keys = [key(song) for i, (key, r) in sort_key_func]
+        key, reverse = sort_key
+        song_key = key(song)
         i = 0
         j = len(model)
         while i < j:
             mid = (i + j) // 2
             other_song_iter = model.iter_nth_child(None, mid)
-            other_song = model.get_value(other_song_iter)
-            song_is_lower = False
-            for i, (key, reverse) in sort_key_func:
-                other_key = key(other_song)
-                is_lower = song_sort_keys[i] < other_key
-                is_greater = song_sort_keys[i] > other_key
-                if not reverse and is_lower or reverse and is_greater:
-                    song_is_lower = True
-                    break
-                if not reverse and is_greater or reverse and is_lower:
-                    break
+            other_key = key(model.get_value(other_song_iter))
+            if reverse:
+                song_is_lower = other_key < song_key
+            else:
+                song_is_lower = song_key < other_key
             if song_is_lower:
                 j = mid
             else:
@@ -948,6 +1046,23 @@ class SongList(AllTreeView, SongListDnDMixin, DragScroll,
             return model.iter_nth_child(None, i)
         return None
 
+    def __resort(self, sort_key, songs):
+        """Moves all rows to their sorted position at once, if any of the
+        passed songs is in the list.
+        """
+
+        model = self.get_model()
+        values = model.get()
+        if set(songs).isdisjoint(values):
+            return
+        key, reverse = sort_key
+        keys = [key(s) for s in values]
+        # stable, so rows with equal keys keep their order
+        order = sorted(range(len(keys)), key=keys.__getitem__,
+                       reverse=reverse)
+        if order != list(range(len(keys))):
+            model.reorder(order)
+
     def __find_iters_in_selection(self, songs) -> Tuple[List, List, bool]:
         model, rows = self.get_selection().get_selected_rows()
         rows = rows or []
@@ -964,22 +1079,25 @@ class SongList(AllTreeView, SongListDnDMixin, DragScroll,
         """Only update rows that are currently displayed.
         Warning: This makes the row-changed signal useless.
         """
+        self.__forget_sort_keys(songs)
         model = self.get_model()
         if not config.getboolean("memory", "shuffle", False) and \
             config.getboolean("song_list", "auto_sort") and self.is_sorted():
+            sort_key = self.__get_song_sort_key(self.get_sort_orders())
             iters, _, complete = self.__find_iters_in_selection(songs)
 
-            if not complete:
-                iters = model.find_all(songs)
-
-            rows = [Gtk.TreeRowReference.new(model, model.get_path(i))
-                    for i in iters]
+            # searching all rows is as expensive as sorting them again
+            if complete and _use_bisect(len(iters), len(model)):
+                rows = [Gtk.TreeRowReference.new(model, model.get_path(i))
+                        for i in iters]
 
-            for row in rows:
-                iter = model.get_iter(row.get_path())
-                song = model.get_value(iter)
-                insert_iter = self.__find_song_position(song)
-                model.move_before(iter, insert_iter)
+                for row in rows:
+                    iter = model.get_iter(row.get_path())
+                    song = model.get_value(iter)
+                    insert_iter = self.__find_song_position(song, sort_key)
+                    model.move_before(iter, insert_iter)
+            else:
+                self.__resort(sort_key, songs)
 
         vrange = self.get_visible_range()
         if vrange is None:
@@ -997,6 +1115,7 @@ class SongList(AllTreeView, SongListDnDMixin, DragScroll,
             self.add_songs(list(filter(filter_, songs)))
 
     def __song_removed(self, librarian, songs, player):
+        self.__forget_sort_keys(songs)
         try:
             # The player needs to be called first so it can ge the next song
             # in case the current one gets deleted and the order gets reset.
@@ -149,6 +149,11 @@ class TrackCurrentModel(ObjectStore):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.__iter = None
+        # song to iters, built on the first lookup and kept up to date
+        # while it exists, the iters stay valid on reorder
+        self.__index = None
+        self.__index_size = 0
+        self.__index_sigs = []
 
     last_current = None
     """The last valid current song"""
@@ -199,6 +204,55 @@ class TrackCurrentModel(ObjectStore):
         self.__iter = iter_
         self.last_current = self.current
 
+    def __get_index(self):
+        if self.__index is None:
+            index = {}
+            for iter_, value in self.iterrows():
+                index.setdefault(value, []).append(iter_)
+            self.__index = index
+            self.__index_size = len(self)
+            self.__index_sigs = [
+                self.connect("row-inserted", self.__index_inserted),
+                self.connect("row-deleted", self.__index_deleted),
+            ]
+        return self.__index
+
+    def __drop_index(self):
+        if self.__index is not None:
+            for signal_id in self.__index_sigs:
+                self.disconnect(signal_id)
+            self.__index_sigs = []
+            self.__index = None
+
+    def __index_inserted(self, model, path, iter_):
+        value = self.get_value(iter_)
+        if value is None:
+            # not atomic, we don't get told about the value
+            self.__drop_index()
+            return
+        self.__index.setdefault(value, []).append(iter_.copy())
+        self.__index_size += 1
+
+    def __index_deleted(self, model, path):
+        # rows should only be removed through remove()
+        if len(self) != self.__index_size:
+            self.__drop_index()
+
+    def __unindex(self, iter_):
+        value = self.get_value(iter_)
+        iters = self.__index.get(value, [])
+        position = self.__position(iter_)
+        for i, other in enumerate(iters):
+            if self.__position(other) == position:
+                del iters[i]
+                self.__index_size -= 1
+                break
+        if not iters:
+            self.__index.pop(value, None)
+
+    def __position(self, iter_):
+        return self.get_path(iter_)[0]
+
     def find(self, song):
         """Returns the iter to the first occurrence of song in the model
         or None if it wasn't found.
@@ -208,32 +262,33 @@ class TrackCurrentModel(ObjectStore):
         if self.current == song:
             return self.current_iter
 
-        # search the rest
-        for iter_, value in self.iterrows():
-            if value == song:
-                return iter_
-        return
+        iters = self.__get_index().get(song)
+        if not iters:
+            return
+        return min(iters, key=self.__position).copy()
 
     def find_all(self, songs):
         """Returns a list of iters for all occurrences of all songs.
         (since a song can be in the model multiple times)
         """
 
-        songs = set(songs)
+        index = self.__get_index()
         found = []
-        append = found.append
-        for iter_, value in self.iterrows():
-            if value in songs:
-                append(iter_)
-        return found
+        for song in set(songs):
+            found.extend(index.get(song, []))
+        found.sort(key=self.__position)
+        return [iter_.copy() for iter_ in found]
 
     def remove(self, iter_):
         if self.__iter and self[iter_].path == self[self.__iter].path:
             self.__iter = None
+        if self.__index is not None:
+            self.__unindex(iter_)
         super().remove(iter_)
 
     def clear(self):
         self.__iter = None
+        self.__drop_index()
         super().clear()
 
     def __contains__(self, song):
@@ -254,11 +309,17 @@ class PlaylistModel(TrackCurrentModel):
         self.order = order_cls()
 
         # The playorder plugins use paths atm to remember songs so
-        # we need to reset them if the paths change somehow.
-        self.__sigs = []
-        for sig in ['row-deleted', 'row-inserted', 'rows-reordered']:
-            s = self.connect(sig, lambda pl, *x: self.order.reset(pl))
-            self.__sigs.append(s)
+        # we need to tell them if the paths change somehow.
+        self.__sigs = [
+            self.connect("row-inserted", lambda pl, path, *x:
+                         self.order.song_inserted(pl, path.get_indices()[0])),
+            self.connect("row-deleted", lambda pl, path:
+                         self.order.song_removed(pl, path.get_indices()[0])),
+            self.connect("row-changed", lambda pl, path, *x:
+                         self.order.song_changed(pl, path.get_indices()[0])),
+            self.connect("rows-reordered",
+                         lambda pl, *x: self.order.reset(pl)),
+        ]
 
     def next(self):
         """Switch to the next song"""
@@ -7,6 +7,7 @@
 
 import re
 import os
+from functools import partial
 
 from gi.repository import Gtk
 from senf import fsn2text
@@ -18,12 +19,9 @@ from quodlibet import config
 from quodlibet import qltk
 from quodlibet import util
 
-from quodlibet.formats import AudioFileError
 from quodlibet.plugins import PluginManager
 from quodlibet.qltk._editutils import FilterPluginBox, FilterCheckButton
-from quodlibet.qltk._editutils import EditingPluginHandler, OverwriteWarning
-from quodlibet.qltk._editutils import WriteFailedError
-from quodlibet.qltk.wlw import WritingWindow
+from quodlibet.qltk._editutils import EditingPluginHandler, write_songs
 from quodlibet.qltk.views import TreeViewColumn
 from quodlibet.qltk.cbes import ComboBoxEntrySave
 from quodlibet.qltk.models import ObjectStore
@@ -274,23 +272,9 @@ class TagsFromPath(Gtk.VBox):
         pattern = TagsFromPattern(pattern_text)
         model = self.view.get_model()
         add = bool(addreplace.get_active())
-        win = WritingWindow(self, len(model))
-        win.show()
 
-        was_changed = set()
-
-        all_done = False
-        for entry in ((model and model.values()) or []):
-            song = entry.song
+        def change(entry, song):
             changed = False
-            if not song.valid():
-                win.hide()
-                dialog = OverwriteWarning(self, song)
-                resp = dialog.run()
-                win.show()
-                if resp != OverwriteWarning.RESPONSE_SAVE:
-                    break
-
             for i, h in enumerate(pattern.headers):
                 text = entry.get_match(h)
                 if text:
@@ -304,23 +288,12 @@ class TagsFromPath(Gtk.VBox):
                                 song.add(h, val)
                                 changed = True
 
-            if changed:
-                try:
-                    song.write()
-                except AudioFileError:
-                    util.print_exc()
-                    WriteFailedError(self, song).run()
-                    library.reload(song, changed=was_changed)
-                    break
-                was_changed.add(song)
-
-            if win.step():
-                break
-        else:
-            all_done = True
+            return changed
 
-        win.destroy()
-        library.changed(was_changed)
+        entries = (model and model.values()) or []
+        all_done = write_songs(
+            self, library, ((e.song, partial(change, e)) for e in entries),
+            len(model))
         self.save.set_sensitive(not all_done)
 
     def __row_edited(self, renderer, path, new, model, header):
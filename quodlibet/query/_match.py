@@ -12,12 +12,15 @@
 from __future__ import annotations
 
 import operator
+import sre_constants
+import sre_parse
 import time
+from itertools import compress
 from numbers import Real
-from typing import TypeVar, List, Iterable
+from typing import TypeVar, List, Iterable, Optional, Set, Tuple, Union as U
 
-from quodlibet.formats import FILESYSTEM_TAGS, TIME_TAGS
-from quodlibet.unisearch import compile
+from quodlibet.formats import FILESYSTEM_TAGS, TIME_TAGS, AudioFile
+from quodlibet.unisearch import compile, fold
 from quodlibet.util import parse_date
 from senf import fsn2text, fsnative
 
@@ -34,12 +37,48 @@ class ParseError(Error):
 
 class Node:
 
+    _tested = 0
+    _matched = 0
+
     def search(self, data: T) -> bool:
         raise NotImplementedError
 
+    def cost(self) -> float:
+        """The estimated relative cost of a search() call"""
+        return 1.0
+
+    @property
+    def match_rate(self) -> float:
+        """The observed fraction of searched items matching, as recorded by
+        the parent `Inter` or `Union`. 0.5 if nothing was recorded yet.
+        """
+        return (self._matched + 1) / (self._tested + 2)
+
+    def describe(self, depth: int = 0) -> List[str]:
+        """Lines describing the evaluation plan, for debugging"""
+        return ["%s%r cost=%.1f rate=%.2f" % (
+            "  " * depth, self, self.cost(), self.match_rate)]
+
     def filter(self, sequence: Iterable[T]) -> List[T]:
         return [s for s in sequence if self.search(s)]
 
+    def candidates(self, index) -> Optional[Set[T]]:
+        """Returns a superset of the matching items using a
+        `quodlibet.library.index.TagIndex`, or None if all items have to be
+        searched.
+        """
+        return None
+
+    def value_candidates(self, index, tag: str) -> Optional[Set[T]]:
+        """Like candidates(), but for value nodes used in `Tag`"""
+        return None
+
+    def matches(self, index) -> Optional[Set[T]]:
+        """Like candidates(), but returns exactly the matching items, or
+        None if they can't be determined using the index alone.
+        """
+        return None
+
     def _unpack(self) -> Node:
         return self
 
@@ -76,6 +115,87 @@ class Regex(Node):
     def __repr__(self):
         return "<Regex pattern=%s mod=%s>" % (self.pattern, self.mod_string)
 
+    def literal(self) -> Optional[Tuple[str, str]]:
+        """Returns (kind, text) if the pattern matches a literal text in
+        a line, with kind being "exact" (e.g. ^foo$), "prefix" (^foo) or
+        "contains" (foo). None for anything more complex.
+        """
+
+        literal = regex_literal(self.pattern)
+        if literal is not None and "d" in self.mod_string:
+            # letters match the same characters unisearch.fold() merges,
+            # punctuation can match characters folding to something else
+            if not all(c.isalnum() or c.isspace() for c in literal[1]):
+                return None
+        return literal
+
+    def value_candidates(self, index, tag):
+        literal = self.literal()
+        if literal is None:
+            return None
+        return index.lookup(tag, *literal)
+
+
+def regex_literal(pattern: str) -> Optional[Tuple[str, str]]:
+    """Like `Regex.literal`, for a regex pattern string"""
+
+    try:
+        items = list(sre_parse.parse(pattern))
+    except sre_constants.error:
+        return None
+
+    at, literal = sre_constants.AT, sre_constants.LITERAL
+    start = end = False
+    if items and items[0][0] is at and items[0][1] in (
+            sre_constants.AT_BEGINNING,
+            sre_constants.AT_BEGINNING_STRING):
+        start = True
+        items = items[1:]
+    if items and items[-1][0] is at and items[-1][1] in (
+            sre_constants.AT_END, sre_constants.AT_END_STRING):
+        end = True
+        items = items[:-1]
+    if not all(op is literal for op, av in items):
+        return None
+
+    text = "".join(chr(av) for op, av in items)
+    if "\n" in text:
+        return None
+    if start and end:
+        return "exact", text
+    elif start:
+        return "prefix", text
+    elif text:
+        return "contains", text
+    return None
+
+
+class FoldedText(Node):
+    """Matches text containing `text`, ignoring case and diacritics on
+    both sides (see `unisearch.fold`).
+
+    A cheaper alternative to a diacritic insensitive `Regex` for literal
+    text. `Tag` searches it in the folded values cached by `AudioFile`.
+    """
+
+    def __init__(self, text: str):
+        self.text = str(text)
+        self.folded = fold(self.text)
+
+    def search(self, text):
+        return self.folded in fold(text)
+
+    def value_candidates(self, index, tag):
+        if "\n" in self.text:
+            return None
+        return index.lookup(tag, "contains", self.text)
+
+    def cost(self):
+        return 0.5
+
+    def __repr__(self):
+        return "<FoldedText text=%r>" % self.text
+
 
 class True_(Node):
     """Always True"""
@@ -83,6 +203,9 @@ class True_(Node):
     def search(self, data):
         return True
 
+    def cost(self):
+        return 0.0
+
     def filter(self, sequence):
         return list(sequence)
 
@@ -103,9 +226,18 @@ class False_(Node):
     def search(self, data):
         return False
 
+    def cost(self):
+        return 0.0
+
     def filter(self, sequence):
         return []
 
+    def candidates(self, index):
+        return set()
+
+    def value_candidates(self, index, tag):
+        return set()
+
     def __repr__(self):
         return "<False>"
 
@@ -117,20 +249,132 @@ class False_(Node):
         return self
 
 
-class Union(Node):
-    """True if the object matches any of its REs."""
+def _union_candidates(results: Iterable[Optional[Set[T]]]) \
+        -> Optional[Set[T]]:
+    union: Set[T] = set()
+    for result in results:
+        if result is None:
+            return None
+        union |= result
+    return union
+
+
+def _inter_matches(results: Iterable[Optional[Set[T]]]) -> Optional[Set[T]]:
+    inter = None
+    for result in results:
+        if result is None:
+            return None
+        if inter is None:
+            inter = set(result)
+        else:
+            inter &= result
+    return inter
+
+
+def _inter_candidates(results: Iterable[Optional[Set[T]]]) \
+        -> Optional[Set[T]]:
+    inter = None
+    for result in results:
+        if result is None:
+            continue
+        if inter is None:
+            inter = set(result)
+        else:
+            inter &= result
+        if not inter:
+            break
+    return inter
+
+
+class _Planned(Node):
+    """Evaluates its children in an order based on their estimated cost and
+    observed match rate, so that cheap children which decide the result
+    most of the time go first.
+    """
+
+    SAMPLE_INTERVAL = 16
+    """Record the match rates of the children every n-th search"""
+
+    REPLAN_INTERVAL = 1024
+    """Reorder the children every n-th search"""
+
+    _stop_on: bool
+    """The child result which decides the result"""
 
     def __init__(self, res: List[Node]):
         self.res = res
+        self._searches = 0
+        self.replan()
+
+    def _rank(self, node: Node) -> float:
+        """Lower ranks get evaluated first"""
+        rate = node.match_rate if self._stop_on else 1 - node.match_rate
+        return node.cost() / max(rate, 0.001)
+
+    def replan(self):
+        """Reorders the children based on the current estimates"""
+        # stable, so children estimated equal stay in the given order
+        self._plan = sorted(self.res, key=self._rank)
+
+    def cost(self):
+        # each child only gets evaluated if the previous ones didn't decide
+        total = 0.0
+        reached = 1.0
+        for re in self._plan:
+            total += reached * re.cost()
+            rate = re.match_rate
+            reached *= 1 - rate if self._stop_on else rate
+        return total
+
+    def _sample(self, data) -> bool:
+        """Like search(), but records the match rates of the children"""
+
+        if self._searches % self.REPLAN_INTERVAL == 0:
+            self.replan()
+        stop_on = self._stop_on
+        for re in self._plan:
+            re._tested += 1
+            result = bool(re.search(data))
+            re._matched += result
+            if result is stop_on:
+                return stop_on
+        return not stop_on
+
+    def describe(self, depth=0):
+        lines = ["%s%s cost=%.1f rate=%.2f" % (
+            "  " * depth, type(self).__name__, self.cost(), self.match_rate)]
+        for re in self._plan:
+            lines.extend(re.describe(depth + 1))
+        return lines
+
+
+class Union(_Planned):
+    """True if the object matches any of its REs."""
+
+    _stop_on = True
 
     def search(self, data):
-        for re in self.res:
+        self._searches += 1
+        if not self._searches % self.SAMPLE_INTERVAL:
+            return self._sample(data)
+        for re in self._plan:
             if re.search(data):
                 return True
         return False
 
+    def candidates(self, index):
+        return _union_candidates(
+            re.candidates(index) for re in self.res)
+
+    def value_candidates(self, index, tag):
+        return _union_candidates(
+            re.value_candidates(index, tag) for re in self.res)
+
+    def matches(self, index):
+        return _union_candidates(re.matches(index) for re in self.res)
+
     def __repr__(self):
-        return "<Union %r>" % self.res
+        return "<Union %r>" % self._plan
 
     def __or__(self, other):
         other = other._unpack()
@@ -151,28 +395,45 @@ class Union(Node):
         return Inter([self, other])
 
 
-class Inter(Node):
+class Inter(_Planned):
     """True if the object matches all of its REs."""
 
-    def __init__(self, res):
-        self.res = res
+    _stop_on = False
 
     def search(self, data):
-        for re in self.res:
+        self._searches += 1
+        if not self._searches % self.SAMPLE_INTERVAL:
+            return self._sample(data)
+        for re in self._plan:
             if not re.search(data):
                 return False
         return True
 
     def filter(self, sequence):
         current = sequence
-        for re in self.res:
-            current = filter(re.search, current)
         if not isinstance(current, list):
             current = list(current)
+        for re in self._plan:
+            tested = len(current)
+            current = [s for s in current if re.search(s)]
+            re._tested += tested
+            re._matched += len(current)
+        self.replan()
         return current
 
+    def candidates(self, index):
+        return _inter_candidates(
+            re.candidates(index) for re in self.res)
+
+    def value_candidates(self, index, tag):
+        return _inter_candidates(
+            re.value_candidates(index, tag) for re in self.res)
+
+    def matches(self, index):
+        return _inter_matches(re.matches(index) for re in self.res)
+
     def __repr__(self):
-        return "<Inter %r>" % self.res
+        return "<Inter %r>" % self._plan
 
     def __and__(self, other):
         other = other._unpack()
@@ -201,6 +462,14 @@ class Neg(Node):
     def search(self, data):
         return not self.res.search(data)
 
+    def cost(self):
+        return self.res.cost()
+
+    def describe(self, depth=0):
+        return ["%sNeg cost=%.1f rate=%.2f" % (
+            "  " * depth, self.cost(), self.match_rate)
+        ] + self.res.describe(depth + 1)
+
     def __repr__(self):
         return "<Neg %r>" % self.res
 
@@ -247,6 +516,37 @@ class Numcmp(Node):
             return self._op(val, val2)
         return False
 
+    def cost(self):
+        if self._expr.use_date() or self._expr2.use_date():
+            # parses the date
+            return 5.0
+        return 2.0
+
+    def matches(self, index):
+        time_ = time.time()
+        use_date = self._expr.use_date() or self._expr2.use_date()
+        val = self._expr.evaluate_all(index, time_, use_date)
+        if val is None:
+            return None
+        val2 = self._expr2.evaluate_all(index, time_, use_date)
+        if val2 is None:
+            return None
+
+        # missing values are NaN, which only compare unequal
+        op = self._op
+        if op is operator.ne:
+            def op(a, b):
+                return a != b and a == a and b == b
+
+        songs = index.numeric_songs
+        result = _apply(op, val, val2)
+        if isinstance(result, list):
+            return set(compress(songs, result))
+        return set(songs) if result else set()
+
+    def candidates(self, index):
+        return self.matches(index)
+
     def __repr__(self):
         return "<Numcmp expr=%r, op=%r, expr2=%r>" % (
             self._expr, self._op.__name__, self._expr2)
@@ -264,6 +564,22 @@ class Numcmp(Node):
         return Union([self, other])
 
 
+Values = U[Real, List[Real]]
+"""A number, or a number per song for evaluate_all()"""
+
+
+def _apply(op, val: Values, val2: Values) -> Values:
+    """Applies `op` to the numbers, element wise if any of them is a list"""
+
+    if isinstance(val, list):
+        if isinstance(val2, list):
+            return list(map(op, val, val2))
+        return [op(v, val2) for v in val]
+    elif isinstance(val2, list):
+        return [op(val, v) for v in val2]
+    return op(val, val2)
+
+
 class Numexpr:
     """Expression in numeric comparison"""
 
@@ -277,6 +593,16 @@ class Numexpr:
         """
         raise NotImplementedError
 
+    def evaluate_all(self, index, time: float, use_date: bool) \
+            -> Optional[Values]:
+        """Evaluate the expression for all songs of a
+        `quodlibet.library.index.TagIndex` at once, in the order of
+        `numeric_songs`. Missing values are NaN.
+
+        Returns None if the expression can't be evaluated this way.
+        """
+        return None
+
     def use_date(self) -> bool:
         """Returns whether to force the final comparison to compare the date
         values instead of the number values."""
@@ -310,6 +636,14 @@ class NumexprTag(Numexpr):
             return round(num, 2)
         return None
 
+    def evaluate_all(self, index, time, use_date):
+        column = index.numeric(self._tag)
+        if column is None:
+            return None
+        if self._ftag in TIME_TAGS:
+            return [round(time - num, 2) for num in column]
+        return [round(num, 2) for num in column]
+
     def __repr__(self):
         return "<NumexprTag tag=%r>" % self._tag
 
@@ -334,6 +668,14 @@ class NumexprUnary(Numexpr):
             return self.__op(val)
         return None
 
+    def evaluate_all(self, index, time, use_date):
+        val = self.__expr.evaluate_all(index, time, use_date)
+        if isinstance(val, list):
+            return [self.__op(v) for v in val]
+        elif val is not None:
+            return self.__op(val)
+        return None
+
     def __repr__(self):
         return "<NumexprUnary op=%r expr=%r>" % (self.__op, self.__expr)
 
@@ -376,12 +718,24 @@ class NumexprBinary(Numexpr):
         val = self.__expr.evaluate(data, time, use_date)
         val2 = self.__expr2.evaluate(data, time, use_date)
         if val is not None and val2 is not None:
-            try:
-                return self.__op(val, val2)
-            except ZeroDivisionError:
-                return val * float('inf')
+            return self.__apply(val, val2)
         return None
 
+    def evaluate_all(self, index, time, use_date):
+        val = self.__expr.evaluate_all(index, time, use_date)
+        if val is None:
+            return None
+        val2 = self.__expr2.evaluate_all(index, time, use_date)
+        if val2 is None:
+            return None
+        return _apply(self.__apply, val, val2)
+
+    def __apply(self, val, val2):
+        try:
+            return self.__op(val, val2)
+        except ZeroDivisionError:
+            return val * float('inf')
+
     def __repr__(self):
         return "<NumexprBinary op=%r expr=%r expr2=%r>" % (
             self.__op, self.__expr, self.__expr2)
@@ -399,6 +753,9 @@ class NumexprGroup(Numexpr):
     def evaluate(self, data, time, use_date):
         return self.__expr.evaluate(data, time, use_date)
 
+    def evaluate_all(self, index, time, use_date):
+        return self.__expr.evaluate_all(index, time, use_date)
+
     def __repr__(self):
         return "<NumexprGroup expr=%r>" % (self.__expr)
 
@@ -415,6 +772,9 @@ class NumexprNumber(Numexpr):
     def evaluate(self, data, time, use_date):
         return self._value
 
+    def evaluate_all(self, index, time, use_date):
+        return self._value
+
     def __repr__(self):
         return "<NumexprNumber value=%.2f>" % (self._value)
 
@@ -428,6 +788,9 @@ class NumexprNow(Numexpr):
     def evaluate(self, data, time, use_date):
         return time - self.__offset
 
+    def evaluate_all(self, index, time, use_date):
+        return time - self.__offset
+
     def __repr__(self):
         return "<NumexprNow offset=%r>" % (self.__offset)
 
@@ -451,6 +814,9 @@ class NumexprNumberOrDate(Numexpr):
         else:
             return self.number
 
+    def evaluate_all(self, index, time, use_date):
+        return self.evaluate(None, time, use_date)
+
     def __repr__(self):
         return ('<NumexprNumberOrDate number=%r date=%r>' %
                 (self.number, self.date))
@@ -501,6 +867,13 @@ def numexprTagOrSpecial(tag):
         return NumexprTag(tag)
 
 
+TAG_COSTS = {
+    "~lyrics": 50.0,
+    "~playlists": 20.0,
+}
+"""Estimated search costs of tags which are expensive to compute"""
+
+
 class Tag(Node):
     """See if a property of the object matches its RE."""
 
@@ -531,7 +904,15 @@ class Tag(Node):
             else:
                 self._names.append(name)
 
+        # the folded values only depend on the song, so can be cached
+        self.__cached = None
+        if isinstance(res, FoldedText) and not self.__intern:
+            self.__cached = tuple(self._names + self.__fs)
+
     def search(self, data):
+        if self.__cached and isinstance(data, AudioFile):
+            return self.res.folded in data.search_text(self.__cached)
+
         search = self.res.search
         fs_default = fsnative()
 
@@ -556,6 +937,18 @@ class Tag(Node):
 
         return False
 
+    def cost(self):
+        tag_cost = len(self._names) + sum(
+            TAG_COSTS.get(name, 2.0) for name in self.__intern + self.__fs)
+        return tag_cost * self.res.cost()
+
+    def candidates(self, index):
+        if self.__fs:
+            return None
+        return _union_candidates(
+            self.res.value_candidates(index, name)
+            for name in self._names + self.__intern)
+
     def __repr__(self):
         names = self._names + self.__intern
         return ("<Tag names=%r, res=%r>" % (names, self.res))
@@ -604,6 +997,10 @@ class Extension(Node):
     def search(self, data):
         return self.__valid and self.__plugin.search(data, self.__body)
 
+    def cost(self):
+        # plugins are free to do anything
+        return 20.0
+
     @property
     def valid(self) -> bool:
         return self.__valid
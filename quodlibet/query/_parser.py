@@ -33,11 +33,12 @@ DATE = re.compile(r'\d{4}(-\d{1,2}(-\d{1,2})?)?')
 class QueryParser:
     """Parse the input. One lookahead token, start symbol is Query."""
 
-    def __init__(self, tokens, star=[]):
+    def __init__(self, tokens, star=[], folded=False):
         self.tokens = tokens
         self.index = 0
         self.last_match = None
         self.star = star
+        self.folded = folded
 
     def space(self):
         """Advance to the first non-space token"""
@@ -278,7 +279,7 @@ class QueryParser:
                 # Hack to force plain text parsing for top level free text
                 raise ParseError('Free text not allowed at top level of query')
 
-            return match.Regex(re_escape(self.expect_re(TEXT)), u"d")
+            return self.text_or_regex(re_escape(self.expect_re(TEXT)), u"d")
 
     def RegexpMods(self, regex):
         """Consume regexp modifiers from tokens and compile provided regexp
@@ -286,6 +287,16 @@ class QueryParser:
         """
 
         mod_string = self.expect_re(MODIFIERS)
+        return self.text_or_regex(regex, mod_string)
+
+    def text_or_regex(self, regex, mod_string):
+        """A FoldedText for diacritic insensitive literal text if folded
+        is set, a Regex otherwise"""
+
+        if self.folded and mod_string == u"d":
+            literal = match.regex_literal(regex)
+            if literal is not None and literal[0] == "contains":
+                return match.FoldedText(literal[1])
         return match.Regex(regex, mod_string)
 
     def Star(self, outer=False):
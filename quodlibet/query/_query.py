@@ -74,9 +74,11 @@ class Query(Node):
         self.star = list(star)
         self.string = string
 
+        folded = config.getboolean("browsers", "folded_search")
         self.type = QueryType.VALID
         try:
-            self._match = QueryParser(string, star=star).StartQuery()
+            self._match = QueryParser(
+                string, star=star, folded=folded).StartQuery()
             if not self._match.valid:
                 self.type = QueryType.INVALID
             return
@@ -92,7 +94,8 @@ class Query(Node):
 
             try:
                 self.type = QueryType.TEXT
-                self._match = QueryParser(string, star=star).StartQuery()
+                self._match = QueryParser(
+                    string, star=star, folded=folded).StartQuery()
                 return
             except self.Error:
                 pass
@@ -119,9 +122,37 @@ class Query(Node):
     def search(self):
         return self._match.search
 
-    @cached_property
-    def filter(self):
-        return self._match.filter
+    def filter(self, sequence):
+        """Returns the matching items of `sequence`, in the same order.
+
+        If `sequence` provides a `tag_index` (see `SongLibrary`) it gets
+        used to only search a subset of the items.
+        """
+
+        index = getattr(sequence, "tag_index", None)
+        if index is not None:
+            matches = self._match.matches(index)
+            if matches is not None:
+                print_d(f"Found {len(matches)} matches using the index")
+                return [s for s in sequence if s in matches]
+            candidates = self._match.candidates(index)
+            if candidates is not None:
+                print_d(f"Searching {len(candidates)} indexed candidates")
+                sequence = [s for s in sequence if s in candidates]
+        return self._match.filter(sequence)
+
+    def candidates(self, index):
+        return self._match.candidates(index)
+
+    def matches(self, index):
+        return self._match.matches(index)
+
+    @property
+    def plan(self) -> str:
+        """A description of the current evaluation order of the query, with
+        the estimated cost and observed match rate of each part.
+        """
+        return "\n".join(self._match.describe())
 
     @property
     def valid(self) -> bool:
@@ -153,12 +153,20 @@ class QuodLibetUnixRemote(RemoteBase):
         for command, path in messages:
             command = bytes2fsn(command, None)
             response = self._cmd_registry.handle_line(self._app, command)
-            if path is not None:
-                path = bytes2fsn(path, None)
-                with open(path, "wb") as h:
-                    if response is not None:
-                        assert isinstance(response, fsnative)
-                        h.write(fsn2bytes(response, None))
+            if path is None:
+                continue
+            path = bytes2fsn(path, None)
+            if response is not None and not isinstance(response, fsnative):
+                # a large response, written while it gets produced
+                chunks = (fsn2bytes(c, None) for c in response)
+                try:
+                    fifo.write_fifo_chunks(path, chunks)
+                except EnvironmentError as e:
+                    print_w("Couldn't write response: %s" % e)
+                continue
+            with open(path, "wb") as h:
+                if response is not None:
+                    h.write(fsn2bytes(response, None))
 
 
 Remote: Type[RemoteBase]
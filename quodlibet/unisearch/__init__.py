@@ -20,6 +20,8 @@ knowledge of other languages.
 """
 
 from .parser import compile
+from .fold import fold
 
 
 compile
+fold
@@ -0,0 +1,48 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+import unicodedata
+from typing import Dict
+
+from quodlibet.util import cached_func
+
+from .db import get_decomps_mapping, get_punctuation_mapping
+
+
+@cached_func
+def get_fold_mapping() -> Dict[int, str]:
+    """Returns a str.translate() table for non-ASCII characters which
+    don't decompose to ASCII, mapping them to the ASCII text they are
+    similar to.
+    """
+
+    pairs = list(get_decomps_mapping().items())
+    pairs += get_punctuation_mapping().items()
+
+    mapping: Dict[int, str] = {}
+    # prefer the shortest replacement
+    for ascii_, chars in sorted(pairs, key=lambda p: len(p[0])):
+        for c in chars:
+            if ord(c) >= 128:
+                mapping.setdefault(ord(c), ascii_)
+    return mapping
+
+
+def fold(text: str) -> str:
+    """Returns `text` case folded, with diacritics removed and similar
+    looking characters replaced by their ASCII counterparts.
+
+    fold(u"Björk – Jóga") => u"bjork - joga"
+
+    Unlike `compile(.., asym=True)` this is symmetric, so searching
+    for folded text in folded text ignores diacritics on both sides.
+    """
+
+    if text.isascii():
+        return text.lower()
+
+    text = unicodedata.normalize("NFKD", text).translate(get_fold_mapping())
+    combining = unicodedata.combining
+    return "".join(c for c in text if not combining(c)).casefold()
@@ -0,0 +1,107 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+"""Writing the tags of many songs at once.
+
+Every write opens and rewrites the whole file, which is slow for large
+batches, especially on network shares. `BatchWriter` saves the files in a
+pool of worker threads while the main loop keeps changing the tags of the
+following songs and showing the progress.
+"""
+
+from concurrent import futures
+
+from quodlibet.formats import AudioFile, AudioFileError
+from quodlibet.util import print_d
+
+
+class BatchWriter:
+    """Calls AudioFile.write_file() for queued songs in `workers` threads.
+
+    The songs themselves only get changed in the main loop: collect()
+    calls AudioFile.sanitize() for the songs written by then. Songs which
+    override AudioFile.write() instead get written right away in submit().
+
+    Not thread-safe, all methods have to be called from the main loop. The
+    tags of a song must not be changed while it is queued.
+    """
+
+    def __init__(self, workers=4):
+        self.workers = workers
+        self._executor = futures.ThreadPoolExecutor(workers)
+        self._pending = {}  # future: song
+
+    @property
+    def pending(self):
+        """Number of songs queued or currently being written"""
+
+        return len(self._pending)
+
+    @property
+    def full(self):
+        """If enough songs are queued to keep all workers busy"""
+
+        return len(self._pending) >= self.workers * 2
+
+    def submit(self, song):
+        """Queues writing the song"""
+
+        if type(song).write is AudioFile.write:
+            future = self._executor.submit(song.write_file)
+        else:
+            # writes more than the file, keep it in the main loop
+            future = futures.Future()
+            try:
+                song.write()
+            except AudioFileError as e:
+                future.set_exception(e)
+            else:
+                future.set_result(None)
+        self._pending[future] = song
+
+    def collect(self, timeout=0):
+        """Waits up to `timeout` seconds for at least one write to finish.
+
+        Returns a list of (song, exception) for all writes finished since
+        the last call. The exception is None if the write succeeded.
+        """
+
+        if not self._pending:
+            return []
+
+        done, __ = futures.wait(
+            self._pending, timeout=timeout,
+            return_when=futures.FIRST_COMPLETED)
+
+        results = []
+        for future in done:
+            song = self._pending.pop(future)
+            error = future.exception()
+            if error is None:
+                song.sanitize()
+            results.append((song, error))
+        return results
+
+    def cancel(self):
+        """Drops all queued writes which haven't started yet.
+
+        Returns the songs which didn't get written; their tags in memory
+        don't match the files anymore.
+        """
+
+        cancelled = []
+        for future, song in list(self._pending.items()):
+            if future.cancel():
+                del self._pending[future]
+                cancelled.append(song)
+        if cancelled:
+            print_d("Cancelled writing %d song(s)" % len(cancelled))
+        return cancelled
+
+    def shutdown(self):
+        """Stops the workers once the results of all writes are collected"""
+
+        assert not self._pending
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,312 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+"""Caches for showing the covers of many albums, like the album list and the
+cover grid do.
+
+`CoverIndex` remembers where the cover for a group of songs was found, so it
+doesn't have to be searched again as long as none of the involved files and
+directories changed. Embedded covers are stored there as pre-scaled
+thumbnails, since they would have to be extracted from the audio file
+otherwise and never hit the thumbnail cache.
+
+`PixbufLRU` keeps the most recently used scaled covers in memory.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from gi.repository import GdkPixbuf, GLib
+from senf import fsnative
+
+from quodlibet import print_d, print_w
+from quodlibet.util.atomic import atomic_save
+from quodlibet.util.path import mkdir, mtime
+from quodlibet.util.picklehelper import pickle_dump, pickle_load, \
+    PickleError
+from quodlibet.util.thumbnails import ThumbSize
+
+
+Dependencies = Tuple[Tuple[fsnative, float], ...]
+
+
+def group_id(songs) -> str:
+    """A key identifying a group of songs, stable between sessions"""
+
+    keys = sorted(song.key for song in songs)
+    data = "\0".join(keys).encode("utf-8", "surrogateescape")
+    return hashlib.md5(data).hexdigest()
+
+
+def get_dependencies(songs, *extra_paths) -> Dependencies:
+    """The files and directories (with their mtimes) which can change
+    which cover gets found for the songs, plus `extra_paths` like the
+    path of the found cover.
+    """
+
+    # non-file songs don't have an mtime, but make it possible to
+    # invalidate their entries with CoverIndex.invalidate()
+    paths = set()
+    for song in songs:
+        paths.add(song("~filename"))
+        if song.is_file:
+            paths.add(song("~dirname"))
+    paths.update(extra_paths)
+    return tuple((p, mtime(p)) for p in sorted(paths))
+
+
+class PixbufLRU:
+    """A thread-safe LRU cache of pixbufs, limited by their size in memory"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._size = 0
+        self._items: "OrderedDict[object, GdkPixbuf.Pixbuf]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    @property
+    def hit_rate(self) -> float:
+        """The fraction of get() calls which found a pixbuf"""
+
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    @staticmethod
+    def _pixbuf_size(pixbuf):
+        return pixbuf.get_rowstride() * pixbuf.get_height()
+
+    def get(self, key) -> Optional[GdkPixbuf.Pixbuf]:
+        with self._lock:
+            pixbuf = self._items.get(key)
+            if pixbuf is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return pixbuf
+
+    def put(self, key, pixbuf: GdkPixbuf.Pixbuf):
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._size -= self._pixbuf_size(old)
+            self._items[key] = pixbuf
+            self._size += self._pixbuf_size(pixbuf)
+            while self._size > self.max_bytes and len(self._items) > 1:
+                key, old = self._items.popitem(last=False)
+                self._size -= self._pixbuf_size(old)
+
+    def remove_if(self, predicate):
+        """Removes all items for which predicate(key) is true"""
+
+        with self._lock:
+            for key in [k for k in self._items if predicate(k)]:
+                self._size -= self._pixbuf_size(self._items.pop(key))
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._size = 0
+
+
+class CoverIndex:
+    """Persistent mapping of song groups to the location of their cover.
+
+    Each entry stores the cover path, None if no cover was found. For
+    embedded covers the path points to a thumbnail stored by the index.
+    Entries are only returned as long as the mtimes of all dependencies are
+    unchanged and the `settings` passed to lookup() are the same as when
+    they were stored.
+
+    Entries not looked up for a while, like the ones of albums which no
+    longer exist, get removed when the index is loaded.
+
+    Thread-safe.
+    """
+
+    THUMB_SIZE = ThumbSize.LARGE
+    """The size of the stored thumbnails of embedded covers"""
+
+    SAVE_DELAY = 5
+
+    NO_COVER_MAX_AGE = 24 * 60 * 60
+    """Seconds to trust entries without a cover, as covers can also show up
+    in places which aren't dependencies"""
+
+    MAX_UNUSED_AGE = 30 * 24 * 60 * 60
+    """Seconds after which entries not looked up get removed"""
+
+    USED_UPDATE_INTERVAL = 24 * 60 * 60
+    """How often to update the time an entry was last looked up"""
+
+    def __init__(self, path: fsnative):
+        self.path = path
+        self.thumb_dir = os.path.join(os.path.dirname(path), "cover-thumbnails")
+        self._entries: Optional[Dict[str, tuple]] = None
+        self._lock = threading.RLock()
+        self._save_id = None
+
+    def _load(self):
+        if self._entries is not None:
+            return self._entries
+        entries = {}
+        try:
+            with open(self.path, "rb") as h:
+                entries = pickle_load(h)
+            if not isinstance(entries, dict):
+                raise PickleError("Not a dict")
+        except FileNotFoundError:
+            pass
+        except (OSError, PickleError, EOFError) as e:
+            print_w(f"Couldn't load cover index {self.path!r}: {e}")
+            entries = {}
+        self._entries = entries
+        self._prune()
+        return entries
+
+    def _prune(self):
+        entries = self._entries
+        now = time.time()
+        removed = 0
+        for group, entry in list(entries.items()):
+            if not isinstance(entry, tuple) or len(entry) != 6 or \
+                    now - entry[5] > self.MAX_UNUSED_AGE:
+                del entries[group]
+                removed += 1
+
+        # thumbnails of removed entries, or left behind by a crash
+        thumbs = {e[1] for e in entries.values() if e[2]}
+        try:
+            names = os.listdir(self.thumb_dir)
+        except OSError:
+            names = []
+        for name in names:
+            path = os.path.join(self.thumb_dir, name)
+            if path not in thumbs:
+                self._remove_thumbnail(path)
+
+        if removed:
+            print_d(f"Removed {removed} unused cover index entries")
+            self._changed()
+
+    def lookup(self, group: str, settings) -> Optional[tuple]:
+        """Returns (path, embedded) or None if there is no valid entry"""
+
+        now = time.time()
+        with self._lock:
+            entry = self._load().get(group)
+            if entry is None:
+                return None
+            entry_settings, path, embedded, deps, stored, used = entry
+            if now - used > self.USED_UPDATE_INTERVAL:
+                self._entries[group] = entry[:5] + (now,)
+                self._changed()
+        if entry_settings != settings:
+            return None
+        if path is None and now - stored > self.NO_COVER_MAX_AGE:
+            return None
+        for dep, dep_mtime in deps:
+            if mtime(dep) != dep_mtime:
+                return None
+        return path, embedded
+
+    def store(self, group: str, settings, path: Optional[fsnative],
+              deps: Dependencies):
+        """Stores the cover path for a group of songs, or that there is none
+        if path is None.
+        """
+
+        with self._lock:
+            old = self._load().get(group)
+            if old is not None and old[2] and old[1] != path:
+                self._remove_thumbnail(old[1])
+            now = time.time()
+            self._entries[group] = (settings, path, False, deps, now, now)
+            self._changed()
+
+    def store_embedded(self, group: str, settings, pixbuf: GdkPixbuf.Pixbuf,
+                       deps: Dependencies) -> Optional[fsnative]:
+        """Stores a thumbnail of an embedded cover (scaled to THUMB_SIZE)
+        and returns its path, None if it couldn't be saved.
+        """
+
+        with self._lock:
+            # pruning on load would remove the new thumbnail
+            self._load()
+
+        path = os.path.join(self.thumb_dir, group + ".png")
+        try:
+            mkdir(self.thumb_dir, 0o700)
+            pixbuf.savev(path, "png", [], [])
+        except (OSError, GLib.GError) as e:
+            print_w(f"Couldn't save cover thumbnail {path!r}: {e}")
+            return None
+
+        with self._lock:
+            now = time.time()
+            self._load()[group] = (settings, path, True, deps, now, now)
+            self._changed()
+        return path
+
+    def invalidate(self, paths) -> List[str]:
+        """Removes all entries depending on one of the paths, returns the
+        groups of the removed entries.
+        """
+
+        paths = set(paths)
+        removed = []
+        with self._lock:
+            entries = self._load()
+            for group, (settings, path, embedded, deps, stored, used) in \
+                    list(entries.items()):
+                if any(dep in paths for dep, dep_mtime in deps):
+                    del entries[group]
+                    if embedded:
+                        self._remove_thumbnail(path)
+                    removed.append(group)
+            if removed:
+                self._changed()
+        return removed
+
+    def _remove_thumbnail(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _changed(self):
+        if self._save_id is None:
+            self._save_id = GLib.timeout_add_seconds(
+                self.SAVE_DELAY, self._save_cb)
+
+    def _save_cb(self):
+        with self._lock:
+            self._save_id = None
+        self.save()
+        return False
+
+    def save(self):
+        with self._lock:
+            if self._save_id is not None:
+                GLib.source_remove(self._save_id)
+                self._save_id = None
+            if self._entries is None:
+                return
+            print_d(f"Saving {len(self._entries)} cover index entries")
+            try:
+                mkdir(os.path.dirname(self.path), 0o700)
+                with atomic_save(self.path, "wb") as h:
+                    pickle_dump(self._entries, h, 2)
+            except (OSError, PickleError) as e:
+                print_w(f"Couldn't save cover index {self.path!r}: {e}")
@@ -0,0 +1,166 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+"""Scheduling of cover loading for views showing many covers.
+
+Requests are queued in the main loop and handed to a fixed number of worker
+threads, the most urgent ones (usually the ones closest to the visible area)
+first. Requests which are no longer needed can be dropped before they get
+started.
+"""
+
+import heapq
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+from gi.repository import GLib
+
+from quodlibet import util
+from quodlibet.util import print_d
+
+
+class LoadRequest:
+    """A queued request, see CoverLoader.submit()"""
+
+    __slots__ = ("priority", "order", "prepare", "callback", "cancel",
+                 "tag")
+
+    def __init__(self, priority, order, prepare, callback, cancel, tag):
+        self.priority = priority
+        self.order = order
+        self.prepare = prepare
+        self.callback = callback
+        self.cancel = cancel
+        self.tag = tag
+
+    def __lt__(self, other):
+        return (self.priority, self.order) < (other.priority, other.order)
+
+
+class CoverLoader:
+    """Runs loading functions in `workers` threads, ordered by priority.
+
+    Not thread-safe, all methods have to be called from the main loop.
+    """
+
+    def __init__(self, workers=4):
+        self.workers = workers
+        self._queue = []
+        self._order = itertools.count()
+        self._running = 0
+        self._executor = None
+        self._dispatch_id = None
+
+        self.completed = 0
+        """Number of requests which were loaded in a worker"""
+
+        self.dropped = 0
+        """Number of requests which were cancelled or stale when their
+        turn came"""
+
+        self.max_queue_depth = 0
+        """The largest number of queued requests seen"""
+
+    @property
+    def queue_depth(self):
+        """Number of requests waiting for a worker"""
+
+        return len(self._queue)
+
+    @property
+    def running(self):
+        """Number of requests currently loaded in a worker"""
+
+        return self._running
+
+    def submit(self, prepare, callback, cancel, priority=0, tag=None):
+        """Queues a request and returns it.
+
+        Once a worker is free and there are no requests with a lower
+        `priority` value, `prepare` gets called in the main loop. It returns
+        None if there is nothing to load, or a function which gets called in
+        a worker. Its result gets passed to `callback` in the main loop.
+
+        Nothing gets called once `cancel` (a Gio.Cancellable) is cancelled.
+        `tag` identifies the request in reprioritize().
+        """
+
+        request = LoadRequest(
+            priority, next(self._order), prepare, callback, cancel, tag)
+        heapq.heappush(self._queue, request)
+        self.max_queue_depth = max(self.max_queue_depth, len(self._queue))
+        self._schedule()
+        return request
+
+    def reprioritize(self, cancel, get_priority):
+        """Updates the priority of all queued requests submitted with
+        `cancel`.
+
+        get_priority(tag) returns the new priority, or None if the request
+        isn't needed anymore and should be dropped.
+        """
+
+        queue = []
+        for request in self._queue:
+            if request.cancel is cancel:
+                priority = get_priority(request.tag)
+                if priority is None:
+                    self.dropped += 1
+                    continue
+                request.priority = priority
+            queue.append(request)
+        heapq.heapify(queue)
+        self._queue = queue
+
+    def _schedule(self):
+        if self._dispatch_id is None and self._queue and \
+                self._running < self.workers:
+            # dispatch once all requests of this main loop iteration
+            # are queued, so the most urgent ones get started first
+            self._dispatch_id = GLib.idle_add(self._dispatch)
+
+    def _dispatch(self):
+        self._dispatch_id = None
+
+        while self._queue and self._running < self.workers:
+            request = heapq.heappop(self._queue)
+            if request.cancel.is_cancelled():
+                self.dropped += 1
+                continue
+
+            try:
+                func = request.prepare()
+            except Exception:
+                util.print_exc()
+                continue
+            if func is None:
+                continue
+
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers)
+            self._running += 1
+            future = self._executor.submit(func)
+            future.add_done_callback(
+                lambda f, r=request: GLib.idle_add(self._done, r, f))
+
+        return False
+
+    def _done(self, request, future):
+        self._running -= 1
+        self.completed += 1
+
+        try:
+            result = future.result()
+        except Exception:
+            util.print_exc()
+        else:
+            if not request.cancel.is_cancelled():
+                request.callback(result)
+
+        if not self._queue and not self._running:
+            print_d(f"Loaded {self.completed} covers, dropped {self.dropped}, "
+                    f"max queue depth {self.max_queue_depth}")
+        self._schedule()
+        return False
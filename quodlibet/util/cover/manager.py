@@ -6,19 +6,26 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
+import os
 from itertools import chain
 
-from gi.repository import GObject
+from gi.repository import GObject, GdkPixbuf, GLib
+from senf import fsnative
 
 from quodlibet import _
+from quodlibet import config
+from quodlibet import get_cache_dir
 from quodlibet.formats import AudioFile
 from quodlibet.plugins import PluginManager, PluginHandler
 from quodlibet.qltk.notif import Task
 from quodlibet.util.cover import built_in
+from quodlibet.util.cover.cache import CoverIndex, PixbufLRU, group_id, \
+    get_dependencies
+from quodlibet.util.cover.loader import CoverLoader
 from quodlibet.util import print_d
-from quodlibet.util.thread import call_async
-from quodlibet.util.thumbnails import get_thumbnail_from_file
-from quodlibet.plugins.cover import CoverSourcePlugin
+from quodlibet.util.thumbnails import get_thumbnail_from_file, get_thumbnail
+from quodlibet.qltk.image import scale
+from quodlibet.plugins.cover import CoverSourcePlugin, cover_dir
 
 
 class CoverPluginHandler(PluginHandler):
@@ -66,9 +73,18 @@ class CoverManager(GObject.Object):
 
     plugin_handler = None
 
+    PIXBUF_CACHE_SIZE = 32 * 1024 * 1024
+    """Memory used for keeping scaled covers for get_pixbuf_many()"""
+
+    LOADER_WORKERS = 4
+    """Number of threads loading covers for get_pixbuf_many_async()"""
+
     def __init__(self, use_built_in=True):
         super().__init__()
         self.plugin_handler = CoverPluginHandler(use_built_in)
+        self.pixbufs = PixbufLRU(self.PIXBUF_CACHE_SIZE)
+        self.index = CoverIndex(os.path.join(get_cache_dir(), "cover-index"))
+        self.loader = CoverLoader(self.LOADER_WORKERS)
 
     def init_plugins(self):
         """Register the cover sources plugin handler with the global
@@ -90,6 +106,8 @@ class CoverManager(GObject.Object):
         to re-fetch the cover and do a display update.
         """
 
+        self.index.invalidate(song("~filename") for song in songs)
+        self.pixbufs.clear()
         self.emit("cover-changed", songs)
 
     def acquire_cover(self, callback, cancellable, song):
@@ -150,7 +168,15 @@ class CoverManager(GObject.Object):
         """Same as acquire_cover_sync but returns a cover for multiple
         images"""
 
-        for plugin in self.sources:
+        found = self.__find_cover(songs, embedded, external)
+        if found is not None:
+            return found[1]
+
+    def __find_cover(self, songs, embedded=True, external=True, sources=None):
+        # returns (source, cover) or None
+        if sources is None:
+            sources = self.sources
+        for plugin in sources:
             if not embedded and plugin.embedded:
                 continue
             if not external and not plugin.embedded:
@@ -167,7 +193,7 @@ class CoverManager(GObject.Object):
                 song = sorted(group, key=lambda s: s.key)[0]
                 cover = plugin(song).cover
                 if cover:
-                    return cover
+                    return plugin, cover
 
     def get_cover(self, song):
         """Returns a cover file object for one song or None.
@@ -187,6 +213,81 @@ class CoverManager(GObject.Object):
 
         return self.acquire_cover_sync_many(songs)
 
+    def __cover_settings(self, sources):
+        # everything besides the files which influences the found cover
+        return (tuple(source.__name__ for source in sources),
+                config.getboolean("albumart", "force_filename"),
+                config.get("albumart", "filename"))
+
+    def __find_indexed(self, songs, group, sources, settings):
+        """Like get_cover_many(), but uses and updates the cover index.
+
+        Returns None or (group, settings, cover, embedded, deps), cover being
+        a path if it was found in the index, or a file object. deps is only
+        set if the cover still has to be stored in the index.
+
+        Thread-safe, as long as `sources` (a list of the current cover
+        sources) and `settings` (see __cover_settings()) were taken in the
+        main loop.
+        """
+
+        entry = self.index.lookup(group, settings)
+        if entry is not None:
+            path, embedded = entry
+            if path is None:
+                return
+            return group, settings, path, embedded, None
+
+        found = self.__find_cover(songs, sources=sources)
+        if found is None:
+            # cover source plugins download into cover_dir
+            self.index.store(
+                group, settings, None, get_dependencies(songs, cover_dir))
+            return
+
+        source, cover = found
+        path = getattr(cover, "name", None)
+        if source.embedded or not isinstance(path, fsnative) or \
+                not os.path.isabs(path):
+            return group, settings, cover, True, get_dependencies(songs)
+
+        self.index.store(group, settings, path, get_dependencies(songs, path))
+        return group, settings, cover, False, None
+
+    def __load_pixbuf(self, found, boundary):
+        """Returns a pixbuf for the result of __find_indexed() or None.
+
+        Thread-safe.
+        """
+
+        group, settings, cover, embedded, deps = found
+        thumb_size = self.index.THUMB_SIZE
+        width, height = boundary
+
+        pixbuf = None
+        if isinstance(cover, str):
+            try:
+                if embedded:
+                    pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_size(
+                        cover, width, height)
+                else:
+                    pixbuf = get_thumbnail(cover, boundary)
+            except GLib.GError:
+                pass
+        elif embedded and width <= thumb_size and height <= thumb_size:
+            # store a thumbnail, so the file doesn't have to be opened
+            # and the image extracted next time
+            thumb = get_thumbnail_from_file(cover, (thumb_size, thumb_size))
+            if thumb is not None:
+                self.index.store_embedded(group, settings, thumb, deps)
+                pixbuf = scale(thumb, boundary)
+        else:
+            pixbuf = get_thumbnail_from_file(cover, boundary)
+
+        if pixbuf is not None:
+            self.pixbufs.put((group, width, height), pixbuf)
+        return pixbuf
+
     def get_pixbuf_many(self, songs, width, height):
         """Returns a Pixbuf which fits into the boundary defined by width
         and height or None.
@@ -194,30 +295,61 @@ class CoverManager(GObject.Object):
         Uses the thumbnail cache if possible.
         """
 
-        fileobj = self.get_cover_many(songs)
-        if fileobj is None:
+        group = group_id(songs)
+        pixbuf = self.pixbufs.get((group, width, height))
+        if pixbuf is not None:
+            return pixbuf
+
+        sources = list(self.sources)
+        found = self.__find_indexed(
+            songs, group, sources, self.__cover_settings(sources))
+        if found is None:
             return
 
-        return get_thumbnail_from_file(fileobj, (width, height))
+        return self.__load_pixbuf(found, (width, height))
 
     def get_pixbuf(self, song, width, height):
         """see get_pixbuf_many()"""
 
         return self.get_pixbuf_many([song], width, height)
 
-    def get_pixbuf_many_async(self, songs, width, height, cancel, callback):
+    def get_pixbuf_many_async(self, songs, width, height, cancel, callback,
+                              priority=0, tag=None):
         """Async variant; callback gets called with a pixbuf or not called
         in case of an error. cancel is a Gio.Cancellable.
 
+        Covers get loaded in a limited number of threads, lower `priority`
+        values first. See CoverLoader.reprioritize() for `tag`.
+
         The callback will be called in the main loop.
         """
 
-        fileobj = self.get_cover_many(songs)
-        if fileobj is None:
+        group = group_id(songs)
+        pixbuf = self.pixbufs.get((group, width, height))
+        if pixbuf is not None:
+            def idle_cb():
+                if not cancel.is_cancelled():
+                    callback(pixbuf)
+            GLib.idle_add(idle_cb)
             return
 
-        call_async(get_thumbnail_from_file, cancel, callback,
-                   args=(fileobj, (width, height)))
+        def prepare():
+            # sources and config can change, so get them in the main loop
+            sources = list(self.sources)
+            settings = self.__cover_settings(sources)
+
+            def load():
+                found = self.__find_indexed(songs, group, sources, settings)
+                if found is not None:
+                    return self.__load_pixbuf(found, (width, height))
+
+            return load
+
+        def done(pixbuf):
+            if pixbuf is not None:
+                callback(pixbuf)
+
+        self.loader.submit(prepare, done, cancel, priority, tag)
 
     def search_cover(self, cancellable, songs):
         """Search for all the covers applicable to `songs` across all providers
@@ -23,7 +23,7 @@ from gi.repository import GLib
 from senf import mkstemp, fsn2bytes
 
 from quodlibet.util.path import mkdir
-from quodlibet.util import print_d
+from quodlibet.util import print_d, print_exc
 
 FIFO_TIMEOUT = 10
 """time in seconds until we give up writing/reading"""
@@ -157,6 +157,69 @@ def write_fifo(fifo_path, data):
             pass
 
 
+def write_fifo_chunks(fifo_path, chunks, done_cb=None):
+    """Writes the byte chunks of an iterable to a FIFO (or file) as the
+    reader consumes them, without blocking the main loop.
+
+    The next chunk is only fetched once the previous one is written, so
+    large responses can be produced incrementally. Empty chunks are allowed
+    and give the main loop a chance to run.
+
+    Args:
+        fifo_path (pathlike)
+        chunks (Iterable[bytes])
+        done_cb (Callable[[], None] or None): called once everything is
+            written or writing failed
+    Raises:
+        EnvironmentError: in case the FIFO can't be opened
+    """
+
+    from quodlibet import qltk
+
+    fd = os.open(fifo_path, os.O_WRONLY)
+    os.set_blocking(fd, False)
+    chunks = iter(chunks)
+    buf = bytearray()
+
+    def finish():
+        try:
+            os.close(fd)
+        except OSError:
+            pass
+        if done_cb is not None:
+            done_cb()
+        return False
+
+    def can_write_cb(source, condition):
+        if condition & (GLib.IO_ERR | GLib.IO_HUP):
+            return finish()
+
+        if not buf:
+            try:
+                buf.extend(next(chunks))
+            except StopIteration:
+                return finish()
+            except Exception:
+                print_exc()
+                return finish()
+
+        while buf:
+            try:
+                written = os.write(fd, buf)
+            except (IOError, OSError) as e:
+                if e.errno in (errno.EWOULDBLOCK, errno.EAGAIN):
+                    return True
+                elif e.errno == errno.EINTR:
+                    continue
+                return finish()
+            del buf[:written]
+        return True
+
+    qltk.io_add_watch(
+        fd, GLib.PRIORITY_LOW, GLib.IO_OUT | GLib.IO_ERR | GLib.IO_HUP,
+        can_write_cb)
+
+
 def fifo_exists(fifo_path):
     """Returns whether a FIFO exists (and is writeable).
 
@@ -113,6 +113,20 @@ def scan_library(library, force):
                cofuncid="library", funcid="library")
 
 
+def watch_library(library):
+    """Start or stop watching the scan directories for changes,
+    depending on the config.
+
+    Args:
+        library (FileLibrary)
+    """
+
+    if config.getboolean("library", "watch"):
+        library.watch(get_scan_dirs(), get_exclude_dirs())
+    else:
+        library.unwatch()
+
+
 def emit_signal(songs, signal="changed", block_size=50, name=None,
                 cofuncid=None):
     """
@@ -58,6 +58,7 @@ class ModuleScanner:
     as key.
 
     rescan() - Update the module list. Returns added/removed module names
+    load() - Import a module which was deferred in rescan()
     failures - A dict of Name: (Exception, Text) for all modules that failed
     modules - A dict of Name: Module for all successfully loaded modules
 
@@ -79,11 +80,48 @@ class ModuleScanner:
 
         return self.__modules
 
-    def rescan(self):
+    def __import(self, name, path):
+        # add a real module, so that pickle works
+        # https://github.com/quodlibet/quodlibet/issues/1093
+        parent = "quodlibet.fake"
+        if parent not in sys.modules:
+            spec = importlib.machinery.ModuleSpec(
+                parent, None, is_package=True)
+            sys.modules[parent] = importlib.util.module_from_spec(spec)
+        vars(sys.modules["quodlibet"])["fake"] = sys.modules[parent]
+
+        return load_module(name, parent + ".plugins", dirname(path))
+
+    def load(self, name):
+        """Imports a module which was deferred in rescan().
+
+        Returns the Module, or None if importing failed. In that case the
+        module gets removed and the error added to `failures`.
+        """
+
+        mod = self.__modules[name]
+        if mod.module is not None:
+            return mod
+
+        try:
+            mod.module = self.__import(name, mod.path)
+        except Exception as err:
+            text = format_exception(*sys.exc_info())
+            self.__failures[name] = ModuleImportError(name, err, text)
+
+        if mod.module is None:
+            del self.__modules[name]
+            return None
+        return mod
+
+    def rescan(self, defer=None):
         """Rescan all folders for changed/new/removed modules.
 
         The caller should release all references to removed modules.
 
+        defer(name, deps) can return True to not import a new module for
+        now. It gets added with `module` set to None until load() is called.
+
         Returns a tuple: (removed, added)
         """
 
@@ -125,17 +163,13 @@ class ModuleScanner:
             if name in self.__modules:
                 continue
 
+            if defer is not None and defer(name, deps):
+                added.append(name)
+                self.__modules[name] = Module(name, None, deps, path)
+                continue
+
             try:
-                # add a real module, so that pickle works
-                # https://github.com/quodlibet/quodlibet/issues/1093
-                parent = "quodlibet.fake"
-                if parent not in sys.modules:
-                    spec = importlib.machinery.ModuleSpec(
-                        parent, None, is_package=True)
-                    sys.modules[parent] = importlib.util.module_from_spec(spec)
-                vars(sys.modules["quodlibet"])["fake"] = sys.modules[parent]
-
-                mod = load_module(name, parent + ".plugins", dirname(path))
+                mod = self.__import(name, path)
                 if mod is None:
                     continue
             except Exception as err:
@@ -40,6 +40,20 @@ class Cancellable:
         self._cancelled = True
 
 
+def cancellable_iter(iterable, cancellable, interval=500):
+    """Yields the items of `iterable`, but stops early once `cancellable`
+    is cancelled. It gets checked every `interval` items.
+
+    For long loops in functions passed to call_async(), whose result won't
+    be used anyway once cancelled.
+    """
+
+    for i, item in enumerate(iterable):
+        if not i % interval and cancellable.is_cancelled():
+            return
+        yield item
+
+
 _pools = {}
 _prio_mapping = {
     Priority.HIGH: GLib.PRIORITY_DEFAULT,
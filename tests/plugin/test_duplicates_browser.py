@@ -57,3 +57,46 @@ class TDuplicates(PluginTestCase):
     def test_starts_up(self):
         sws = [SongWrapper(s) for s in app.library.songs]
         self.plugin.plugin_songs(sws).destroy()
+
+    def test_index(self):
+        songs = [AudioFile({"~filename": "/dev/%d" % i,
+                            "artist": "foo", "title": "bar"})
+                 for i in range(3)]
+        app.library.add(songs[:2])
+        index = self.kind.get_index(app.library)
+        key = index.get_key(songs[0])
+        self.assertEqual(index.get_group(key), set(songs[:2]))
+
+        app.library.add(songs[2:])
+        self.assertEqual(index.get_group(key), set(songs))
+
+        songs[0]["title"] = "other"
+        app.library.changed(songs[:1])
+        self.assertEqual(index.get_group(key), set(songs[1:]))
+        self.assertEqual(
+            index.get_group(index.get_key(songs[0])), {songs[0]})
+
+        app.library.remove(songs[1:2])
+        self.assertEqual(index.get_group(key), {songs[2]})
+        self.assertIs(self.kind.get_index(app.library), index)
+
+    def test_disabled(self):
+        index = self.kind.get_index(app.library)
+        self.plugin.disabled()
+        self.assertIsNone(self.kind._index)
+        self.assertFalse(index._sigs)
+        self.assertIsNot(self.kind.get_index(app.library), index)
+
+    def test_similar(self):
+        song = AudioFile({"~filename": "/dev/a", "artist": "Foo",
+                          "title": "Bar (Remastered)", "~#length": 200})
+        similar = AudioFile({"~filename": "/dev/b", "artist": "foo",
+                             "title": "bar!", "~#length": 202})
+        longer = AudioFile({"~filename": "/dev/c", "artist": "foo",
+                            "title": "bar", "~#length": 300})
+        other = AudioFile({"~filename": "/dev/d", "artist": "foo",
+                           "title": "baz", "~#length": 200})
+        app.library.add([song, similar, longer, other])
+        index = self.kind.get_index(app.library)
+        self.assertEqual(index.get_similar(song, 3), {song, similar})
+        self.assertEqual(self.mod.get_similarity_key(AudioFile()), "")
@@ -70,6 +70,21 @@ class TMPDCommands(PluginTestCase):
         config.init()
         init_fake_app()
 
+        def new_song(path, **kwargs):
+            song = AudioFile({"~filename": fsnative(path), "~#length": 10})
+            song.update(kwargs)
+            return song
+
+        self.songs = [
+            new_song(u"/music/a/1.ogg", artist=u"Foo", album=u"One",
+                     title=u"First"),
+            new_song(u"/music/a/2.ogg", artist=u"Foo", album=u"Two",
+                     title=u"Second"),
+            new_song(u"/music/b/3.ogg", artist=u"Bar", album=u"One",
+                     title=u"Third"),
+        ]
+        app.library.add(self.songs)
+
         MPDServerPlugin = self.mod.MPDServerPlugin
         MPDConnection = self.mod.main.MPDConnection
         MPDService = self.mod.main.MPDService
@@ -81,6 +96,7 @@ class TMPDCommands(PluginTestCase):
                 pass
 
         server = Server()
+        self.service = server.service
         s, c = socket.socketpair()
         self.s = s
         c.setblocking(False)
@@ -99,6 +115,7 @@ class TMPDCommands(PluginTestCase):
             return self.s.recv(99999)
 
     def tearDown(self):
+        self.service.destroy()
         destroy_fake_app()
         config.quit()
 
@@ -124,3 +141,124 @@ class TMPDCommands(PluginTestCase):
     def test_idle_close(self):
         for cmd in ["idle", "noidle", "close"]:
             self._cmd(cmd.encode("ascii") + b"\n")
+
+    def _lines(self, data):
+        return self._cmd(data).decode("utf-8").splitlines()
+
+    def test_find(self):
+        lines = self._lines(b"find artist Foo\n")
+        self.assertEqual(
+            [l for l in lines if l.startswith("file:")],
+            ["file: music/a/1.ogg", "file: music/a/2.ogg"])
+        self.assertEqual(lines[-1], "OK")
+
+        lines = self._lines(b"find artist Foo album Two\n")
+        self.assertEqual(lines[0], "file: music/a/2.ogg")
+        self.assertEqual(self._lines(b"find artist foo\n"), ["OK"])
+
+    def test_find_errors(self):
+        self.assertTrue(self._lines(b"find artist\n")[0].startswith("ACK"))
+        self.assertTrue(
+            self._lines(b"find nope foo\n")[0].startswith("ACK"))
+
+    def test_search(self):
+        lines = self._lines(b"search title IR\n")
+        self.assertEqual(
+            [l for l in lines if l.startswith("file:")],
+            ["file: music/a/1.ogg", "file: music/b/3.ogg"])
+
+    def test_count(self):
+        self.assertEqual(self._lines(b"count album One\n"),
+                         ["songs: 2", "playtime: 20", "OK"])
+
+    def test_list(self):
+        self.assertEqual(self._lines(b"list artist\n"),
+                         ["Artist: Bar", "Artist: Foo", "OK"])
+        self.assertEqual(self._lines(b"list album Foo\n"),
+                         ["Album: One", "Album: Two", "OK"])
+        self.assertEqual(self._lines(b"list album artist Bar\n"),
+                         ["Album: One", "OK"])
+        self.assertEqual(
+            self._lines(b"list album group artist\n"),
+            ["Artist: Bar", "Album: One", "Artist: Foo", "Album: One",
+             "Album: Two", "OK"])
+
+    def test_list_changed(self):
+        self._lines(b"list artist\n")
+        song = self.songs[2]
+        song["artist"] = u"Quux"
+        app.library.changed([song])
+        self.assertEqual(self._lines(b"list artist\n"),
+                         ["Artist: Foo", "Artist: Quux", "OK"])
+        app.library.remove([song])
+        self.assertEqual(self._lines(b"list artist\n"),
+                         ["Artist: Foo", "OK"])
+
+    def test_lsinfo(self):
+        self.assertEqual(self._lines(b"lsinfo\n"),
+                         ["directory: music", "OK"])
+        self.assertEqual(self._lines(b"lsinfo music\n"),
+                         ["directory: music/a", "directory: music/b", "OK"])
+        lines = self._lines(b"lsinfo music/b\n")
+        self.assertEqual(lines[0], "file: music/b/3.ogg")
+        self.assertTrue(
+            self._lines(b"lsinfo nope\n")[0].startswith("ACK [50"))
+
+    def test_listall(self):
+        self.assertEqual(
+            self._lines(b"listall music\n"),
+            ["directory: music/a", "file: music/a/1.ogg",
+             "file: music/a/2.ogg", "directory: music/b",
+             "file: music/b/3.ogg", "OK"])
+        lines = self._lines(b"listallinfo\n")
+        self.assertEqual(len([l for l in lines if l.startswith("file:")]), 3)
+        self.assertIn("Title: Third", lines)
+
+    def test_listall_library_changed(self):
+        lines = self.service.listall("music")
+        self.assertEqual(next(lines), "directory: music/a")
+        # the rest gets listed lazily
+        app.library.remove(self.songs[2:])
+        self.assertEqual(
+            list(lines),
+            ["file: music/a/1.ogg", "file: music/a/2.ogg",
+             "directory: music/b"])
+
+    def test_playlist(self):
+        status = dict(l.split(": ", 1) for l in self._lines(b"status\n")[:-1])
+        version = int(status["playlist"])
+        self.assertEqual(status["playlistlength"], "0")
+
+        app.window.playlist.pl.set(self.songs)
+        status = dict(l.split(": ", 1) for l in self._lines(b"status\n")[:-1])
+        self.assertEqual(status["playlistlength"], "3")
+        self.assertGreater(int(status["playlist"]), version)
+
+        lines = self._lines(b"playlistinfo\n")
+        self.assertEqual(
+            [l for l in lines if l.startswith("Pos:")],
+            ["Pos: 0", "Pos: 1", "Pos: 2"])
+        lines = self._lines(b"playlistinfo 1:2\n")
+        self.assertEqual(lines[0], "file: music/a/2.ogg")
+        self.assertIn("Pos: 1", lines)
+
+        version = int(status["playlist"])
+        self.assertEqual(
+            self._lines(("plchanges %d\n" % version).encode("ascii")),
+            ["OK"])
+        app.window.playlist.pl.remove(app.window.playlist.pl.find(
+            self.songs[1]))
+        lines = self._lines(
+            ("plchangesposid %d\n" % version).encode("ascii"))
+        self.assertEqual([l for l in lines if l.startswith("cpos:")],
+                         ["cpos: 1"])
+
+    def test_write_chunks(self):
+        conn = self.conn
+        conn.WRITE_CHUNK_SIZE = 4
+        conn.write_lines(iter([u"a", u"b", u"c"]))
+        conn.write_line(u"OK")
+        self.assertTrue(conn.can_write())
+        self.assertEqual(conn.handle_write(), b"a\nb\n")
+        self.assertEqual(conn.handle_write(), b"c\nOK\n")
+        self.assertFalse(conn.can_write())
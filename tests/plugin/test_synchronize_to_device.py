@@ -6,6 +6,7 @@
 # (at your option) any later version.
 
 import os
+import shutil
 from os import makedirs
 from pathlib import Path
 from unittest.mock import ANY, patch
@@ -20,6 +21,7 @@ from quodlibet.formats import AudioFile
 from quodlibet.plugins import PM
 from quodlibet.qltk.ccb import ConfigCheckButton
 from quodlibet.util.path import strip_win32_incompat_from_path
+from tests import mkdtemp
 from tests.plugin import PluginTestCase
 
 
@@ -500,6 +502,19 @@ class TSyncToDevice(PluginTestCase):
         self.assertFalse(self.plugin.status_duplicates.get_visible())
         self.assertTrue(self.plugin.status_deletions.get_visible())
 
+    def test_start_preview_ignores_manifest(self):
+        self._make_library()
+        manifest = self.module.SyncManifest(self.path_dest)
+        manifest.set(os.path.join(self.path_dest, 'song.mp3'), (3, 1.5))
+        manifest.save()
+
+        self._select_searches('Symbols')
+        self.dest_entry.set_text(self.path_dest)
+        self.plugin._start_preview(self.plugin.preview_start_button)
+
+        self.assertEqual(self.plugin.c_songs_delete, 0)
+        self.assertFalse(self.plugin.status_deletions.get_visible())
+
     def test_start_preview_query_and_file_deletion(self):
         self._make_library()
         num_files = self._make_files_for_deletion()
@@ -1055,3 +1070,46 @@ class TSyncToDevice(PluginTestCase):
         self.assertEqual(mock_mkdir.call_count, n_songs)
         self.assertEqual(mock_cp.call_count, n_songs)
         self.assertEqual(mock_rm.call_count, 0)
+
+    def test_sync_file(self):
+        sync_file = self.module.sync_file
+        temp_dir = mkdtemp()
+        try:
+            source = os.path.join(temp_dir, 'source.mp3')
+            dest = os.path.join(temp_dir, 'export', 'dest.mp3')
+            with open(source, 'wb') as f:
+                f.write(b'abc')
+
+            copied, state = sync_file(source, dest)
+            self.assertTrue(copied)
+            self.assertEqual(state, (3, os.path.getmtime(source)))
+            self.assertEqual(os.path.getmtime(dest), state[1])
+            self.assertEqual(sync_file(source, dest), (False, state))
+            self.assertEqual(sync_file(source, dest, state), (False, state))
+
+            # interrupted copy
+            with open(dest, 'wb') as f:
+                f.write(b'a')
+            self.assertTrue(sync_file(source, dest)[0])
+
+            # changed source
+            with open(source, 'wb') as f:
+                f.write(b'xyz')
+            os.utime(source, (state[1] + 10, state[1] + 10))
+            self.assertTrue(sync_file(source, dest, state)[0])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_sync_manifest(self):
+        path = os.path.join(self.path_dest, 'a', 'song.mp3')
+        manifest = self.module.SyncManifest(self.path_dest)
+        self.assertIsNone(manifest.get(path))
+        manifest.set(path, (3, 1.5))
+        manifest.save()
+
+        manifest = self.module.SyncManifest(self.path_dest)
+        self.assertEqual(manifest.get(path), (3, 1.5))
+        manifest.retain([path])
+        self.assertEqual(manifest.get(path), (3, 1.5))
+        manifest.retain([])
+        self.assertIsNone(manifest.get(path))
@@ -6,9 +6,13 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
+import os
+import shutil
+
 from gi.repository import Gst
 
 from quodlibet.library.base import Library
+from tests import mkdtemp
 from tests.plugin import PluginTestCase
 from tests.helper import visible
 
@@ -65,3 +69,74 @@ class TWaveformSeekBar(PluginTestCase):
 
         message = FakeRMSMessage()
         bar._on_bus_message(None, message, 1234)
+
+    def test_resample(self):
+        resample = self.mod.resample
+        self.assertEqual(resample([1, 3, 5, 7], 2), [2, 6])
+        self.assertEqual(resample([1, 2], 4), [1, 1, 2, 2])
+        self.assertEqual(resample([1, 2], 2), [1, 2])
+        self.assertEqual(resample([], 2), [])
+
+    def test_cached_waveform(self):
+        temp = mkdtemp()
+        try:
+            cache = self.mod.WaveformCache(os.path.join(temp, "cache"))
+            song = AudioFile({"~filename": os.path.join(temp, "a.ogg"),
+                              "~#length": 10})
+            open(song("~filename"), "wb").close()
+            cache.store(song, [0.5, 1.0])
+
+            player = NullPlayer()
+            player.info = song
+            bar = self.mod.WaveformSeekBar(player, Library(), cache)
+            self.assertEqual(len(bar._rms_vals), 2)
+            self.assertAlmostEqual(bar._rms_vals[0], 0.5, places=2)
+            self.assertAlmostEqual(bar._rms_vals[1], 1.0)
+            bar.destroy()
+        finally:
+            shutil.rmtree(temp)
+
+
+class TWaveformCache(PluginTestCase):
+
+    def setUp(self):
+        self.mod = self.modules["WaveformSeekBar"]
+        self.temp = mkdtemp()
+        self.cache = self.mod.WaveformCache(os.path.join(self.temp, "cache"))
+        self.song = AudioFile({"~filename": os.path.join(self.temp, "a.ogg")})
+        open(self.song("~filename"), "wb").close()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp)
+        del self.mod
+
+    def test_missing(self):
+        self.assertIsNone(self.cache.load(self.song))
+        self.assertNotIn(self.song, self.cache)
+
+    def test_store_load(self):
+        values = [0.01, 0.02, 0.04, 0.0]
+        self.cache.store(self.song, values)
+        self.assertIn(self.song, self.cache)
+        loaded = self.cache.load(self.song)
+        self.assertEqual(len(loaded), 4)
+        for a, b in zip(loaded, values):
+            self.assertAlmostEqual(a, b, places=3)
+        self.assertEqual(len(self.cache.load(self.song, 2)), 2)
+        self.assertEqual(len(self.cache.load(self.song, 10)), 4)
+
+    def test_silence(self):
+        self.cache.store(self.song, [0.0, 0.0])
+        self.assertEqual(self.cache.load(self.song), [0.0, 0.0])
+
+    def test_song_changed(self):
+        self.cache.store(self.song, [0.5])
+        os.utime(self.song("~filename"), (0, 0))
+        self.assertIsNone(self.cache.load(self.song))
+
+    def test_broken(self):
+        self.cache.store(self.song, [0.5])
+        path = os.path.join(self.cache.path, os.listdir(self.cache.path)[0])
+        with open(path, "r+b") as h:
+            h.truncate(10)
+        self.assertIsNone(self.cache.load(self.song))
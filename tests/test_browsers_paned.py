@@ -3,7 +3,9 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
-from tests import TestCase, run_gtk_loop
+import time
+
+from tests import TestCase, run_gtk_loop, skip
 from .helper import realized
 
 from gi.repository import Gtk
@@ -22,6 +24,7 @@ from quodlibet.browsers.paned.pane import Pane
 from quodlibet.formats import AudioFile
 from quodlibet.util.collection import Collection
 from quodlibet.util.string.date import format_date
+from quodlibet.util.thread import Cancellable
 from quodlibet.library import SongLibrary, SongLibrarian
 
 SONGS = [
@@ -48,6 +51,16 @@ ALBUM = Collection()
 ALBUM.songs = SONGS
 
 
+def wait_for(condition, timeout=5):
+    """Runs the main loop until condition() is true"""
+
+    end = time.time() + timeout
+    while not condition() and time.time() < end:
+        run_gtk_loop()
+        time.sleep(0.001)
+    return condition()
+
+
 class TPanedBrowser(TestCase):
     Bar = PanedBrowser
 
@@ -143,6 +156,38 @@ class TPanedBrowser(TestCase):
         for song in self.last:
             self.assertTrue(u"piman" in song.list("artist"))
 
+    def test_activate_in_thread(self):
+        self.bar.ASYNC_FILL_SIZE = 0
+        self.bar.activate()
+        self.assertTrue(wait_for(lambda: self.last is not None))
+        self.assertEqual(set(self.last), set(SONGS))
+
+    def test_activate_in_thread_cancel(self):
+        self.bar.ASYNC_FILL_SIZE = 0
+        self.bar.activate()
+        self.bar.filter_text("artist=boris")
+        self.assertTrue(wait_for(lambda: self.last is not None))
+        run_gtk_loop()
+        self.assertEqual(self.last, SONGS[:1])
+        self.assertEqual(self.emit_count, 1)
+
+    def test_changed_while_filling(self):
+        self.bar.ASYNC_FILL_SIZE = 0
+        self.bar.activate()
+        song = AudioFile({"~filename": fsnative(u"/dev/new"),
+                          "artist": "new"})
+        library = self.bar._library
+        library.add([song])
+        library.remove([SONGS[0]])
+        library.changed([SONGS[1]])
+        self.assertTrue(wait_for(lambda: self.last is not None))
+        run_gtk_loop()
+        # the changes get applied to the result, instead of starting over
+        self.assertEqual(set(self.last), set(SONGS))
+        artists = self.bar._panes[0].list("artist")
+        self.assertIn("new", artists)
+        self.assertNotIn("boris", artists)
+
     def test_set_all_panes(self):
         self.bar.activate()
         self.bar.set_all_panes()
@@ -368,6 +413,24 @@ class TMultiPane(TestCase):
         self.assertEqual(self.last, set(SONGS))
         self.assertEqual(self.count, 1)
 
+    def test_fill_async(self):
+        self.p1.fill_async(SONGS)
+        self.assertTrue(self.p1.is_filling)
+        self.assertTrue(wait_for(lambda: self.count))
+        self.assertFalse(self.p1.is_filling)
+        self.assertFalse(self.p2.is_filling)
+        self.assertEqual(self.last, set(SONGS))
+        self.assertEqual(self.count, 1)
+
+    def test_fill_async_cancel(self):
+        self.p1.fill_async(SONGS)
+        self.p1.fill(SONGS[:1])
+        self.assertFalse(self.p1.is_filling)
+        self.assertEqual(self.last, set(SONGS[:1]))
+        time.sleep(0.05)
+        run_gtk_loop()
+        self.assertEqual(self.count, 1)
+
     def test_filter_first(self):
         VALUE = "J-Pop"
         self.p1.fill(SONGS)
@@ -522,6 +585,92 @@ class TPaneModel(TestCase):
             m.remove_songs([song], True)
             self._verify_model(m)
 
+    def test_add_sorted(self):
+        conf = PaneConfig("artist")
+        m = PaneModel(conf)
+        m.add_songs(SONGS[1:2])
+        m.add_songs([UNKNOWN_ARTIST])
+        m.add_songs(SONGS[2:3] + SONGS[:1])
+        self._verify_model(m)
+        self.assertEqual([e.key for e in m.itervalues()][1:],
+                         ["boris", "mu", "piman", ""])
+
+    def test_changed(self):
+        conf = PaneConfig("artist")
+        m = PaneModel(conf)
+        songs = [AudioFile(s) for s in SONGS]
+        m.add_songs(songs)
+
+        # like the browser does for changed songs
+        songs[0]["artist"] = "mu"
+        m.remove_songs([songs[0]], False)
+        m.add_songs([songs[0]])
+        self.assertEqual(m.get_songs([1]), set())
+        m.remove_songs([], True)
+        self._verify_model(m)
+        self.assertEqual([e.key for e in m.itervalues()][1:],
+                         ["mu", "piman", ""])
+        self.assertEqual(m.get_songs([1]), set(songs[:2]))
+
+        del songs[1]["artist"]
+        m.remove_songs([songs[1]], False)
+        m.add_songs([songs[1]])
+        m.remove_songs([], True)
+        self.assertEqual(m.get_songs([len(m) - 1]), {songs[1], songs[4]})
+
+    def test_set_groups(self):
+        conf = PaneConfig("artist")
+        m = PaneModel(conf)
+        m.add_songs(SONGS[:1])
+        m.set_groups(m.group_songs(SONGS))
+        self._verify_model(m)
+
+        m2 = PaneModel(conf)
+        m2.add_songs(SONGS)
+        self.assertEqual([e.key for e in m.itervalues()],
+                         [e.key for e in m2.itervalues()])
+
+        m.add_songs([UNKNOWN_ARTIST])
+        m.remove_songs(SONGS[:1], True)
+        self.assertEqual([e.key for e in m.itervalues()][1:],
+                         ["mu", "piman", ""])
+        self.assertEqual(m.get_songs([len(m) - 1]),
+                         {SONGS[4], UNKNOWN_ARTIST})
+
+    def test_group_songs_cancel(self):
+        m = PaneModel(PaneConfig("artist"))
+        cancellable = Cancellable()
+        self.assertTrue(m.group_songs(SONGS, cancellable))
+        cancellable.cancel()
+        self.assertIsNone(m.group_songs(SONGS, cancellable))
+
+    def test_clear(self):
+        conf = PaneConfig("artist")
+        m = PaneModel(conf)
+        m.add_songs(SONGS)
+        m.clear()
+        m.add_songs(SONGS[:1])
+        self.assertEqual(len(m), 1)
+        m.remove_songs(SONGS, True)
+        self.assertEqual(len(m), 0)
+
+    @skip("Enable for basic benchmarking of PaneModel")
+    def test_changed_performance(self):
+        conf = PaneConfig("artist")
+        for size in [1000, 10000, 100000]:
+            songs = [AudioFile({"~filename": fsnative(u"/%d" % i),
+                                "artist": u"artist %d" % (i // 10)})
+                     for i in range(size)]
+            m = PaneModel(conf)
+            m.add_songs(songs)
+            t = time.time()
+            for song in songs[:100]:
+                m.remove_songs([song], False)
+                m.add_songs([song])
+                m.remove_songs([], True)
+            us = (time.time() - t) * 1000000 / 100
+            print("%d songs: %.0f μs per changed song" % (size, us))
+
     def test_matches(self):
         conf = PaneConfig("artist")
         m = PaneModel(conf)
@@ -22,3 +22,9 @@ class Tcli(TestCase):
         with self.assertRaises(SystemExit):
             with capture_output():
                 cli.process_arguments(["myprog", "--wrong-thing"])
+
+    def test_print_query_options_need_print_query(self):
+        with self.assertRaises(SystemExit):
+            with capture_output() as (out, err):
+                cli.process_arguments(["myprog", "--print-query-limit=3"])
+        self.assertIn("print-query", err.getvalue())
@@ -34,6 +34,22 @@ class TCommands(TestCase):
         self.__send(u"query foo")
         self.assertEqual(self.__send("print-query-text"), u"foo\n")
 
+    def test_print_query(self):
+        songs = [AudioFile({"~filename": fsnative(u"/dev/%d" % i),
+                            "artist": u"foo" if i % 2 else u"bar"})
+                 for i in range(5)]
+        app.library.add(songs)
+
+        def query(arg):
+            return u"".join(self.__send(u"print-query " + arg))
+
+        self.assertEqual(query(u"foo"), u"/dev/1\n/dev/3\n")
+        self.assertEqual(query(u"nope"), u"")
+        self.assertEqual(query(u"\nlimit=2\noffset=1"), u"/dev/1\n/dev/2\n")
+        self.assertEqual(query(u"bar\nformat=<artist>\nlimit=1"), u"bar\n")
+        with capture_output():
+            self.assertIsNone(self.__send(u"print-query foo\nlimit=x"))
+
     def test_print_playing_elapsed(self):
         app.player.info = AudioFile(
             {"album": "foo", "~filename": fsnative("/dev/null")})
@@ -14,7 +14,9 @@ from .helper import capture_output
 
 from quodlibet import formats
 from quodlibet.formats import AudioFile, load_audio_files, dump_audio_files, \
-    SerializationError
+    SerializationError, load_audio_files_columnar, dump_audio_files_columnar, \
+    is_columnar, load_music_files
+from quodlibet.formats._serialize import ColumnarAudioFiles
 from quodlibet.util.picklehelper import pickle_dumps
 from quodlibet import config
 
@@ -163,8 +165,127 @@ class TPickle(TestCase):
             self.assertEqual(len(items), len(formats.types) - 1)
             assert all(isinstance(i, AudioFile) for i in items)
 
+    def test_load_shares_values(self):
+        songs = []
+        for i in range(2):
+            song = AudioFile.__new__(list(formats.types)[0])
+            dict.__init__(song, {"artist": "".join(["fo", "o"]),
+                                 "title": "".join(["fo", "o"])})
+            songs.append(song)
+        a, b = load_audio_files(pickle_dumps(songs, 2))
+        assert a["artist"] is b["artist"]
+        assert a["title"] is not b["title"]
+
     def test_unpickle_random_class(self):
         for protocol in [0, 1, 2]:
             data = pickle_dumps([42], protocol)
             with self.assertRaises(SerializationError):
                 load_audio_files(data)
+
+
+class TColumnar(TestCase):
+    def setUp(self):
+        instances = []
+        for i, t in enumerate(formats.types):
+            inst = AudioFile.__new__(t)
+            dict.__init__(inst, {
+                "~filename": fsnative("/foo/%d" % i),
+                "artist": "bar\nbaz",
+                "~#playcount": i,
+                "~#rating": 0.25,
+                "~#length": 1.5 if i % 2 else 3,
+            })
+            instances.append(inst)
+        self.instances = instances
+
+    def test_roundtrip(self):
+        data = dump_audio_files_columnar(self.instances)
+        assert is_columnar(data)
+        items = load_audio_files_columnar(data)
+
+        assert len(items) == len(self.instances)
+        for a, b in zip(items, self.instances):
+            assert type(a) is type(b)
+            assert dict(a) == dict(b)
+            assert type(a["~#length"]) is type(b["~#length"])
+
+    def test_dump_empty(self):
+        data = dump_audio_files_columnar([])
+        assert load_audio_files_columnar(data) == []
+
+    def test_not_columnar(self):
+        data = dump_audio_files(self.instances)
+        assert not is_columnar(data)
+        with self.assertRaises(SerializationError):
+            load_audio_files_columnar(data)
+
+    def test_truncated(self):
+        data = dump_audio_files_columnar(self.instances)
+        with self.assertRaises(SerializationError):
+            load_audio_files_columnar(data[:len(data) // 2])
+
+    def test_unsupported_value(self):
+        inst = AudioFile.__new__(list(formats.types)[0])
+        dict.__setitem__(inst, "~#playcount", 2 ** 64)
+        with self.assertRaises(SerializationError):
+            dump_audio_files_columnar([inst])
+
+    def test_missing_class(self):
+        data = dump_audio_files_columnar(self.instances)
+        broken = data.replace(b"SPCFile", b"FooFile")
+        items = load_audio_files_columnar(broken)
+        self.assertEqual(len(items), len(formats.types) - 1)
+
+    def test_load_shares_values(self):
+        a, b = load_audio_files_columnar(
+            dump_audio_files_columnar(self.instances[:2]))
+        song = AudioFile()
+        song["artist"] = "".join(["bar\n", "baz"])
+        assert a["artist"] is b["artist"] is song["artist"]
+        key, = [k for k in a if k == "artist"]
+        assert key is list(song)[0]
+
+    def test_reader(self):
+        data = dump_audio_files_columnar(self.instances)
+        with ColumnarAudioFiles(data) as reader:
+            assert len(reader) == len(self.instances)
+            assert dict(reader[1]) == dict(self.instances[1])
+            counts = reader.column("~#playcount")
+            assert counts == {i: i for i in range(len(self.instances))}
+            with self.assertRaises(IndexError):
+                reader[len(self.instances)]
+
+
+class TLoadMusicFiles(TestCase):
+
+    def setUp(self):
+        config.init()
+        self.filenames = [get_data_path(name) for name in [
+            "silence-44-s.ogg", "silence-44-s.mp3", "silence-44-s.flac",
+            "test.wav", "not-there.ogg"]]
+
+    def tearDown(self):
+        config.quit()
+
+    def _load(self, processes):
+        result = list(load_music_files(
+            self.filenames, processes, batch_size=2))
+        done = [d for d, songs in result]
+        self.assertEqual(done, sorted(done))
+        self.assertEqual(done[-1], len(self.filenames))
+        return sorted(s("~basename") for d, songs in result for s in songs)
+
+    def test_in_process(self):
+        with capture_output():
+            self.assertEqual(self._load(1), [
+                "silence-44-s.flac", "silence-44-s.mp3", "silence-44-s.ogg",
+                "test.wav"])
+
+    def test_processes(self):
+        with capture_output():
+            self.assertEqual(self._load(2), self._load(1))
+
+    def test_close(self):
+        gen = load_music_files(self.filenames, 2, batch_size=1)
+        next(gen)
+        gen.close()
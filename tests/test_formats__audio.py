@@ -12,13 +12,14 @@ from contextlib import contextmanager
 from quodlibet import config, app
 from quodlibet.formats import AudioFile, types as format_types, AudioFileError
 from quodlibet.formats import decode_value, MusicFile, FILESYSTEM_TAGS
-from quodlibet.formats._audio import NUMERIC_ZERO_DEFAULT
+from quodlibet.formats._audio import NUMERIC_ZERO_DEFAULT, intern_tag
 from quodlibet.util.environment import is_windows
 from quodlibet.util.path import (normalize_path, mkdir, get_home_dir, unquote,
                                  escape_filename, RootPathFile)
 from quodlibet.util.tags import _TAGS as TAGS
 from senf import fsnative, fsn2text, bytes2fsn, mkstemp, mkdtemp
-from tests import TestCase, get_data_path, init_fake_app, destroy_fake_app
+from tests import TestCase, get_data_path, init_fake_app, \
+    destroy_fake_app, skip
 from .helper import temp_filename
 
 bar_1_1 = AudioFile({
@@ -1053,6 +1054,68 @@ class Tdecode_value(TestCase):
         assert decode_value("~filename", path) == fsn2text(path)
 
 
+class Tintern_tag(TestCase):
+
+    def test_main(self):
+        key, value = intern_tag("".join(["gen", "re"]), "".join(["a", "b"]))
+        assert key is intern_tag("genre", value)[0]
+        assert intern_tag("genre", "".join(["a", "b"]))[1] is value
+        assert intern_tag("~#samplerate", 44100 + int("0"))[1] is \
+            intern_tag("~#samplerate", 44100 + int("0"))[1]
+
+    def test_only_shared_tags(self):
+        for key in ["title", "comment", "musicbrainz_trackid"]:
+            value = "".join(["a", "b"])
+            assert intern_tag(key, value)[1] is value
+            assert intern_tag(key, "".join(["a", "b"]))[1] is not value
+        value = 192 + int("0")
+        assert intern_tag("~#bitrate", value)[1] is value
+
+    def test_type(self):
+        assert type(intern_tag("~#bitrate", 1.0)[1]) is float
+        assert type(intern_tag("~#bitrate", 1)[1]) is int
+
+    def test_audio_file(self):
+        a = AudioFile({"artist": "".join(["fo", "o"])})
+        b = AudioFile()
+        b["".join(["art", "ist"])] = "".join(["fo", "o"])
+        assert a["artist"] is b["artist"]
+        assert list(a)[0] is list(b)[0]
+
+    @skip("Enable for basic benchmarking of AudioFile memory usage")
+    def test_memory_usage(self):
+        import tracemalloc
+
+        def create(setitem):
+            songs = []
+            for i in range(20000):
+                song = AudioFile()
+                for key, value in [
+                        ("~filename", fsnative(u"/music/%d.flac" % i)),
+                        ("~mountpoint", fsnative(u"/music")),
+                        ("title", u"Title %d" % i),
+                        ("album", u"Album %d" % (i // 12)),
+                        ("artist", u"Artist %d" % (i // 60)),
+                        ("albumartist", u"Artist %d" % (i // 60)),
+                        ("genre", u"Genre %d" % (i % 20)),
+                        ("date", u"%d" % (1960 + i % 60)),
+                        ("tracknumber", u"%d/12" % (i % 12 + 1)),
+                        ("~#samplerate", 44100 + i % 2),
+                        ("~#length", 180 + i % 200)]:
+                    setitem(song, "".join(key), value)
+                songs.append(song)
+            return songs
+
+        for name, setitem in [("dict", dict.__setitem__),
+                              ("interned", AudioFile.__setitem__)]:
+            tracemalloc.start()
+            songs = create(setitem)
+            size = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            print("%s: %.0f bytes per song" % (name, size / len(songs)))
+            del songs
+
+
 class Treplay_gain(TestCase):
 
     # -6dB is approximately equal to half magnitude
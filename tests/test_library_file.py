@@ -2,11 +2,14 @@
 # it under the terms of the GNU General Public License as published by
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
+import os
+import shutil
 from pathlib import Path
 
 from quodlibet.library.file import FileLibrary
+from quodlibet.library.song import SongFileLibrary
 from quodlibet.util.path import normalize_path
-from tests import mkdtemp
+from tests import mkdtemp, get_data_path, run_gtk_loop, TestCase
 from tests.test_library_libraries import TLibrary, FakeSongFile, FakeAudioFile
 
 
@@ -120,3 +123,128 @@ class TFileLibrary(TLibrary):
         assert out_song in self.library, "removed too many files"
         assert self.removed == [in_song], "didn't signal the song removal"
         assert not self.changed, "shouldn't have changed any tracks"
+
+
+class TFileLibraryRescan(TestCase):
+
+    def setUp(self):
+        self.root = normalize_path(mkdtemp(), True)
+        self.filename = os.path.join(self.root, "a.ogg")
+        shutil.copy(get_data_path("silence-44-s.ogg"), self.filename)
+        os.utime(self.root, ns=(0, 0))
+        self.library = SongFileLibrary()
+
+    def tearDown(self):
+        self.library.destroy()
+        shutil.rmtree(self.root)
+
+    def test_cached_rescan_adds_missing(self):
+        list(self.library.scan([self.root], cached=True))
+        song, = self.library.values()
+        # e.g. dropped while it wasn't readable
+        self.library.remove([song])
+        list(self.library.rebuild([self.root]))
+        self.assertTrue(self.library.contains_filename(self.filename))
+
+    def test_load_failed_drops_cache(self):
+        filename = os.path.join(self.root, "songs")
+        with open(filename, "wb") as h:
+            h.write(b"nope")
+        with open(filename + ".dirs", "wb") as h:
+            h.write(b"nope")
+        self.assertFalse(self.library.load(filename))
+        self.assertFalse(os.path.exists(filename + ".dirs"))
+
+
+class TFileLibraryWatcher(TestCase):
+
+    def setUp(self):
+        self.root = normalize_path(mkdtemp(), True)
+        self.sub = os.path.join(self.root, "sub")
+        os.mkdir(self.sub)
+        shutil.copy(get_data_path("silence-44-s.ogg"),
+                    os.path.join(self.sub, "a.ogg"))
+        self.library = SongFileLibrary()
+        list(self.library.scan([self.root]))
+        self.added, self.changed, self.removed = [], [], []
+        self.library.connect("added", lambda l, s: self.added.extend(s))
+        self.library.connect("changed", lambda l, s: self.changed.extend(s))
+        self.library.connect("removed", lambda l, s: self.removed.extend(s))
+
+    def tearDown(self):
+        self.library.destroy()
+        shutil.rmtree(self.root)
+
+    def _watch(self, max_monitors):
+        self.library.watch([self.root])
+        watcher = self.library._watcher
+        watcher.max_monitors = max_monitors
+        watcher.DELAY = 0
+        run_gtk_loop()
+        return watcher
+
+    def test_watch_tree(self):
+        watcher = self._watch(1)
+        self.assertEqual(watcher.watched, {self.root, self.sub})
+        self.assertEqual(len(watcher._monitors), 1)
+        self.assertEqual(len(watcher._polled), 1)
+        self.library.unwatch()
+        self.assertIsNone(self.library._watcher)
+        self.assertFalse(watcher.watched)
+
+    def test_apply(self):
+        watcher = self._watch(0)
+        song, = self.library.values()
+        new = os.path.join(self.sub, "b.flac")
+        shutil.copy(get_data_path("silence-44-s.flac"), new)
+        os.remove(song("~filename"))
+        watcher.apply([new, song("~filename"), os.path.join(self.sub, "x")])
+        run_gtk_loop()
+        self.assertEqual(self.removed, [song])
+        self.assertEqual([s("~filename") for s in self.added], [new])
+        self.assertEqual(len(self.library), 1)
+
+    def test_apply_queued(self):
+        watcher = self._watch(0)
+        new = []
+        for name in ["b.ogg", "c.ogg"]:
+            new.append(os.path.join(self.sub, name))
+            shutil.copy(get_data_path("silence-44-s.ogg"), new[-1])
+            # a second batch while the first one is still loading
+            watcher.apply([new[-1]])
+        run_gtk_loop()
+        self.assertEqual(
+            sorted(s("~filename") for s in self.added), sorted(new))
+
+    def test_destroy_stops_adding(self):
+        watcher = self._watch(0)
+        new = os.path.join(self.sub, "b.ogg")
+        shutil.copy(get_data_path("silence-44-s.ogg"), new)
+        watcher.apply([new])
+        self.library.unwatch()
+        run_gtk_loop()
+        self.assertFalse(self.added)
+
+    def test_apply_directories(self):
+        watcher = self._watch(0)
+        other = os.path.join(self.root, "other")
+        os.mkdir(other)
+        new = os.path.join(other, "c.ogg")
+        shutil.copy(get_data_path("silence-44-s.ogg"), new)
+        shutil.rmtree(self.sub)
+        watcher.apply([other, self.sub])
+        run_gtk_loop()
+        self.assertEqual(watcher.watched, {self.root, other})
+        self.assertEqual(len(self.removed), 1)
+        self.assertEqual([s("~filename") for s in self.added], [new])
+
+    def test_poll(self):
+        watcher = self._watch(0)
+        new = os.path.join(self.sub, "b.ogg")
+        shutil.copy(get_data_path("silence-44-s.ogg"), new)
+        os.utime(self.sub, ns=(0, 0))
+        watcher._poll()
+        self.assertEqual(watcher._pending, {new})
+        run_gtk_loop()
+        self.assertFalse(watcher._pending)
+        self.assertEqual([s("~filename") for s in self.added], [new])
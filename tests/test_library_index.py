@@ -0,0 +1,122 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+import math
+import re
+
+from quodlibet.formats import AudioFile
+from quodlibet.library.index import TagIndex
+from quodlibet.unisearch import fold
+from tests import TestCase
+
+
+class Tfold(TestCase):
+
+    def test_case_insensitive_regex_chars(self):
+        for a, b in [("ſ", "S"), ("ς", "Σ"), ("İ", "i"), ("K", "k"),
+                     ("ẞ", "ß"), ("µ", "Μ")]:
+            assert re.match(re.escape(a), b, re.I)
+            self.assertEqual(fold(a), fold(b))
+
+    def test_prefix(self):
+        assert fold("ΑΣΑ").startswith(fold("ΑΣ"))
+
+
+class TTagIndex(TestCase):
+
+    def setUp(self):
+        self.a = AudioFile({"artist": "Foo\nBar", "title": "Baz"})
+        self.b = AudioFile({"artist": "foobar", "~title": "quux"})
+        self.index = TagIndex([self.a, self.b])
+
+    def test_exact(self):
+        self.assertEqual(self.index.lookup("artist", "exact", "FOO"), {self.a})
+        self.assertEqual(self.index.lookup("artist", "exact", "Bar"), {self.a})
+        self.assertEqual(self.index.lookup("artist", "exact", "x"), set())
+
+    def test_missing(self):
+        self.assertEqual(self.index.lookup("genre", "exact", ""),
+                         {self.a, self.b})
+        self.assertEqual(self.index.lookup("title", "exact", "quux"),
+                         {self.b})
+
+    def test_prefix_contains(self):
+        self.assertEqual(self.index.lookup("artist", "prefix", "foo"),
+                         {self.a, self.b})
+        self.assertEqual(self.index.lookup("artist", "contains", "oba"),
+                         {self.b})
+
+    def test_diacritics(self):
+        self.assertEqual(self.index.lookup("artist", "exact", "Föo"),
+                         {self.a})
+        c = AudioFile({"artist": "Björk"})
+        self.index.add([c])
+        self.assertEqual(self.index.lookup("artist", "prefix", "bjo"), {c})
+
+    def test_not_indexable(self):
+        assert self.index.lookup("~filename", "exact", "x") is None
+        assert self.index.lookup("~lyrics", "exact", "x") is None
+        assert self.index.lookup("filename", "exact", "x") is None
+
+    def test_synthetic(self):
+        self.assertEqual(self.index.lookup("~people", "exact", "bar"),
+                         {self.a})
+
+    def test_update(self):
+        self.index.lookup("artist", "exact", "foo")
+        self.assertEqual(self.index.tags, ["artist"])
+
+        c = AudioFile({"artist": "foo"})
+        self.index.add([c])
+        self.assertEqual(self.index.lookup("artist", "exact", "foo"),
+                         {self.a, c})
+        self.index.remove([self.a])
+        self.assertEqual(self.index.lookup("artist", "exact", "foo"), {c})
+        c["artist"] = "new"
+        self.index.changed([c])
+        self.assertEqual(self.index.lookup("artist", "exact", "foo"), set())
+        self.assertEqual(self.index.lookup("artist", "prefix", "ne"), {c})
+
+
+class TTagIndexNumeric(TestCase):
+
+    def setUp(self):
+        self.a = AudioFile({"~#playcount": 3, "tracknumber": "2/10",
+                            "date": "2004-10"})
+        self.b = AudioFile({"~#length": 1.5, "bpm": "120"})
+        self.index = TagIndex([self.a, self.b])
+
+    def values(self, tag):
+        column = self.index.numeric(tag)
+        return {s: (None if math.isnan(v) else v)
+                for s, v in zip(self.index.numeric_songs, column)}
+
+    def test_columns(self):
+        self.assertEqual(self.values("playcount"), {self.a: 3, self.b: 0})
+        self.assertEqual(self.values("length"), {self.a: 0, self.b: 1.5})
+        self.assertEqual(self.values("bpm"), {self.a: None, self.b: 120})
+        self.assertEqual(self.values("track"), {self.a: 2, self.b: None})
+        self.assertEqual(self.values("tracks"), {self.a: 10, self.b: None})
+        assert self.values("date")[self.a]
+        assert self.values("date")[self.b] is None
+
+    def test_not_indexable(self):
+        assert self.index.numeric("playcount:avg") is None
+        assert self.index.numeric("~foo") is None
+
+    def test_update(self):
+        self.values("playcount")
+        c = AudioFile({"~#playcount": 7})
+        self.index.add([c])
+        self.assertEqual(self.values("playcount"),
+                         {self.a: 3, self.b: 0, c: 7})
+        self.index.remove([self.a])
+        self.assertEqual(self.values("playcount"), {self.b: 0, c: 7})
+        self.index.remove([c])
+        self.assertEqual(self.values("playcount"), {self.b: 0})
+        self.b["~#playcount"] = 2
+        self.index.changed([self.b])
+        self.assertEqual(self.values("playcount"), {self.b: 2})
+        self.assertEqual(self.index.numeric_songs, [self.b])
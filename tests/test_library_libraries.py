@@ -5,8 +5,9 @@
 import os
 import shutil
 
-from quodlibet.formats import AudioFile
-from quodlibet.library.base import (Library, iter_paths, PicklingMixin)
+from quodlibet.formats import AudioFile, is_columnar
+from quodlibet.library.base import (Library, iter_paths, PicklingMixin,
+                                    DirectoryCache)
 from quodlibet.util import connect_obj, is_windows
 from senf import fsnative
 from tests import TestCase, mkstemp, mkdtemp, skipIf, run_gtk_loop
@@ -299,6 +300,28 @@ class TPicklingMixin(TestCase):
         finally:
             os.unlink(filename)
 
+    def test_save_load_pickle(self):
+        fd, filename = mkstemp()
+        os.close(fd)
+        try:
+            self.library.add(self.Frange(30))
+            self.library.columnar = False
+            self.library.save(filename)
+
+            library = self.Library()
+            library.load(filename)
+            assert sorted(library.keys()) == sorted(self.library.keys())
+
+            # saving converts to the columnar format
+            library.save(filename)
+            with open(filename, "rb") as h:
+                assert is_columnar(h.read())
+            library = self.Library()
+            library.load(filename)
+            assert sorted(library.keys()) == sorted(self.library.keys())
+        finally:
+            os.unlink(filename)
+
 
 class Titer_paths(TestCase):
 
@@ -366,3 +389,80 @@ class Titer_paths(TestCase):
         os.close(fd)
 
         assert list(iter_paths(self.root)) == []
+
+
+class TDirectoryCache(TestCase):
+
+    def setUp(self):
+        self.root = os.path.realpath(mkdtemp())
+        self.child = mkdtemp(dir=self.root)
+        self.cache = DirectoryCache()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _file(self, dir_):
+        fd, name = mkstemp(dir=dir_)
+        os.close(fd)
+        return name
+
+    def _age(self):
+        for path in [self.root, self.child]:
+            os.utime(path, (0, 0))
+
+    def _scan(self, **kwargs):
+        return sorted(iter_paths(self.root, dir_cache=self.cache, **kwargs))
+
+    def test_unchanged(self):
+        a = self._file(self.root)
+        b = self._file(self.child)
+        self._age()
+        self.assertEqual(self._scan(), sorted([a, b]))
+        # only used after commit
+        self.assertEqual(self._scan(), sorted([a, b]))
+        self.cache.commit()
+        # not listed again, the files come from the cache
+        c = self._file(self.root)
+        self._age()
+        self.assertEqual(self._scan(), sorted([a, b]))
+        os.unlink(c)
+
+    def test_changed_subdir(self):
+        a = self._file(self.root)
+        self._age()
+        self._scan()
+        self.cache.commit()
+        b = self._file(self.child)
+        self.assertEqual(self._scan(), sorted([a, b]))
+
+    def test_recent_not_cached(self):
+        a = self._file(self.root)
+        self._scan()
+        self.cache.commit()
+        self.assertEqual(self._scan(), [a])
+
+    def test_options(self):
+        a = self._file(self.root)
+        self._age()
+        self.assertEqual(self._scan(exclude=[a]), [])
+        self.cache.commit()
+        self.assertEqual(self._scan(), [a])
+
+    def test_save_load(self):
+        a = self._file(self.root)
+        self._age()
+        self._scan()
+        self.cache.commit()
+        fd, filename = mkstemp()
+        os.close(fd)
+        try:
+            self.cache.save(filename)
+            self.cache = DirectoryCache()
+            self.cache.load(filename)
+        finally:
+            os.unlink(filename)
+        b = self._file(self.root)
+        self._age()
+        self.assertEqual(self._scan(), [a])
+        os.unlink(a)
+        self.assertEqual(self._scan(), [b])
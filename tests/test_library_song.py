@@ -3,11 +3,13 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 import os
+import shutil
 
 from quodlibet import config
-from quodlibet.formats import AudioFileError
+from quodlibet.formats import AudioFileError, AudioFile
 from quodlibet.library import SongLibrary, SongFileLibrary
-from tests import get_data_path, run_gtk_loop
+from quodlibet.library.journal import journal_path
+from tests import TestCase, get_data_path, run_gtk_loop, mkdtemp
 from tests.helper import get_temp_copy, capture_output
 from tests.test_library_libraries import (TLibrary, FakeSong, FSrange, FakeSongFile,
                                           FSFrange)
@@ -189,3 +191,107 @@ class TSongFileLibrary(TSongLibrary):
         playlists = pl_lib.playlists_featuring(NUMERIC_SONGS[0])
         assert set(playlists) == {pl, pl2}, "didn't register playlist2"
         assert set(pl_lib.playlists_featuring(NUMERIC_SONGS[1])) == {pl}
+
+
+class TLibraryJournal(TestCase):
+
+    def setUp(self):
+        self.dir = mkdtemp()
+        self.filename = os.path.join(self.dir, "songs")
+        library = SongLibrary()
+        library.add(self._songs(range(10)))
+        library.save(self.filename)
+        self.library = SongLibrary()
+        self.library.load(self.filename)
+
+    def tearDown(self):
+        self.library._journal_wait()
+        self.library.destroy()
+        shutil.rmtree(self.dir)
+
+    def _path(self, i):
+        return os.path.join(self.dir, str(i))
+
+    def _songs(self, numbers):
+        songs = []
+        for i in numbers:
+            with open(self._path(i), "wb"):
+                pass
+            songs.append(AudioFile({"~filename": self._path(i), "n": i}))
+        return songs
+
+    def _reload(self):
+        library = SongLibrary()
+        library.load(self.filename)
+        return {song.key: song for song in library}
+
+    def test_append(self):
+        song = self.library[self._path(3)]
+        song["~#playcount"] = 5
+        self.library.changed([song])
+        self.library.remove([self.library[self._path(4)]])
+        self.library.add(self._songs([42]))
+        with open(self.filename, "rb") as h:
+            snapshot = h.read()
+
+        self.library.save()
+        assert not self.library.dirty
+        assert os.path.exists(journal_path(self.filename))
+        with open(self.filename, "rb") as h:
+            assert h.read() == snapshot
+
+        songs = self._reload()
+        assert len(songs) == 10
+        assert songs[self._path(3)]["~#playcount"] == 5
+        assert self._path(4) not in songs
+        assert songs[self._path(42)]["n"] == "42"
+
+    def test_rename(self):
+        song = self.library[self._path(3)]
+        self.library.rename(song, self._path(33))
+        self.library.save()
+
+        songs = self._reload()
+        assert len(songs) == 10
+        assert self._path(3) not in songs
+        assert songs[self._path(33)]["n"] == "3"
+
+    def test_readd_same_key(self):
+        self.library.remove([self.library[self._path(3)]])
+        new = self._songs([3])[0]
+        new["n"] = "new"
+        self.library.add([new])
+        self.library.save()
+
+        assert self._reload()[self._path(3)]["n"] == "new"
+
+    def test_compact(self):
+        self.library.journal_compact_ratio = 0
+        self.library.remove([self.library[self._path(4)]])
+        self.library.save()
+        self.library._journal_wait()
+        assert not os.path.exists(journal_path(self.filename))
+        assert len(self._reload()) == 9
+
+        # changes after the compaction go to a new journal
+        self.library.remove([self.library[self._path(5)]])
+        self.library.save()
+        self.library._journal_wait()
+        assert len(self._reload()) == 8
+
+    def test_stale_journal_ignored(self):
+        self.library.remove([self.library[self._path(4)]])
+        self.library.save()
+        other = SongLibrary()
+        other.add(self._songs(range(3)))
+        other.save(self.filename)
+
+        assert len(self._reload()) == 3
+
+    def test_full_save_removes_journal(self):
+        self.library.remove([self.library[self._path(4)]])
+        self.library.save()
+        self.library.journaling = False
+        self.library.save()
+        assert not os.path.exists(journal_path(self.filename))
+        assert len(self._reload()) == 9
@@ -7,7 +7,8 @@ from collections import defaultdict
 
 from quodlibet.formats import AudioFile
 from quodlibet.order import OrderInOrder
-from quodlibet.order.reorder import OrderWeighted, OrderShuffle
+from quodlibet.order.reorder import OrderWeighted, OrderShuffle, \
+    WeightedSampler
 from quodlibet.order.repeat import OneSong
 from quodlibet.qltk.songmodel import PlaylistModel
 from tests import TestCase
@@ -52,6 +53,95 @@ class TOrderShuffle(TestCase):
         self.failUnlessEqual(len(order.remaining(pl)), len(songs))
 
 
+class TOrderShuffleUpdates(TestCase):
+
+    def test_insert_remove(self):
+        songs = [AudioFile({"~filename": "/%d" % i}) for i in range(6)]
+        pl = PlaylistModel(OrderShuffle)
+        pl.set(songs[:5])
+        played = []
+        for i in range(3):
+            pl.next()
+            played.append(pl.current)
+
+        # the history survives changes to the list
+        pl.insert(0, [songs[5]])
+        not_played = [s for s in songs[:5] if s not in played]
+        pl.remove(pl.find(not_played[0]))
+        self.assertEqual(len(pl.order._played), 2)
+
+        while True:
+            pl.next()
+            if pl.current is None:
+                break
+            played.append(pl.current)
+        self.assertEqual(len(played), 5)
+        self.assertEqual(set(played), set(songs) - {not_played[0]})
+
+    def test_bulk_changes(self):
+        songs = [AudioFile({"~filename": "/%d" % i}) for i in range(20)]
+        pl = PlaylistModel(OrderShuffle)
+        pl.set(songs[:10])
+        played = []
+        for i in range(5):
+            pl.next()
+            played.append(pl.current)
+
+        pl.insert_many(0, songs[10:15])
+        pl.append_many(songs[15:])
+        for song in [s for s in songs if s not in played][:3]:
+            pl.remove(pl.find(song))
+        self.assertEqual(len(pl), 17)
+
+        # the history points to the same songs
+        for song in reversed(played[:-1]):
+            pl.previous()
+            self.assertIs(pl.current, song)
+
+
+class TWeightedSampler(TestCase):
+
+    def test_weighted(self):
+        sampler = WeightedSampler([1, 0, 3])
+        counts = defaultdict(int)
+        for i in range(1000):
+            counts[sampler.sample()] += 1
+        self.assertEqual(counts[1], 0)
+        self.failUnless(counts[2] > counts[0])
+
+    def test_active(self):
+        sampler = WeightedSampler([1, 0, 1, 0])
+        self.assertEqual(sampler.active_count, 4)
+        sampler.set_active(0, False)
+        sampler.set_active(2, False)
+        # only zero weights left, picked uniformly
+        self.assertIn(sampler.sample(), [1, 3])
+        sampler.set_active(1, False)
+        sampler.set_active(3, False)
+        self.assertIsNone(sampler.sample())
+        self.assertEqual(sampler.active_count, 0)
+
+    def test_insert_remove(self):
+        sampler = WeightedSampler([1, 1], active=False)
+        sampler.insert(1, 2)
+        self.assertEqual(sampler.sample(), 1)
+        sampler.set_weight(1, 5)
+        self.assertEqual(sampler.get_weight(1), 5)
+        sampler.remove(1)
+        self.assertEqual(len(sampler), 2)
+        self.assertIsNone(sampler.sample())
+
+    def test_drain(self):
+        sampler = WeightedSampler([i % 3 for i in range(100)])
+        seen = set()
+        while sampler.active_count:
+            index = sampler.sample()
+            self.assertTrue(sampler.is_active(index))
+            sampler.set_active(index, False)
+            seen.add(index)
+        self.assertEqual(seen, set(range(100)))
+
+
 class TOrderOneSong(TestCase):
 
     def test_remaining(self):
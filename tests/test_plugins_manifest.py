@@ -0,0 +1,239 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+import os
+import shutil
+import subprocess
+import sys
+
+import quodlibet
+from quodlibet import config
+from quodlibet.plugins import PluginManager, PluginHandler
+from quodlibet.plugins.events import EventPlugin
+from quodlibet.plugins.manifest import PluginManifest, PluginStub, \
+    get_base_names
+from quodlibet.qltk.songsmenu import SongsMenuPlugin
+from quodlibet.util import get_module_dir
+
+from tests import TestCase, mkdtemp, skip
+
+
+class SomePlugin(EventPlugin):
+    PLUGIN_ID = "some"
+    PLUGIN_NAME = "Some Plugin"
+    PLUGIN_TAGS = ["a", "b"]
+
+
+class OtherPlugin(SomePlugin):
+    PLUGIN_ID = "other"
+    PLUGIN_NAME = "Other Plugin"
+    PLUGIN_DESC = object()
+
+
+PLUGIN_CODE = """\
+from quodlibet.plugins.events import EventPlugin
+
+class %(name)s(EventPlugin):
+    PLUGIN_ID = %(name)r
+    PLUGIN_NAME = %(name)r
+"""
+
+
+class THandler(PluginHandler):
+
+    def __init__(self):
+        self.enabled = []
+
+    def plugin_handle(self, plugin):
+        return issubclass(plugin.cls, EventPlugin)
+
+    def plugin_enable(self, plugin):
+        self.enabled.append(plugin.cls)
+
+    def plugin_disable(self, plugin):
+        self.enabled.remove(plugin.cls)
+
+
+class TPluginManifest(TestCase):
+
+    def setUp(self):
+        self.dir = mkdtemp()
+        self.path = os.path.join(self.dir, "manifest")
+        self.dep = os.path.join(self.dir, "some.py")
+        open(self.dep, "wb").close()
+        self.deps = {self.dep: os.path.getmtime(self.dep)}
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_base_names(self):
+        names = get_base_names(SomePlugin)
+        self.assertIn("quodlibet.plugins.events:EventPlugin", names)
+        self.assertNotIn("builtins:object", names)
+        self.assertEqual(get_base_names(OtherPlugin), names)
+
+    def test_stub(self):
+        manifest = PluginManifest(self.path)
+        self.assertIsNone(manifest.get("some", [self.dep]))
+        manifest.update("some", self.deps, [SomePlugin])
+        stub, = manifest.get("some", [self.dep])
+        self.assertTrue(isinstance(stub, PluginStub))
+        self.assertEqual(stub.module_name, "some")
+        self.assertEqual(stub.PLUGIN_ID, "some")
+        self.assertEqual(stub.PLUGIN_NAME, "Some Plugin")
+        self.assertEqual(stub.PLUGIN_TAGS, ["a", "b"])
+        self.assertFalse(hasattr(stub, "PLUGIN_DESC"))
+        self.assertTrue(issubclass(stub, EventPlugin))
+        self.assertTrue(issubclass(stub, object))
+        self.assertFalse(issubclass(stub, SongsMenuPlugin))
+
+    def test_changed(self):
+        manifest = PluginManifest(self.path)
+        manifest.update("some", self.deps, [SomePlugin])
+        self.assertIsNone(manifest.get("some", []))
+        self.assertIsNone(manifest.get("some", [self.dep, self.path]))
+        os.utime(self.dep, (0, 0))
+        self.assertIsNone(manifest.get("some", [self.dep]))
+
+    def test_not_storable(self):
+        manifest = PluginManifest(self.path)
+        manifest.update("other", self.deps, [SomePlugin, OtherPlugin])
+        self.assertIsNone(manifest.get("other", [self.dep]))
+
+    def test_save_load(self):
+        manifest = PluginManifest(self.path)
+        manifest.update("some", self.deps, [SomePlugin])
+        manifest.save()
+        manifest = PluginManifest(self.path)
+        self.assertEqual(len(manifest), 1)
+        self.assertTrue(manifest.get("some", [self.dep]))
+        manifest.prune(["other"])
+        self.assertEqual(len(manifest), 0)
+
+    def test_language_changed(self):
+        manifest = PluginManifest(self.path)
+        manifest.update("some", self.deps, [SomePlugin])
+        manifest.save()
+        old = os.environ.get("LANGUAGE")
+        os.environ["LANGUAGE"] = "xx"
+        try:
+            self.assertEqual(len(PluginManifest(self.path)), 0)
+        finally:
+            if old is None:
+                del os.environ["LANGUAGE"]
+            else:
+                os.environ["LANGUAGE"] = old
+
+    def test_load_broken(self):
+        with open(self.path, "wb") as h:
+            h.write(b"nope")
+        self.assertEqual(len(PluginManifest(self.path)), 0)
+
+
+class TLazyPluginManager(TestCase):
+
+    def setUp(self):
+        config.init()
+        self.dir = mkdtemp()
+        self.plugin_dir = os.path.join(self.dir, "plugins")
+        os.mkdir(self.plugin_dir)
+        self.manifest = os.path.join(self.dir, "manifest")
+        self.pms = []
+
+    def tearDown(self):
+        for pm in self.pms:
+            pm.quit()
+        shutil.rmtree(self.dir)
+        config.quit()
+
+    def create_plugin(self, name):
+        path = os.path.join(self.plugin_dir, name + ".py")
+        with open(path, "w") as h:
+            h.write(PLUGIN_CODE % {"name": name})
+
+    def new_manager(self):
+        pm = PluginManager([self.plugin_dir], self.manifest)
+        self.pms.append(pm)
+        handler = THandler()
+        pm.register_handler(handler)
+        pm.rescan()
+        return pm, handler
+
+    def test_deferred(self):
+        self.create_plugin("LazyFoo")
+        pm, handler = self.new_manager()
+        plugin, = pm.plugins
+        self.assertTrue(plugin.loaded)
+
+        pm, handler = self.new_manager()
+        plugin, = pm.plugins
+        self.assertFalse(plugin.loaded)
+        self.assertEqual(plugin.name, "LazyFoo")
+        self.assertEqual(plugin.handlers, [handler])
+        self.assertIsNone(plugin.get_instance())
+
+        pm.enable(plugin, True)
+        self.assertTrue(plugin.loaded)
+        self.assertTrue(pm.enabled(plugin))
+        self.assertEqual(handler.enabled, [plugin.cls])
+        self.assertEqual(pm.plugins, [plugin])
+
+    def test_enabled_get_imported(self):
+        self.create_plugin("LazyBar")
+        pm, handler = self.new_manager()
+        pm.enable(pm.plugins[0], True)
+        pm.save()
+
+        pm, handler = self.new_manager()
+        plugin, = pm.plugins
+        self.assertTrue(plugin.loaded)
+        self.assertTrue(pm.enabled(plugin))
+        self.assertEqual(handler.enabled, [plugin.cls])
+
+    def test_changed_get_imported(self):
+        self.create_plugin("LazyBaz")
+        self.new_manager()
+        path = os.path.join(self.plugin_dir, "LazyBaz.py")
+        os.utime(path, (0, 0))
+        pm, handler = self.new_manager()
+        self.assertTrue(pm.plugins[0].loaded)
+
+    def test_load(self):
+        self.create_plugin("LazyQux")
+        self.new_manager()
+        pm, handler = self.new_manager()
+        plugin, = pm.plugins
+        self.assertTrue(pm.load(plugin))
+        self.assertTrue(plugin.loaded)
+        self.assertFalse(pm.enabled(plugin))
+        self.assertEqual(handler.enabled, [])
+
+    @skip("Enable for basic benchmarking of the plugin startup")
+    def test_benchmark_startup(self):
+        code = """\
+import os, sys, time
+import quodlibet
+from quodlibet import _main
+from quodlibet.plugins import PluginManager
+quodlibet.init(no_translations=True)
+folders = [os.path.join(_main.get_base_dir(), "ext", kind)
+           for kind in _main.PLUGIN_DIRS]
+t = time.time()
+pm = PluginManager(folders, sys.argv[1] if len(sys.argv) > 1 else None)
+pm.rescan()
+print(time.time() - t)
+"""
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.path.dirname(get_module_dir(quodlibet))
+
+        def run(*args):
+            output = subprocess.check_output(
+                [sys.executable, "-c", code] + list(args), env=env)
+            return float(output.splitlines()[-1])
+
+        print()
+        print("without manifest: %.3fs" % run())
+        print("manifest (cold): %.3fs" % run(self.manifest))
+        print("manifest (warm): %.3fs" % run(self.manifest))
@@ -3,11 +3,14 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
+from unittest.mock import Mock, patch
+
 from tests import TestCase
 
-from quodlibet.formats import DUMMY_SONG
+from quodlibet.formats import DUMMY_SONG, AudioFile, AudioFileError
 from quodlibet.qltk._editutils import FilterCheckButton, \
-    OverwriteWarning, WriteFailedError, FilterPluginBox, EditingPluginHandler
+    OverwriteWarning, WriteFailedError, FilterPluginBox, \
+    EditingPluginHandler, write_songs
 
 
 class FCB(FilterCheckButton):
@@ -67,6 +70,65 @@ class TEditDialogs(TestCase):
 
     def test_write_failed(self):
         WriteFailedError(None, DUMMY_SONG).destroy()
+        WriteFailedError(None, DUMMY_SONG, 3).destroy()
+
+
+class FakeSong(AudioFile):
+
+    fail = False
+    written = False
+
+    def valid(self):
+        return True
+
+    def write_file(self):
+        if self.fail:
+            raise AudioFileError("nope")
+        self.written = True
+
+
+def set_title(song):
+    song["title"] = "new"
+    return True
+
+
+class TWriteSongs(TestCase):
+
+    def setUp(self):
+        self.library = Mock()
+        self.songs = [FakeSong({"~filename": "/%d" % i}) for i in range(20)]
+
+    def test_write(self):
+        changes = [(s, set_title if i % 2 else None)
+                   for i, s in enumerate(self.songs)]
+        self.assertTrue(
+            write_songs(None, self.library, changes, len(changes)))
+        changed = set(self.songs[1::2])
+        self.library.changed.assert_called_once_with(changed)
+        self.assertFalse(self.library.reload.called)
+        for song in self.songs:
+            self.assertEqual(song in changed, song.written)
+            # sanitized after writing
+            self.assertEqual(song in changed, "~#mtime" in song)
+            self.assertEqual(song in changed, "title" in song)
+
+    def test_failed(self):
+        for song in self.songs[:3]:
+            song.fail = True
+        changes = [(s, set_title) for s in self.songs]
+        with patch.object(WriteFailedError, "run") as run:
+            self.assertFalse(
+                write_songs(None, self.library, changes, len(changes)))
+        run.assert_called_once_with()
+        reloaded = {c[0][0] for c in self.library.reload.call_args_list}
+        self.assertEqual(reloaded, set(self.songs[:3]))
+        self.library.changed.assert_called_once_with(set(self.songs[3:]))
+
+    def test_not_all(self):
+        changes = [(s, set_title) for s in self.songs]
+        self.assertFalse(
+            write_songs(None, self.library, changes[:5], len(changes)))
+        self.library.changed.assert_called_once_with(set(self.songs[:5]))
 
 
 class TFilterPluginBox(TestCase):
@@ -180,6 +180,59 @@ class TSongList(TestCase):
 
         self.assertEqual(self.songlist.get_songs(), [song] * 4)
 
+    def test_sort_multiple(self):
+        songs = [AudioFile({"~filename": fsnative(u"/dev/%d" % i),
+                            "artist": a, "title": t})
+                 for i, (a, t) in enumerate(
+                     [("b", "x"), ("a", "y"), ("b", "y"), ("a", "x")])]
+        self.songlist.set_column_headers(["artist", "title"])
+        self.songlist.set_sort_orders([("artist", False), ("title", True)])
+        self.songlist.set_songs(list(songs))
+        # the last sort order is the most significant one
+        self.assertEqual(self.songlist.get_songs(),
+                         [songs[1], songs[2], songs[3], songs[0]])
+
+        song = AudioFile({"~filename": fsnative(u"/dev/new"),
+                          "artist": "a", "title": "xx"})
+        self.songlist.add_songs([song])
+        self.assertEqual(self.songlist.get_songs(),
+                         [songs[1], songs[2], song, songs[3], songs[0]])
+
+    def test_add_songs_sorted(self):
+        songs = [AudioFile({"~filename": fsnative(u"/dev/%d" % i),
+                            "artist": u"%03d" % ((i * 7) % 400)})
+                 for i in range(400)]
+        self.songlist.set_column_headers(["artist"])
+        self.songlist.set_sort_orders([("artist", True)])
+        self.songlist.set_songs(songs[:300])
+
+        def expected(songs):
+            return sorted(songs, key=lambda s: s("artist"), reverse=True)
+
+        # one by one
+        self.songlist.add_songs(songs[300:301])
+        self.assertEqual(self.songlist.get_songs(), expected(songs[:301]))
+
+        # merged in one pass
+        self.songlist.add_songs(songs[301:])
+        self.assertEqual(self.songlist.get_songs(), expected(songs))
+
+    def test_sort_changed(self):
+        songs = [AudioFile({"~filename": fsnative(u"/dev/%d" % i),
+                            "artist": a}) for i, a in enumerate("abc")]
+        for song in songs:
+            song.sanitize()
+        self.lib.add(songs)
+        self.songlist.set_column_headers(["artist"])
+        self.songlist.set_sort_orders([("artist", False)])
+        self.songlist.set_songs(list(songs))
+
+        # the cached sort key has to be updated
+        songs[0]["artist"] = "d"
+        self.lib.changed([songs[0]])
+        self.assertEqual(self.songlist.get_songs(),
+                         [songs[1], songs[2], songs[0]])
+
     def test_remove_songs(self):
         song = AudioFile({"~filename": "/dev/null"})
         song.sanitize()
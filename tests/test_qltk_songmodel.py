@@ -103,6 +103,34 @@ class TPlaylistModel(TestCase):
         self.failUnless(8 in self.pl)
         self.failIf(22 in self.pl)
 
+    def test_find_after_changes(self):
+        self.assertEqual(self.pl[self.pl.find(3)][0], 3)
+        self.pl.append(row=[42])
+        self.pl.insert(0, row=[43])
+        self.pl.insert_many(5, [44, 3])
+        self.assertEqual(self.pl.get_path(self.pl.find(42))[0], 13)
+        self.assertEqual(self.pl.get_path(self.pl.find(43))[0], 0)
+        self.assertEqual(self.pl.get_path(self.pl.find(3))[0], 4)
+        self.assertEqual(len(self.pl.find_all([3])), 2)
+
+        self.pl.reorder(list(reversed(range(len(self.pl)))))
+        self.assertEqual(self.pl.get_path(self.pl.find(43))[0], 13)
+        self.assertEqual(
+            [self.pl[i][0] for i in self.pl.find_all([3, 42])], [42, 3, 3])
+
+        self.pl.remove(self.pl.find(3))
+        self.assertEqual(len(self.pl.find_all([3])), 1)
+        self.assertTrue(44 in self.pl)
+
+        # removing rows by other means works as well
+        Gtk.ListStore.remove(self.pl, self.pl.find(44))
+        self.assertTrue(44 not in self.pl)
+        self.assertEqual(self.pl[self.pl.find(5)][0], 5)
+
+        self.pl.set([1, 2])
+        self.assertTrue(3 not in self.pl)
+        self.assertEqual(self.pl[self.pl.find(2)][0], 2)
+
     def test_removal(self):
         self.pl.go_to(8)
         for i in range(3, 8):
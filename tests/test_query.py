@@ -7,6 +7,7 @@ import time
 
 from quodlibet import config
 from quodlibet.formats import AudioFile
+from quodlibet.library.index import TagIndex
 from quodlibet.plugins import Plugin
 from quodlibet.plugins.query import QueryPlugin, QUERY_HANDLER
 from quodlibet.query import Query, QueryType
@@ -440,6 +441,91 @@ class TQuery(TestCase):
         self.assertEqual(
             q.filter(iter([self.s1, self.s2])), [self.s1, self.s2])
 
+    def test_filter_index(self):
+        songs = [self.s1, self.s2, self.s3, self.s4, self.s5]
+
+        class Songs(list):
+            pass
+
+        indexed = Songs(songs)
+        indexed.tag_index = TagIndex(songs)
+        for text in ["artist='piman'", "artist=/^mu$/", "artist=/^pi/",
+                     "title=/Å/", "title='ÅNGSTRÖM'", "artist=''",
+                     "&(artist=/^pi/, album=/^I/)", "|(artist='mu', t='x')",
+                     "!artist='mu'", "&(artist='mu', #(length > 100))",
+                     "artist=|('mu', /^pim/)", "~people='piman'",
+                     "album=&(/foo/c, /Bar/)", "artist=/^pi/d",
+                     "#(playcount > 10)", "#(playcount != 24)",
+                     "#(track = 12 && length < 300)", "#(date > 2007-01)",
+                     "#(rating = 0.5)", "#(skipcount / 0 > 1)",
+                     "#(added < 30 days)", "#(playcount - 20 >= 4)",
+                     "|(#(tracks = 15), artist='piman')", "angstrom",
+                     "title=angstr", "title=/^angstrom$/d", "ohno",
+                     "artist=/!oh/d", "|(piman, mu)"]:
+            query = Query(text)
+            self.assertEqual(query.filter(indexed), query.filter(songs))
+
+    def test_candidates(self):
+        index = TagIndex([self.s1, self.s2, self.s3])
+        self.assertEqual(
+            Query("artist='mu'").candidates(index), {self.s2, self.s3})
+        self.assertEqual(
+            Query("&(artist='mu', title=/^rock/)").candidates(index),
+            {self.s2})
+        self.assertIsNone(Query("!artist='mu'").candidates(index))
+        self.assertIsNone(Query("artist=/m./").candidates(index))
+        self.assertIsNone(Query("|(artist='mu', title=/m./)")
+                          .candidates(index))
+        self.assertEqual(Query("|(artist='mu', #(length > 1))")
+                         .candidates(index), {self.s1, self.s2, self.s3})
+
+    def test_candidates_diacritics(self):
+        index = TagIndex([self.s2, self.s4, self.s5])
+        self.assertEqual(Query("title=angstrom").candidates(index),
+                         {self.s4})
+        self.assertEqual(Query("title=/^ANGSTR/d").candidates(index),
+                         {self.s4})
+        self.assertIsNone(Query("artist=/!oh/d").candidates(index))
+
+    def test_matches(self):
+        index = TagIndex([self.s1, self.s2, self.s3])
+        self.assertEqual(Query("#(length > 1)").matches(index), {self.s1})
+        self.assertEqual(Query("#(playcount = 0)").matches(index),
+                         {self.s2, self.s3})
+        self.assertEqual(Query("#(skipcount != 13)").matches(index),
+                         {self.s2, self.s3})
+        self.assertEqual(Query("#(bpm != 13)").matches(index), set())
+        self.assertEqual(Query("#(1 < 2)").matches(index),
+                         {self.s1, self.s2, self.s3})
+        self.assertEqual(
+            Query("&(#(length > 1), #(track < 20))").matches(index), set())
+        self.assertIsNone(Query("&(artist='mu', #(length > 1))")
+                          .matches(index))
+
+    def test_plan_cost(self):
+        query = Query("&(~lyrics=foo, #(playcount > 10), artist=x)")
+        self.assertEqual(
+            [type(n).__name__ for n in query._match._plan],
+            ["Tag", "Inter", "Tag"])
+        assert repr(query._match._plan[2]).startswith("<Tag names=['~lyr")
+        assert query.plan.startswith("Inter cost=")
+        self.assertEqual(len(query.plan.splitlines()), 5)
+
+    def test_plan_match_rate(self):
+        query = Query("&(artist=piman, title=/^rock/)")
+        first, second = query._match.res
+        self.assertEqual(query._match._plan, [first, second])
+        songs = [self.s1, self.s2, self.s3, self.s5] * 10
+        self.assertEqual(query.filter(songs), [])
+        self.assertEqual(query._match._plan, [second, first])
+
+        query = Query("|(artist=piman, title=/^rock/)")
+        first, second = query._match.res
+        for i in range(1024):
+            self.assertEqual(query.search(self.s2), True)
+        self.assertEqual(query._match._plan, [second, first])
+        assert second.match_rate > 0.9
+
     def test_match_all(self):
         self.failUnless(Query("").matches_all)
         self.failUnless(Query("    ").matches_all)
@@ -523,6 +609,31 @@ class TQuery(TestCase):
         self.failUnless(Query("#(date > 0004)").search(self.s1))
         self.failUnless(Query("#(date > 0000)").search(self.s1))
 
+    def test_folded_search(self):
+        config.set("browsers", "folded_search", "true")
+        query = Query("angstrom")
+        self.assertTrue(isinstance(query._match, match.Inter))
+        self.assertTrue(query.search(self.s4))
+        self.assertTrue(Query("ÅNGSTRÖM").search(self.s4))
+        self.assertTrue(Query("title=angst").search(self.s4))
+        self.assertFalse(Query("title=angst").search(self.s1))
+        self.assertTrue(Query("rockin’ out").search(self.s2))
+        # not literal, so a regex
+        self.assertTrue(Query("title=/ngstr.m/d").search(self.s4))
+
+        # cached per song until it changes
+        self.assertFalse(Query("foo").search(self.s1))
+        self.s1["title"] = u"Fóo"
+        self.assertTrue(Query("foo").search(self.s1))
+        del self.s1["title"]
+        self.assertFalse(Query("foo").search(self.s1))
+
+        # non-cacheable tags and non songs
+        self.assertTrue(Query("~people=mu").search(self.s2))
+        self.assertTrue(Query("~dirname=oau", []).search(
+            AudioFile({"~filename": fsnative(u"/öäü/x.ogg")})))
+        self.assertTrue(Query("artist=piman").search(dict(artist="Piman")))
+
     def test_ignore_characters(self):
         try:
             config.set("browsers", "ignored_characters", "-")
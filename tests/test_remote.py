@@ -3,6 +3,7 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
+from gi.repository import GLib
 from senf import fsn2bytes, bytes2fsn
 
 from . import TestCase, skipIf
@@ -41,3 +42,15 @@ class TUnixRemote(TestCase):
             self.assertEqual(mock.lines, [bytes2fsn(b"foo", None)])
             with open(fn, "rb") as h:
                 self.assertEqual(h.read(), b"resp")
+
+    def test_response_chunks(self):
+        with temp_filename() as fn:
+            chunks = [bytes2fsn(b, None) for b in [b"a\n", b"", b"b\n"]]
+            mock = Mock(resp=iter(chunks))
+            remote = QuodLibetUnixRemote(None, mock)
+            remote._callback(b"\x00foo\x00" + fsn2bytes(fn, None) + b"\x00")
+            context = GLib.MainContext.default()
+            while context.pending():
+                context.iteration(False)
+            with open(fn, "rb") as h:
+                self.assertEqual(h.read(), b"a\nb\n")
@@ -10,7 +10,7 @@ import unicodedata
 
 from tests import TestCase
 
-from quodlibet.unisearch import compile
+from quodlibet.unisearch import compile, fold
 from quodlibet.unisearch.db import diacritic_for_letters
 from quodlibet.unisearch.parser import re_replace_literals, re_add_variants
 
@@ -184,3 +184,26 @@ class TCompileMatch(TestCase):
 
         with self.assertRaises(ValueError):
             compile(u"(F", asym=True)
+
+
+class TFold(TestCase):
+
+    def test_ascii(self):
+        assert fold(u"Foo Bar") == u"foo bar"
+
+    def test_diacritics(self):
+        assert fold(u"Björk") == u"bjork"
+        assert fold(u"\u212B") == fold(u"A\u030a") == u"a"
+
+    def test_not_decomposable(self):
+        assert fold(u"Łódź") == u"lodz"
+        assert fold(u"Ærø") == u"aero"
+        assert fold(u"Straße") == u"strasse"
+
+    def test_punctuation(self):
+        assert fold(u"Rockin\u2019 \u2013 Out") == u"rockin' - out"
+
+    def test_symmetric(self):
+        for text in [u"föhn", u"Ångström", u"Łódź", u"Æon"]:
+            assert fold(text) in fold(text.upper())
+            assert compile(fold(text), asym=True)(text)
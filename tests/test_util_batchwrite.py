@@ -0,0 +1,109 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+import threading
+
+from quodlibet.formats import AudioFile, AudioFileError
+from quodlibet.util.batchwrite import BatchWriter
+
+from tests import TestCase
+
+
+class FakeSong(AudioFile):
+
+    fail = False
+    block = None
+    started = None
+    written = False
+    sanitized_in = None
+
+    def write_file(self):
+        if self.block is not None:
+            self.started.release()
+            self.block.wait(10)
+        if self.fail:
+            raise AudioFileError("nope")
+        self.written = True
+
+    def sanitize(self, filename=None):
+        self.sanitized_in = threading.current_thread()
+        super().sanitize(filename)
+
+
+class OtherSong(AudioFile):
+
+    def write(self):
+        self["~written"] = "yes"
+
+
+def collect_all(writer):
+    results = []
+    while writer.pending:
+        results.extend(writer.collect(1))
+    return results
+
+
+class TBatchWriter(TestCase):
+
+    def setUp(self):
+        self.writer = BatchWriter(workers=2)
+
+    def tearDown(self):
+        self.writer.shutdown()
+
+    def test_empty(self):
+        self.assertEqual(self.writer.pending, 0)
+        self.assertFalse(self.writer.full)
+        self.assertEqual(self.writer.collect(), [])
+
+    def test_write(self):
+        songs = [FakeSong({"~filename": "/%d" % i}) for i in range(10)]
+        for song in songs:
+            self.writer.submit(song)
+        self.assertTrue(self.writer.full)
+        results = collect_all(self.writer)
+        self.assertEqual({s for s, e in results}, set(songs))
+        self.assertEqual([e for s, e in results], [None] * len(songs))
+        self.assertTrue(all(s.written for s in songs))
+        main = threading.current_thread()
+        self.assertTrue(all(s.sanitized_in is main for s in songs))
+        self.assertFalse(self.writer.full)
+
+    def test_write_override(self):
+        song = OtherSong({"~filename": "/other"})
+        self.writer.submit(song)
+        self.assertEqual(song("~written"), "yes")
+        self.assertEqual(collect_all(self.writer), [(song, None)])
+
+    def test_error(self):
+        good = FakeSong({"~filename": "/good"})
+        bad = FakeSong({"~filename": "/bad"})
+        bad.fail = True
+        self.writer.submit(good)
+        self.writer.submit(bad)
+        results = dict(collect_all(self.writer))
+        self.assertIsNone(results[good])
+        self.assertTrue(isinstance(results[bad], AudioFileError))
+        self.assertIsNone(bad.sanitized_in)
+
+    def test_cancel(self):
+        event = threading.Event()
+        started = threading.Semaphore(0)
+        songs = [FakeSong({"~filename": "/%d" % i}) for i in range(6)]
+        for song in songs:
+            song.block = event
+            song.started = started
+            self.writer.submit(song)
+        # wait until the two workers are busy with the first songs
+        self.assertTrue(started.acquire(timeout=10))
+        self.assertTrue(started.acquire(timeout=10))
+        cancelled = self.writer.cancel()
+        event.set()
+        results = collect_all(self.writer)
+        self.assertEqual(len(cancelled), 4)
+        self.assertEqual(len(results), 2)
+        self.assertEqual(
+            set(cancelled) | {s for s, e in results}, set(songs))
+        self.assertFalse(any(s.written for s in cancelled))
@@ -9,7 +9,7 @@ import os
 import shutil
 from os.path import basename
 
-from gi.repository import Gio
+from gi.repository import Gio, GdkPixbuf
 
 from senf import fsnative
 
@@ -17,6 +17,7 @@ from quodlibet import config
 from quodlibet.ext.covers.artwork_url import ArtworkUrlCover
 from quodlibet.formats import AudioFile
 from quodlibet.plugins import Plugin
+from quodlibet.util.cover.cache import CoverIndex
 from quodlibet.util.cover.http import escape_query_value
 from quodlibet.util.cover.manager import CoverManager
 from quodlibet.util.path import normalize_path, path_equal, mkdir
@@ -40,6 +41,8 @@ class TCoverManager(TestCase):
 
         self.manager = CoverManager()
         self.dir = mkdtemp()
+        self.manager.index = CoverIndex(
+            os.path.join(self.dir, "cache", "cover-index"))
         self.song = self.an_album_song()
 
         # Safety check
@@ -56,6 +59,7 @@ class TCoverManager(TestCase):
         })
 
     def tearDown(self):
+        self.manager.index.save()
         shutil.rmtree(self.dir)
         config.quit()
 
@@ -226,6 +230,21 @@ class TCoverManager(TestCase):
         self.assertTrue(
             self.manager.get_pixbuf_many([self.song], 10, 10) is None)
 
+    def test_get_thumbnail_cached(self):
+        pixbuf = GdkPixbuf.Pixbuf.new(
+            GdkPixbuf.Colorspace.RGB, True, 8, 20, 20)
+        pixbuf.savev(self.full_path("cover.png"), "png", [], [])
+
+        first = self.manager.get_pixbuf(self.song, 10, 10)
+        self.assertTrue(first)
+        self.assertIs(self.manager.get_pixbuf(self.song, 10, 10), first)
+        self.assertIsNot(self.manager.get_pixbuf(self.song, 5, 5), first)
+
+        self.manager.cover_changed([self.song])
+        self.assertEqual(len(self.manager.pixbufs), 0)
+        os.remove(self.full_path("cover.png"))
+        self.assertIsNone(self.manager.get_pixbuf(self.song, 10, 10))
+
     def test_get_many(self):
         songs = [AudioFile({"~filename": os.path.join(self.dir, "song.ogg"),
                             "title": "Ode to Baz"}),
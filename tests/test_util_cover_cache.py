@@ -0,0 +1,176 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+import os
+import shutil
+
+from gi.repository import GdkPixbuf
+
+from quodlibet.formats import AudioFile
+from quodlibet.util.cover.cache import PixbufLRU, CoverIndex, group_id, \
+    get_dependencies
+
+from tests import TestCase, mkdtemp
+
+
+def new_pixbuf(size):
+    return GdkPixbuf.Pixbuf.new(
+        GdkPixbuf.Colorspace.RGB, True, 8, size, size)
+
+
+class TPixbufLRU(TestCase):
+
+    def test_get_put(self):
+        cache = PixbufLRU(1024 * 1024)
+        self.assertIsNone(cache.get("a"))
+        pb = new_pixbuf(10)
+        cache.put("a", pb)
+        self.assertIs(cache.get("a"), pb)
+        cache.put("a", new_pixbuf(10))
+        self.assertIsNot(cache.get("a"), pb)
+        self.assertEqual(len(cache), 1)
+
+    def test_hit_rate(self):
+        cache = PixbufLRU(1024 * 1024)
+        self.assertEqual(cache.hit_rate, 0.0)
+        cache.get("a")
+        cache.put("a", new_pixbuf(10))
+        cache.get("a")
+        cache.get("a")
+        cache.get("b")
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+        self.assertEqual(cache.hit_rate, 0.5)
+
+    def test_evict(self):
+        # room for two 16x16 RGBA pixbufs
+        cache = PixbufLRU(2 * 16 * 16 * 4)
+        cache.put("a", new_pixbuf(16))
+        cache.put("b", new_pixbuf(16))
+        cache.get("a")
+        cache.put("c", new_pixbuf(16))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("c"))
+
+        # always keeps the last one
+        cache.put("d", new_pixbuf(64))
+        self.assertEqual(len(cache), 1)
+        self.assertIsNotNone(cache.get("d"))
+
+    def test_remove_if(self):
+        cache = PixbufLRU(1024 * 1024)
+        cache.put(("a", 1), new_pixbuf(10))
+        cache.put(("b", 1), new_pixbuf(10))
+        cache.remove_if(lambda k: k[0] == "a")
+        self.assertIsNone(cache.get(("a", 1)))
+        self.assertIsNotNone(cache.get(("b", 1)))
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+
+class TCoverIndex(TestCase):
+
+    def setUp(self):
+        self.dir = mkdtemp()
+        # not next to the song, the directory is a dependency
+        os.mkdir(os.path.join(self.dir, "cache"))
+        self.path = os.path.join(self.dir, "cache", "cover-index")
+        self.index = CoverIndex(self.path)
+        self.song = AudioFile(
+            {"~filename": os.path.join(self.dir, "song.ogg")})
+        open(self.song("~filename"), "wb").close()
+        self.cover = os.path.join(self.dir, "cover.png")
+        new_pixbuf(10).savev(self.cover, "png", [], [])
+
+    def tearDown(self):
+        self.index.save()
+        shutil.rmtree(self.dir)
+
+    def test_group_id(self):
+        other = AudioFile({"~filename": os.path.join(self.dir, "other.ogg")})
+        self.assertEqual(group_id([self.song, other]),
+                         group_id([other, self.song]))
+        self.assertNotEqual(group_id([self.song]), group_id([other]))
+
+    def test_store_lookup(self):
+        group = group_id([self.song])
+        self.assertIsNone(self.index.lookup(group, 1))
+        deps = get_dependencies([self.song], self.cover)
+        self.index.store(group, 1, self.cover, deps)
+        self.assertEqual(self.index.lookup(group, 1), (self.cover, False))
+        self.assertIsNone(self.index.lookup(group, 2))
+
+        self.index.store(group, 1, None, deps)
+        self.assertEqual(self.index.lookup(group, 1), (None, False))
+
+    def test_changed_dependency(self):
+        group = group_id([self.song])
+        deps = get_dependencies([self.song], self.cover)
+        self.index.store(group, 1, self.cover, deps)
+        os.utime(self.cover, (0, 0))
+        self.assertIsNone(self.index.lookup(group, 1))
+
+    def test_invalidate(self):
+        group = group_id([self.song])
+        self.index.store(group, 1, None, get_dependencies([self.song]))
+        self.assertEqual(self.index.invalidate([self.cover]), [])
+        self.assertEqual(
+            self.index.invalidate([self.song("~filename")]), [group])
+        self.assertIsNone(self.index.lookup(group, 1))
+
+    def test_embedded(self):
+        group = group_id([self.song])
+        deps = get_dependencies([self.song])
+        path = self.index.store_embedded(group, 1, new_pixbuf(10), deps)
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(self.index.lookup(group, 1), (path, True))
+
+        self.index.invalidate([self.song("~filename")])
+        self.assertFalse(os.path.exists(path))
+
+    def test_save_load(self):
+        group = group_id([self.song])
+        deps = get_dependencies([self.song], self.cover)
+        self.index.store(group, 1, self.cover, deps)
+        self.index.save()
+
+        index = CoverIndex(self.path)
+        self.assertEqual(index.lookup(group, 1), (self.cover, False))
+
+    def test_load_broken(self):
+        with open(self.path, "wb") as h:
+            h.write(b"nope")
+        index = CoverIndex(self.path)
+        self.assertIsNone(index.lookup("foo", 1))
+
+    def test_no_cover_expires(self):
+        group = group_id([self.song])
+        self.index.store(group, 1, None, get_dependencies([self.song]))
+        self.assertEqual(self.index.lookup(group, 1), (None, False))
+        self.index.NO_COVER_MAX_AGE = -1
+        self.assertIsNone(self.index.lookup(group, 1))
+
+    def test_extra_dependencies(self):
+        deps = dict(get_dependencies([self.song], self.dir, self.cover))
+        self.assertIn(self.dir, deps)
+        self.assertIn(self.cover, deps)
+
+    def test_prune_unused(self):
+        group = group_id([self.song])
+        deps = get_dependencies([self.song])
+        path = self.index.store_embedded(group, 1, new_pixbuf(10), deps)
+        orphan = os.path.join(self.index.thumb_dir, "orphan.png")
+        new_pixbuf(10).savev(orphan, "png", [], [])
+        self.index.save()
+
+        index = CoverIndex(self.path)
+        self.assertEqual(index.lookup(group, 1), (path, True))
+        self.assertTrue(os.path.exists(path))
+        self.assertFalse(os.path.exists(orphan))
+
+        index = CoverIndex(self.path)
+        index.MAX_UNUSED_AGE = -1
+        self.assertIsNone(index.lookup(group, 1))
+        self.assertFalse(os.path.exists(path))
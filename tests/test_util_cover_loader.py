@@ -0,0 +1,100 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+import time
+
+from gi.repository import Gio, GLib
+
+from quodlibet.util.cover.loader import CoverLoader
+
+from tests import TestCase
+from tests.helper import capture_output
+
+
+class TCoverLoader(TestCase):
+
+    def setUp(self):
+        self.loader = CoverLoader(workers=1)
+        self.cancel = Gio.Cancellable()
+        self.prepared = []
+        self.results = []
+
+    def submit(self, value, priority=0, cancel=None):
+        def prepare():
+            self.prepared.append(value)
+            return lambda: value * 2
+
+        return self.loader.submit(
+            prepare, self.results.append, cancel or self.cancel,
+            priority=priority, tag=value)
+
+    def run_loop(self, timeout=5):
+        context = GLib.MainContext.default()
+        end = time.time() + timeout
+        while self.loader.queue_depth or self.loader.running:
+            context.iteration(False)
+            self.assertLess(time.time(), end)
+            time.sleep(0.001)
+        while context.pending():
+            context.iteration(False)
+
+    def test_priority(self):
+        for value, priority in [(1, 3), (2, 1), (3, 2), (4, 1)]:
+            self.submit(value, priority)
+        self.assertEqual(self.loader.queue_depth, 4)
+        self.assertEqual(self.loader.max_queue_depth, 4)
+        self.run_loop()
+        self.assertEqual(self.prepared, [2, 4, 3, 1])
+        self.assertEqual(self.results, [4, 8, 6, 2])
+        self.assertEqual(self.loader.completed, 4)
+
+    def test_nothing_to_load(self):
+        self.loader.submit(lambda: None, self.results.append, self.cancel)
+        self.run_loop()
+        self.assertEqual(self.results, [])
+        self.assertEqual(self.loader.completed, 0)
+
+    def test_cancel(self):
+        other = Gio.Cancellable()
+        self.submit(1)
+        self.submit(2, cancel=other)
+        self.cancel.cancel()
+        self.run_loop()
+        self.assertEqual(self.prepared, [2])
+        self.assertEqual(self.results, [4])
+        self.assertEqual(self.loader.dropped, 1)
+
+    def test_reprioritize(self):
+        other = Gio.Cancellable()
+        for value in range(5):
+            self.submit(value, priority=value)
+        self.submit(10, priority=10, cancel=other)
+
+        def get_priority(value):
+            if value == 3:
+                return None
+            return -value
+
+        self.loader.reprioritize(self.cancel, get_priority)
+        self.assertEqual(self.loader.queue_depth, 5)
+        self.assertEqual(self.loader.dropped, 1)
+        self.run_loop()
+        self.assertEqual(self.prepared, [4, 2, 1, 0, 10])
+
+    def test_error(self):
+        def prepare():
+            raise Exception
+
+        def prepare_load():
+            def load():
+                raise Exception
+            return load
+
+        self.loader.submit(prepare, self.results.append, self.cancel)
+        self.loader.submit(prepare_load, self.results.append, self.cancel)
+        self.submit(1)
+        with capture_output():
+            self.run_loop()
+        self.assertEqual(self.results, [2])
@@ -12,7 +12,7 @@ from tests import TestCase, run_gtk_loop
 from gi.repository import Gtk
 
 from quodlibet.util.thread import call_async, call_async_background, \
-    Cancellable, terminate_all
+    Cancellable, terminate_all, cancellable_iter
 
 
 class Tcall_async(TestCase):
@@ -58,3 +58,18 @@ class Tcall_async(TestCase):
 
     def test_terminate_all(self):
         terminate_all()
+
+
+class Tcancellable_iter(TestCase):
+
+    def test_main(self):
+        cancel = Cancellable()
+        self.assertEqual(list(cancellable_iter(range(10), cancel)),
+                         list(range(10)))
+
+        items = []
+        for i in cancellable_iter(range(10), cancel, interval=3):
+            items.append(i)
+            if i == 4:
+                cancel.cancel()
+        self.assertEqual(items, [0, 1, 2, 3, 4, 5])